@@ -1,10 +1,17 @@
 # dashboard_app/admin.py
 
 from django.contrib import admin
-from .models import Product, ProductDailyRecord # Import both models
+from .models import PredictionJob, PredictionRun, Product, ProductDailyRecord
 
 # Register your Product model
 admin.site.register(Product)
 
 # Register your ProductDailyRecord model
 admin.site.register(ProductDailyRecord)
+
+# Register the background job table (read it to follow prediction runs)
+admin.site.register(PredictionJob)
+
+
+# Register the prediction run log (the last successful run is the incremental high-water mark)
+admin.site.register(PredictionRun)
@@ -0,0 +1,326 @@
+# dashboard_app/aggregates.py
+
+from collections import defaultdict
+from datetime import date, timedelta
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+from .models import Product, ProductDailyRecord, ProductSalesAggregate
+
+# Rolling window lengths in days; each has sales_N, inventory_N and days_N columns
+WINDOWS = (7, 28, 90)
+LONGEST_WINDOW = max(WINDOWS)
+
+# Days of daily sales kept in ProductSalesAggregate.recent_sales
+SERIES_DAYS = 7
+
+# Product ids per query (SQLite caps the number of query parameters)
+ID_BATCH_SIZE = 500
+
+# Aggregates rewritten per upsert when rolling windows forward
+PAGE_SIZE = 5000
+
+AGGREGATE_UPDATE_FIELDS = (
+    ['as_of', 'recent_sales', 'updated_at']
+    + [f'{column}_{days}' for days in WINDOWS for column in ('sales', 'inventory', 'days')]
+)
+
+
+def current_as_of(today=None):
+    """Last day covered by the windows: yesterday, the most recent complete day."""
+    return (today or date.today()) - timedelta(days=1)
+
+
+def _upsert(aggregates):
+    ProductSalesAggregate.objects.bulk_create(
+        aggregates,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=AGGREGATE_UPDATE_FIELDS,
+    )
+
+
+def _sync_product_sales(product_ids=None):
+    """
+    Copies sales_7 into Product.sales_last_7_days where it differs, bumping
+    last_updated so incremental prediction runs see the changed input.
+    """
+    products = Product.objects.filter(sales_aggregate__isnull=False).exclude(sales_last_7_days=F('sales_aggregate__sales_7'))
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+    sales_7 = ProductSalesAggregate.objects.filter(product=OuterRef('pk')).values('sales_7')[:1]
+    return products.update(sales_last_7_days=Subquery(sales_7), last_updated=timezone.now())
+
+
+def refresh_products(product_ids, as_of=None):
+    """
+    Recomputes the aggregates of the given products from their own last
+    LONGEST_WINDOW days of records, creating missing aggregate rows. The cost
+    depends on the window length, never on how much history a product has.
+    """
+    as_of = as_of or current_as_of()
+    first_day = as_of - timedelta(days=LONGEST_WINDOW - 1)
+    series_start = as_of - timedelta(days=SERIES_DAYS - 1)
+    sums = {}
+    for days in WINDOWS:
+        in_window = Q(date__gt=as_of - timedelta(days=days))
+        sums[f'sales_{days}'] = Sum('sales_units', filter=in_window, default=0)
+        sums[f'inventory_{days}'] = Sum('inventory_level', filter=in_window, default=0)
+        sums[f'days_{days}'] = Count('id', filter=in_window)
+
+    product_ids = sorted(product_ids)
+    for start in range(0, len(product_ids), ID_BATCH_SIZE):
+        batch = product_ids[start:start + ID_BATCH_SIZE]
+        records = ProductDailyRecord.objects.filter(product_id__in=batch, date__range=(first_day, as_of)).order_by()
+        totals = {row.pop('product_id'): row for row in records.values('product_id').annotate(**sums)}
+        series = {product_id: [0] * SERIES_DAYS for product_id in batch}
+        for product_id, record_date, sales_units in records.filter(date__gte=series_start).values_list('product_id', 'date', 'sales_units'):
+            series[product_id][(record_date - series_start).days] = sales_units
+
+        _upsert([
+            ProductSalesAggregate(product_id=product_id, as_of=as_of, recent_sales=series[product_id], **totals.get(product_id, {}))
+            for product_id in batch
+        ])
+        _sync_product_sales(batch)
+
+
+def refresh_for_date_ranges(date_ranges, today=None):
+    """
+    Set-based refresh for bulk loads: recomputes, once, the aggregates of the
+    products whose loaded records overlap the windows, and creates the
+    missing ones. Loaders call it after their last chunk instead of updating
+    the aggregates chunk by chunk.
+
+    Args:
+        date_ranges (dict): product_id -> (first date, last date) of the records written.
+    """
+    as_of = current_as_of(today)
+    first_day = as_of - timedelta(days=LONGEST_WINDOW - 1)
+    in_window = set()
+    outside = set()
+    for product_id, (first, last) in date_ranges.items():
+        if first <= as_of and last >= first_day:
+            in_window.add(product_id)
+        else:
+            outside.add(product_id)
+
+    # Records after as_of (e.g. today's) are picked up when the windows roll
+    # forward, which only needs the product to have an aggregate row by then
+    in_window.update(_without_aggregate(outside))
+    if in_window:
+        refresh_products(in_window, as_of)
+
+
+def refresh_for_records(keys, today=None):
+    """
+    `refresh_for_date_ranges` for the (product_id, date) of every record written.
+    """
+    date_ranges = {}
+    for product_id, record_date in keys:
+        first, last = date_ranges.get(product_id, (record_date, record_date))
+        date_ranges[product_id] = (min(first, record_date), max(last, record_date))
+    refresh_for_date_ranges(date_ranges, today)
+
+
+def _without_aggregate(product_ids):
+    """The given products that have no aggregate row yet."""
+    product_ids = sorted(product_ids)
+    missing = []
+    for start in range(0, len(product_ids), ID_BATCH_SIZE):
+        batch = product_ids[start:start + ID_BATCH_SIZE]
+        existing = set(ProductSalesAggregate.objects.filter(product_id__in=batch).values_list('product_id', flat=True))
+        missing.extend(product_id for product_id in batch if product_id not in existing)
+    return missing
+
+
+def read_window_records(keys, today=None):
+    """
+    Current values of the daily records about to be written that can count
+    in a window (dated up to as_of; later ones never do). Read them before
+    the write, in the same transaction, for `apply_record_changes`.
+
+    Args:
+        keys (iterable): (product_id, date) of every record to be written.
+
+    Returns:
+        dict: (product_id, date) -> (sales_units, inventory_level) of the records that exist.
+    """
+    as_of = current_as_of(today)
+    product_ids_by_date = defaultdict(set)
+    for product_id, record_date in keys:
+        if record_date <= as_of:
+            product_ids_by_date[record_date].add(product_id)
+
+    previous = {}
+    for record_date, product_ids in product_ids_by_date.items():
+        product_ids = sorted(product_ids)
+        for start in range(0, len(product_ids), ID_BATCH_SIZE):
+            rows = (
+                ProductDailyRecord.objects.select_for_update()
+                .filter(date=record_date, product_id__in=product_ids[start:start + ID_BATCH_SIZE])
+                .values_list('product_id', 'sales_units', 'inventory_level')
+            )
+            for product_id, sales_units, inventory_level in rows:
+                previous[(product_id, record_date)] = (sales_units, inventory_level)
+    return previous
+
+
+def _apply_changes(aggregate, changes):
+    """
+    Adds (new - old) of each changed record to the windows of `aggregate`
+    that contain it. Records after the aggregate's as_of are left for the
+    roll forward. Returns whether the aggregate changed.
+    """
+    series_start = aggregate.as_of - timedelta(days=SERIES_DAYS - 1)
+    series = list(aggregate.recent_sales or [0] * SERIES_DAYS)
+    changed = False
+    for record_date, old, new in changes:
+        if record_date > aggregate.as_of:
+            continue
+        old_sales, old_inventory = old or (0, 0)
+        new_sales, new_inventory = new
+        for days in WINDOWS:
+            if record_date > aggregate.as_of - timedelta(days=days):
+                setattr(aggregate, f'sales_{days}', getattr(aggregate, f'sales_{days}') + new_sales - old_sales)
+                setattr(aggregate, f'inventory_{days}', getattr(aggregate, f'inventory_{days}') + new_inventory - old_inventory)
+                if old is None:
+                    setattr(aggregate, f'days_{days}', getattr(aggregate, f'days_{days}') + 1)
+                changed = True
+        if record_date >= series_start:
+            series[(record_date - series_start).days] = new_sales
+    aggregate.recent_sales = series
+    return changed
+
+
+def apply_record_changes(rows, previous, today=None):
+    """
+    Keeps aggregates current after daily records were written: the
+    difference between each written record and its previous value is added
+    to the windows it falls in, so the cost depends on the rows written, not
+    on the window lengths. Products without an aggregate get one computed
+    from their records. Call it in the same transaction as the write.
+
+    Args:
+        rows (iterable): (product_id, date, sales_units, inventory_level) of
+                         every record written; for a repeated key the last wins.
+        previous (dict): `read_window_records` of the same keys, read before the write.
+    """
+    as_of = current_as_of(today)
+    product_ids = set()
+    written = {}
+    for product_id, record_date, sales_units, inventory_level in rows:
+        product_ids.add(product_id)
+        if record_date <= as_of:
+            written[(product_id, record_date)] = (sales_units, inventory_level)
+
+    changes = defaultdict(list)
+    for (product_id, record_date), new in written.items():
+        old = previous.get((product_id, record_date))
+        if new != old:
+            changes[product_id].append((record_date, old, new))
+
+    missing = set(_without_aggregate(product_ids))
+    changed_ids = sorted(set(changes) - missing)
+    for start in range(0, len(changed_ids), ID_BATCH_SIZE):
+        batch = changed_ids[start:start + ID_BATCH_SIZE]
+        aggregates = ProductSalesAggregate.objects.select_for_update().filter(product_id__in=batch).order_by('product_id')
+        changed = [aggregate for aggregate in aggregates if _apply_changes(aggregate, changes[aggregate.product_id])]
+        for aggregate in changed:
+            aggregate.updated_at = timezone.now()
+        if changed:
+            _upsert(changed)
+            _sync_product_sales([aggregate.product_id for aggregate in changed])
+    if missing:
+        refresh_products(missing, as_of)
+
+
+def _window_deltas(old, new):
+    """
+    Changes to every window when moving it from ending at `old` to ending at
+    `new`, read from the records of the days that leave or enter a window.
+
+    Returns:
+        dict: product_id -> {column: delta}.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    records = ProductDailyRecord.objects.filter(product__sales_aggregate__as_of=old).order_by()
+    for days in WINDOWS:
+        window = timedelta(days=days)
+        leaving = (old - window, min(old, new - window))
+        entering = (max(old, new - window), new)
+        for (after, until), sign in ((leaving, -1), (entering, 1)):
+            if after >= until:
+                continue
+            rows = (
+                records.filter(date__gt=after, date__lte=until)
+                .values('product_id')
+                .annotate(sales=Sum('sales_units'), inventory=Sum('inventory_level'), recorded=Count('id'))
+                .values_list('product_id', 'sales', 'inventory', 'recorded')
+            )
+            for product_id, sales, inventory, recorded in rows:
+                delta = deltas[product_id]
+                delta[f'sales_{days}'] += sign * sales
+                delta[f'inventory_{days}'] += sign * inventory
+                delta[f'days_{days}'] += sign * recorded
+    return deltas
+
+
+def advance_aggregates(today=None):
+    """
+    Rolls every aggregate whose windows end before the current as_of forward.
+    Only the records of the days leaving and entering each window are read,
+    so a daily roll costs a few days of records, not the whole history.
+    Aggregates more than LONGEST_WINDOW days behind are recomputed instead.
+
+    Returns:
+        int: Number of aggregates moved forward.
+    """
+    as_of = current_as_of(today)
+    moved = 0
+    stale = ProductSalesAggregate.objects.filter(as_of__lt=as_of).order_by().values_list('as_of', flat=True).distinct()
+    for old in sorted(stale):
+        aggregates = ProductSalesAggregate.objects.filter(as_of=old).order_by('product_id')
+        shift = (as_of - old).days
+        if shift >= LONGEST_WINDOW:
+            product_ids = list(aggregates.values_list('product_id', flat=True))
+            refresh_products(product_ids, as_of)
+            moved += len(product_ids)
+            continue
+
+        deltas = _window_deltas(old, as_of)
+        entering = defaultdict(dict)
+        series_after = max(old, as_of - timedelta(days=SERIES_DAYS))
+        rows = (
+            ProductDailyRecord.objects.filter(product__sales_aggregate__as_of=old, date__gt=series_after, date__lte=as_of)
+            .order_by().values_list('product_id', 'date', 'sales_units')
+        )
+        for product_id, record_date, sales_units in rows:
+            entering[product_id][record_date] = sales_units
+        series_start = as_of - timedelta(days=SERIES_DAYS - 1)
+
+        # Pages are taken from the front: rows already moved no longer match as_of=old
+        while True:
+            page = list(aggregates[:PAGE_SIZE])
+            if not page:
+                break
+            for aggregate in page:
+                for column, delta in deltas.get(aggregate.product_id, {}).items():
+                    setattr(aggregate, column, getattr(aggregate, column) + delta)
+                kept = (aggregate.recent_sales or [0] * SERIES_DAYS)[shift:] if shift < SERIES_DAYS else []
+                new_days = entering.get(aggregate.product_id, {})
+                aggregate.recent_sales = kept + [
+                    new_days.get(series_start + timedelta(days=i), 0) for i in range(len(kept), SERIES_DAYS)
+                ]
+                aggregate.as_of = as_of
+                aggregate.updated_at = timezone.now()
+            _upsert(page)
+            for start in range(0, len(page), ID_BATCH_SIZE):
+                _sync_product_sales([aggregate.product_id for aggregate in page[start:start + ID_BATCH_SIZE]])
+            moved += len(page)
+    return moved
+
+
+def rebuild_aggregates(today=None):
+    """Recomputes the aggregates of every product that has daily records."""
+    product_ids = list(ProductDailyRecord.objects.order_by().values_list('product_id', flat=True).distinct())
+    refresh_products(product_ids, current_as_of(today))
+    return len(product_ids)
@@ -0,0 +1,452 @@
+# dashboard_app/bulk_ops.py
+
+import time
+from decimal import Decimal, InvalidOperation
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import Product, ProductDailyRecord, PredictionState
+from .aggregates import apply_record_changes, read_window_records
+from .ml_logic.ml_model_service import cents_to_decimal
+
+# Backends that allow one writing connection at a time. There, prediction
+# shards are written by the parent process only, and `persist_predictions`
+# pauses between chunks so other writers get a turn
+SINGLE_WRITER_VENDORS = ('sqlite',)
+
+DAILY_RECORD_UPDATE_FIELDS = ['sales_units', 'inventory_level', 'price_at_day_end', 'recorded_at']
+
+# Product fields a bulk product update writes
+PRODUCT_UPDATE_FIELDS = ['current_price', 'inventory', 'last_updated']
+
+# Product fields a prediction run writes
+PREDICTION_UPDATE_FIELDS = ['demand_forecast', 'suggested_price', 'last_updated']
+
+# Largest number of items accepted by one bulk product update
+MAX_BULK_UPDATE_ITEMS = 50000
+
+# Product ids per lookup query (SQLite caps the number of query parameters)
+ID_BATCH_SIZE = 500
+
+CENT = Decimal('0.01')
+# Product.current_price has max_digits=10, decimal_places=2
+MAX_PRICE = Decimal('100000000')
+# Largest value of the IntegerField counts (inventory, sales units) on every backend
+MAX_INTEGER = 2**31 - 1
+
+PREDICTION_STATE_FIELDS = ['sales_last_7_days', 'current_price', 'competitor_price', 'margin', 'model_version', 'predicted_at']
+
+
+def upsert_daily_records(records, batch_size=None):
+    """
+    Inserts ProductDailyRecord objects, overwriting any existing record for
+    the same (product, date) instead of failing on the unique constraint,
+    and updates the rolling sales aggregates of the products concerned.
+    """
+    previous = read_window_records((record.product_id, record.date) for record in records)
+    records = ProductDailyRecord.objects.bulk_create(
+        records,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['product', 'date'],
+        update_fields=DAILY_RECORD_UPDATE_FIELDS,
+    )
+    apply_record_changes(
+        ((record.product_id, record.date, record.sales_units, record.inventory_level) for record in records), previous,
+    )
+    return records
+
+
+# Backends that support INSERT ... ON CONFLICT (...) DO UPDATE ... excluded.<column>
+ON_CONFLICT_VENDORS = ('sqlite', 'postgresql')
+
+DAILY_RECORD_ROW_FIELDS = ['product', 'date', 'sales_units', 'inventory_level', 'price_at_day_end', 'recorded_at']
+
+
+def upsert_daily_record_rows(rows, ignore_conflicts=False, update_aggregates=True):
+    """
+    Fast path of `upsert_daily_records` for large loads, taking plain
+    (product_id, date, sales_units, inventory_level, price_at_day_end) tuples.
+    Runs one executemany of INSERT ... ON CONFLICT DO UPDATE, skipping model
+    instances, which otherwise cost more than the SQL itself. Falls back to
+    the ORM on backends without that syntax. Like `upsert_daily_records`,
+    updates the rolling sales aggregates of the products concerned.
+
+    Args:
+        rows (list): Tuples as above.
+        ignore_conflicts (bool): Keep existing records (ON CONFLICT DO NOTHING)
+                                 instead of overwriting them.
+        update_aggregates (bool): Set to False when loading in chunks and calling
+                                  `refresh_for_date_ranges` once at the end.
+
+    Returns:
+        int: Number of rows written (with ignore_conflicts, the number of rows given).
+    """
+    if not rows:
+        return 0
+    previous = read_window_records((row[0], row[1]) for row in rows) if update_aggregates else None
+    if connection.vendor not in ON_CONFLICT_VENDORS:
+        records = [
+            ProductDailyRecord(
+                product_id=product_id, date=record_date, sales_units=sales_units,
+                inventory_level=inventory_level, price_at_day_end=price,
+            )
+            for product_id, record_date, sales_units, inventory_level, price in rows
+        ]
+        if ignore_conflicts:
+            ProductDailyRecord.objects.bulk_create(records, ignore_conflicts=True)
+        else:
+            ProductDailyRecord.objects.bulk_create(
+                records, update_conflicts=True, unique_fields=['product', 'date'], update_fields=DAILY_RECORD_UPDATE_FIELDS,
+            )
+        if update_aggregates:
+            _apply_row_changes(rows, previous, ignore_conflicts)
+        return len(rows)
+
+    meta = ProductDailyRecord._meta
+    fields = [meta.get_field(name) for name in DAILY_RECORD_ROW_FIELDS]
+    date_field, price_field, recorded_field = fields[1], fields[4], fields[5]
+    quote = connection.ops.quote_name
+    columns = [quote(field.column) for field in fields]
+    update_columns = [quote(meta.get_field(name).column) for name in DAILY_RECORD_UPDATE_FIELDS]
+    sql = (
+        f'INSERT INTO {quote(meta.db_table)} ({", ".join(columns)}) '
+        f'VALUES ({", ".join(["%s"] * len(columns))}) '
+        f'ON CONFLICT ({columns[0]}, {columns[1]}) '
+    )
+    if ignore_conflicts:
+        sql += 'DO NOTHING'
+    else:
+        sql += 'DO UPDATE SET ' + ', '.join(f'{column} = excluded.{column}' for column in update_columns)
+    recorded_at = recorded_field.get_db_prep_save(timezone.now(), connection)
+    params = [
+        (
+            product_id,
+            date_field.get_db_prep_save(record_date, connection),
+            sales_units,
+            inventory_level,
+            price_field.get_db_prep_save(price, connection),
+            recorded_at,
+        )
+        for product_id, record_date, sales_units, inventory_level, price in rows
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+    if update_aggregates:
+        _apply_row_changes(rows, previous, ignore_conflicts)
+    return len(rows)
+
+
+def _apply_row_changes(rows, previous, ignore_conflicts):
+    if ignore_conflicts:
+        # Existing records were left as they were, and of a repeated new key only the first row was inserted
+        inserted = {}
+        for row in rows:
+            if (row[0], row[1]) not in previous:
+                inserted.setdefault((row[0], row[1]), row)
+        rows = inserted.values()
+    apply_record_changes(
+        ((product_id, record_date, sales_units, inventory_level) for product_id, record_date, sales_units, inventory_level, _ in rows),
+        previous,
+    )
+
+
+def upsert_products(products, fields, batch_size=None):
+    """
+    Writes `fields` of existing products with INSERT ... ON CONFLICT DO UPDATE.
+    Several times faster than `bulk_update`, whose CASE WHEN statements grow
+    with the batch, but the INSERT needs every column, so `products` must be
+    complete instances loaded from the database.
+    """
+    return Product.objects.bulk_create(
+        products,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['id'],
+        update_fields=fields,
+    )
+
+
+def products_by_id(product_ids):
+    """
+    Complete Product instances for `product_ids`, as {id: product}, in batches
+    of ID_BATCH_SIZE. The rows are locked (SELECT ... FOR UPDATE, in id order)
+    until the caller's transaction ends, so writing them back with
+    `upsert_products` cannot undo a concurrent edit or re-insert a product
+    deleted in between. SQLite has no row locks; there the IMMEDIATE
+    transactions set in settings.DATABASES take the database write lock
+    before the read.
+    """
+    product_ids = list(product_ids)
+    products = {}
+    for start in range(0, len(product_ids), ID_BATCH_SIZE):
+        products.update(Product.objects.select_for_update().order_by('pk').in_bulk(product_ids[start:start + ID_BATCH_SIZE]))
+    return products
+
+
+def upsert_prediction_states(states, batch_size=None):
+    """Inserts or overwrites the PredictionState of each product in `states`."""
+    return PredictionState.objects.bulk_create(
+        states,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=PREDICTION_STATE_FIELDS,
+    )
+
+
+def simulate_daily_sales(sales_last_7_days, rng, low=0.8, high=1.2):
+    """
+    Vectorized version of the per-product daily sales simulation:
+    a day's share of the 7-day sales, with some noise, never below zero.
+    """
+    sales_last_7_days = np.asarray(sales_last_7_days, dtype=np.float64)
+    simulated = np.rint(sales_last_7_days / 7 * rng.uniform(low, high, len(sales_last_7_days)))
+    return np.maximum(simulated, 0).astype(np.int64)
+
+
+def persist_predictions(catalog, batch, record_date, chunk_size=None, rng=None, on_chunk=None, model_version=''):
+    """
+    Writes a `predict_batch` result back to the database.
+    Writes demand_forecast/suggested_price with `upsert_products` and upserts the
+    daily record for `record_date` with `bulk_create(update_conflicts=True)`,
+    one transaction per chunk of `chunk_size` products. Products deleted
+    since the catalog was fetched are skipped. Each product's
+    PredictionState is saved in the same transaction, so incremental runs know
+    which inputs and model version its prediction came from.
+
+    Every chunk holds the database's write lock on SQLite, where other
+    writers (e.g. API updates) wait for it. Chunks are kept small, and the
+    writer pauses between them (settings.PREDICTION_WRITE_PAUSE): a waiting
+    writer only retries the lock every few tens of milliseconds and would
+    otherwise miss the moment between two chunks.
+
+    Args:
+        catalog (dict of numpy.ndarray): The catalog the predictions were made for.
+                                         Needs 'id', 'sales_last_7_days', 'current_price',
+                                         'competitor_price', 'margin' and 'inventory' columns.
+        batch (dict of numpy.ndarray): Output of `predict_batch`, aligned with `catalog`.
+        record_date (datetime.date): Date of the daily record to log.
+        chunk_size (int, optional): Number of products per transaction
+                                    (default: settings.PREDICTION_WRITE_CHUNK_SIZE).
+        rng (numpy.random.Generator, optional): Source of the simulated daily sales.
+        on_chunk (callable, optional): Called after each committed chunk with the
+                                       running totals (products_updated, records_written).
+        model_version (str): Version of the model that made the predictions.
+
+    Returns:
+        dict: Counts of products updated and records written, elapsed seconds
+              and rows written per second.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    chunk_size = chunk_size or settings.PREDICTION_WRITE_CHUNK_SIZE
+    pause = settings.PREDICTION_WRITE_PAUSE if connection.vendor in SINGLE_WRITER_VENDORS else 0
+
+    started = time.perf_counter()
+    now = timezone.now()
+    daily_sales = simulate_daily_sales(catalog['sales_last_7_days'], rng)
+    current_price_cents = np.rint(np.asarray(catalog['current_price'], dtype=np.float64) * 100)
+    competitor_price_cents = np.rint(np.asarray(catalog['competitor_price'], dtype=np.float64) * 100)
+    margin_hundredths = np.rint(np.asarray(catalog['margin'], dtype=np.float64) * 100)
+
+    products_updated = 0
+    records_written = 0
+    total = len(batch['id'])
+    for start in range(0, total, chunk_size):
+        stop = min(start + chunk_size, total)
+        # Built before the transaction, which holds the write lock on SQLite
+        records = {}
+        states = {}
+        for i in range(start, stop):
+            product_id = batch['id'][i]
+            records[product_id] = ProductDailyRecord(
+                product_id=product_id,
+                date=record_date,
+                sales_units=int(daily_sales[i]),
+                inventory_level=int(catalog['inventory'][i]),
+                price_at_day_end=cents_to_decimal(current_price_cents[i]),
+            )
+            states[product_id] = PredictionState(
+                product_id=product_id,
+                sales_last_7_days=int(catalog['sales_last_7_days'][i]),
+                current_price=cents_to_decimal(current_price_cents[i]),
+                competitor_price=cents_to_decimal(competitor_price_cents[i]),
+                margin=cents_to_decimal(margin_hundredths[i]),
+                model_version=model_version,
+            )
+
+        with transaction.atomic():
+            # upsert_products inserts complete rows, so the products are read
+            # first, and locked until the chunk commits
+            current = products_by_id(batch['id'][start:stop])
+            products = []
+            for i in range(start, stop):
+                product = current.get(batch['id'][i])
+                if product is None:
+                    continue
+                product.demand_forecast = int(batch['new_demand_forecast'][i])
+                product.suggested_price = cents_to_decimal(batch['new_suggested_price_cents'][i])
+                product.last_updated = now
+                products.append(product)
+
+            products_updated += len(upsert_products(products, PREDICTION_UPDATE_FIELDS))
+            records_written += len(upsert_daily_records([records[product.id] for product in products]))
+            # Stamped after the daily records, so they don't count as new history next run
+            predicted_at = timezone.now()
+            states = [states[product.id] for product in products]
+            for state in states:
+                state.predicted_at = predicted_at
+            upsert_prediction_states(states)
+        if on_chunk is not None:
+            on_chunk(products_updated, records_written)
+        if pause and stop < total:
+            time.sleep(pause)
+
+    elapsed = time.perf_counter() - started
+    rows_written = products_updated + records_written
+    return {
+        'products_updated': products_updated,
+        'records_written': records_written,
+        'elapsed': elapsed,
+        'rows_per_second': rows_written / elapsed if elapsed > 0 else float(rows_written),
+    }
+
+
+def parse_product_update(item):
+    """
+    Validates one item of a bulk product update.
+
+    Args:
+        item (dict): {'id': ..., 'currentPrice': ..., 'inventory': ...}; at least
+                     one of 'currentPrice' and 'inventory' must be present.
+
+    Returns:
+        dict: 'id', 'current_price' (Decimal or None) and 'inventory' (int or None).
+
+    Raises:
+        ValueError: With a message describing what is wrong with the item.
+    """
+    if not isinstance(item, dict):
+        raise ValueError('Item must be a JSON object.')
+    product_id = item.get('id')
+    if isinstance(product_id, int) and not isinstance(product_id, bool):
+        product_id = str(product_id)
+    if not isinstance(product_id, str) or not product_id:
+        raise ValueError("Missing product 'id'.")
+    if 'currentPrice' not in item and 'inventory' not in item:
+        raise ValueError("Nothing to update: expected 'currentPrice' and/or 'inventory'.")
+
+    update = {'id': product_id, 'current_price': None, 'inventory': None}
+    if 'currentPrice' in item:
+        value = item['currentPrice']
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError('currentPrice must be a number.')
+        try:
+            price = Decimal(str(value))
+        except InvalidOperation:
+            raise ValueError('currentPrice must be a number.')
+        if not price.is_finite() or price < 0 or price >= MAX_PRICE:
+            raise ValueError(f'currentPrice must be between 0 and {MAX_PRICE}.')
+        if price != price.quantize(CENT):
+            raise ValueError('currentPrice must have at most 2 decimal places.')
+        update['current_price'] = price.quantize(CENT)
+    if 'inventory' in item:
+        value = item['inventory']
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise ValueError('inventory must be a whole number.')
+        try:
+            inventory = int(value)
+        except (TypeError, ValueError):
+            raise ValueError('inventory must be a whole number.')
+        if inventory < 0:
+            raise ValueError('inventory cannot be negative.')
+        if inventory > MAX_INTEGER:
+            raise ValueError(f'inventory cannot exceed {MAX_INTEGER}.')
+        update['inventory'] = inventory
+    return update
+
+
+def apply_product_updates(items, record_date, rng=None, partial=False):
+    """
+    Applies many price/inventory changes at once: validates every item, then
+    writes the products and upserts their daily records for `record_date` in
+    a single transaction.
+
+    Args:
+        items (list): Raw update items, see `parse_product_update`.
+        record_date (datetime.date): Date of the daily records to log.
+        rng (numpy.random.Generator, optional): Source of the simulated daily sales.
+        partial (bool): Apply the valid items even if others failed. By default
+                        nothing is written unless every item is valid.
+
+    Returns:
+        list of dict: One result per item, in input order, each with 'index',
+                      'id' and 'status' ('success', 'error', or 'skipped' for valid
+                      items left unwritten because others failed); errors and
+                      skipped items carry a 'message', successes the updated 'product'.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    results = [None] * len(items)
+    updates = []
+    seen = set()
+    for index, item in enumerate(items):
+        try:
+            update = parse_product_update(item)
+            if update['id'] in seen:
+                raise ValueError('Duplicate product id in this request.')
+        except ValueError as e:
+            item_id = item.get('id') if isinstance(item, dict) else None
+            results[index] = {'index': index, 'id': item_id, 'status': 'error', 'message': str(e)}
+            continue
+        seen.add(update['id'])
+        updates.append((index, update))
+
+    with transaction.atomic():
+        products = products_by_id(update['id'] for _, update in updates)
+
+        found = []
+        for index, update in updates:
+            if update['id'] in products:
+                found.append((index, update))
+            else:
+                results[index] = {'index': index, 'id': update['id'], 'status': 'error', 'message': 'Product not found.'}
+        if len(found) < len(items) and not partial:
+            for index, update in found:
+                results[index] = {
+                    'index': index, 'id': update['id'], 'status': 'skipped',
+                    'message': 'Not applied because other items are invalid.',
+                }
+            return results
+
+        now = timezone.now()
+        changed = []
+        for index, update in found:
+            product = products[update['id']]
+            if update['current_price'] is not None:
+                product.current_price = update['current_price']
+            if update['inventory'] is not None:
+                product.inventory = update['inventory']
+            product.last_updated = now  # bulk writes bypass auto_now
+            changed.append(product)
+
+        daily_sales = simulate_daily_sales([product.sales_last_7_days for product in changed], rng)
+        records = [
+            ProductDailyRecord(
+                product_id=product.id,
+                date=record_date,
+                sales_units=int(sales),
+                inventory_level=product.inventory,
+                price_at_day_end=product.current_price,
+            )
+            for product, sales in zip(changed, daily_sales)
+        ]
+        upsert_products(changed, PRODUCT_UPDATE_FIELDS)
+        upsert_daily_records(records)
+
+    for (index, update), product in zip(found, changed):
+        results[index] = {'index': index, 'id': product.id, 'status': 'success', 'product': product}
+    return results
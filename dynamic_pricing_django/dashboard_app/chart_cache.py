@@ -0,0 +1,92 @@
+# dashboard_app/chart_cache.py
+
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.core.cache import caches
+
+# Cache alias (see settings.CACHES) holding rendered chart bytes and history versions.
+# It must be shared between processes so the prediction command can invalidate
+# charts cached by the web workers.
+CHART_CACHE_ALIAS = 'charts'
+
+# Key for the version that invalidates every product's charts at once
+GLOBAL_VERSION_KEY = 'chart-version:*'
+
+# Invalidating more products than this bumps the global version instead: one
+# cache write rather than one per product (each is a file with FileBasedCache)
+MAX_PER_PRODUCT_INVALIDATIONS = 100
+
+
+def _cache():
+    return caches[CHART_CACHE_ALIAS]
+
+
+def _version_key(product_id):
+    return f'chart-version:{product_id}'
+
+
+def _get_or_init_version(key):
+    cache = _cache()
+    version = cache.get(key)
+    if version is None:
+        # A missing version (never written or evicted) starts fresh, so stale
+        # chart entries from before the eviction can never be served.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_history_version(product_id):
+    """
+    Returns the history version of a product's charts as a pair of
+    nanosecond timestamps: (global version, product version).
+    """
+    return _get_or_init_version(GLOBAL_VERSION_KEY), _get_or_init_version(_version_key(product_id))
+
+
+def invalidate_charts(product_ids=None):
+    """
+    Bumps the history version so previously rendered charts are no longer used.
+    With `product_ids=None`, or more than MAX_PER_PRODUCT_INVALIDATIONS ids,
+    every product's charts are invalidated at once.
+    """
+    now = time.time_ns()
+    if product_ids is None or len(product_ids) > MAX_PER_PRODUCT_INVALIDATIONS:
+        _cache().set(GLOBAL_VERSION_KEY, now, timeout=None)
+    else:
+        _cache().set_many({_version_key(product_id): now for product_id in product_ids}, timeout=None)
+
+
+def _chart_key(product_id, chart_type, version, variant=''):
+    return f'chart:{product_id}:{chart_type}:{variant}:{version[0]}:{version[1]}'
+
+
+def chart_etag(product_id, chart_type, variant=''):
+    """
+    ETag of a chart, derived from its history version without rendering it.
+    `variant` tells apart renderings of the same chart, e.g. different date ranges.
+    """
+    version = get_history_version(product_id)
+    return hashlib.sha1(_chart_key(product_id, chart_type, version, variant).encode()).hexdigest()
+
+
+def chart_last_modified(product_id):
+    """Time of the last write that invalidated this product's charts."""
+    return datetime.fromtimestamp(max(get_history_version(product_id)) / 1e9, tz=dt_timezone.utc)
+
+
+def get_cached_chart(product_id, chart_type, version, variant=''):
+    """
+    Returns the cached PNG bytes of a chart for the given history version,
+    b'' if the product had too little history to plot, or None on a miss.
+    """
+    return _cache().get(_chart_key(product_id, chart_type, version, variant))
+
+
+def set_cached_chart(product_id, chart_type, version, png_bytes, variant=''):
+    """
+    Stores a rendered chart under the history version read *before* rendering,
+    so a write that lands mid-render is never masked by the stale image.
+    """
+    _cache().set(_chart_key(product_id, chart_type, version, variant), png_bytes)
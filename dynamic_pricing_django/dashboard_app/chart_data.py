@@ -0,0 +1,205 @@
+# dashboard_app/chart_data.py
+
+from datetime import date
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import TruncMonth, TruncWeek
+from .models import ProductDailyRecord
+
+# Chart resolutions; 'auto' picks the finest one that fits MAX_CHART_POINTS
+CHART_RESOLUTIONS = ('auto', 'day', 'week', 'month')
+
+# Most points plotted per chart before 'auto' switches to coarser buckets
+MAX_CHART_POINTS = 400
+
+# Database functions grouping daily records into buckets, labelled by the bucket's first day
+BUCKET_FUNCTIONS = {
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# Daily record column plotted by each chart type
+CHART_VALUE_FIELDS = {
+    'sales': 'sales_units',
+    'price': 'price_at_day_end',
+    'inventory': 'inventory_level',
+}
+
+# Value columns of /api/history/, with their JSON keys
+HISTORY_JSON_KEYS = {
+    'sales_units': 'sales',
+    'price_at_day_end': 'price',
+    'inventory_level': 'inventory',
+}
+HISTORY_VALUE_FIELDS = tuple(HISTORY_JSON_KEYS)
+
+# Columns holding whole numbers, delta-encoded without scaling at daily resolution
+INTEGER_FIELDS = ('sales_units', 'inventory_level')
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Rough bucket lengths in days, used to estimate how many points a resolution gives
+BUCKET_DAYS = {
+    'day': 1,
+    'week': 7,
+    'month': 30,
+}
+
+
+class ChartRange:
+    """The date range and resolution of a chart request."""
+
+    def __init__(self, start=None, end=None, resolution='auto'):
+        self.start = start
+        self.end = end
+        self.resolution = resolution
+
+    @classmethod
+    def from_query(cls, params):
+        """
+        Reads the `start`, `end` (YYYY-MM-DD, inclusive) and `resolution`
+        query parameters.
+
+        Raises:
+            ValueError: With a message describing the invalid parameter.
+        """
+        try:
+            start = date.fromisoformat(params['start']) if params.get('start') else None
+            end = date.fromisoformat(params['end']) if params.get('end') else None
+        except ValueError:
+            raise ValueError('Invalid date, expected YYYY-MM-DD.')
+        if start is not None and end is not None and start > end:
+            raise ValueError('start must not be after end.')
+        resolution = params.get('resolution') or 'auto'
+        if resolution not in CHART_RESOLUTIONS:
+            raise ValueError(f'Invalid resolution, expected one of: {", ".join(CHART_RESOLUTIONS)}.')
+        return cls(start, end, resolution)
+
+    @property
+    def cache_key(self):
+        """Identifies the range in chart cache keys and ETags."""
+        return f'{self.start or ""}:{self.end or ""}:{self.resolution}'
+
+    def filter(self, records):
+        if self.start is not None:
+            records = records.filter(date__gte=self.start)
+        if self.end is not None:
+            records = records.filter(date__lte=self.end)
+        return records
+
+
+def choose_resolution(record_count, first_date, last_date, max_points=MAX_CHART_POINTS):
+    """
+    The finest resolution whose number of points fits within `max_points`,
+    falling back to monthly buckets for very long histories.
+    """
+    if record_count <= max_points:
+        return 'day'
+    span = (last_date - first_date).days + 1
+    for resolution in ('week', 'month'):
+        if span / BUCKET_DAYS[resolution] <= max_points:
+            return resolution
+    return 'month'
+
+
+def _load_series(records, value_fields, resolution, max_points):
+    """
+    Fetches (date, *values) rows of `records` at the given resolution. With
+    'auto', the daily rows are fetched with a limit of max_points + 1, so a
+    history that fits the budget costs that one query; only longer histories
+    pay for the bounds and bucket queries.
+    """
+    if resolution == 'auto':
+        rows = list(records.order_by('date').values_list('date', *value_fields)[:max_points + 1])
+        if len(rows) <= max_points:
+            return rows, 'day'
+        bounds = records.aggregate(count=Count('id'), first=Min('date'), last=Max('date'))
+        resolution = choose_resolution(bounds['count'], bounds['first'], bounds['last'], max_points)
+
+    if resolution == 'day':
+        return list(records.order_by('date').values_list('date', *value_fields)), 'day'
+    rows = (
+        records.annotate(bucket=BUCKET_FUNCTIONS[resolution]('date'))
+        .values('bucket')
+        .annotate(**{f'avg_{field}': Avg(field) for field in value_fields})
+        .order_by('bucket')
+        .values_list('bucket', *[f'avg_{field}' for field in value_fields])
+    )
+    return list(rows), resolution
+
+
+def load_chart_series(product_id, value_field, chart_range=None, max_points=MAX_CHART_POINTS):
+    """
+    Loads one value column of a product's daily history for plotting. Weekly
+    and monthly series are averaged per bucket in the database, so only the
+    plotted points are fetched, however long the history is.
+
+    Args:
+        product_id (str): The product.
+        value_field (str): ProductDailyRecord column to plot.
+        chart_range (ChartRange, optional): Date range and resolution (default: all history, 'auto').
+        max_points (int): Point budget for the 'auto' resolution.
+
+    Returns:
+        tuple: (dates, values, resolution), where values are floats and
+               resolution is the one actually used ('day', 'week' or 'month').
+    """
+    dates, columns, resolution = load_history_columns(product_id, chart_range, (value_field,), max_points)
+    return dates, columns[value_field], resolution
+
+
+def load_history_columns(product_id, chart_range=None, value_fields=HISTORY_VALUE_FIELDS, max_points=MAX_CHART_POINTS):
+    """
+    Loads several value columns of a product's daily history at one
+    resolution, as parallel lists.
+
+    Returns:
+        tuple: (dates, {field: list of floats}, resolution).
+    """
+    chart_range = chart_range or ChartRange()
+    records = chart_range.filter(ProductDailyRecord.objects.filter(product_id=product_id)).order_by()
+    rows, resolution = _load_series(records, value_fields, chart_range.resolution, max_points)
+    dates = [row[0] for row in rows]
+    columns = {field: [float(row[i]) for row in rows] for i, field in enumerate(value_fields, start=1)}
+    return dates, columns, resolution
+
+
+def load_panel_series(product_id, chart_range=None, max_points=MAX_CHART_POINTS):
+    """
+    Loads the series of every chart type at once, for the combined panels chart.
+
+    Returns:
+        tuple: (dates, {chart type: list of floats}, resolution).
+    """
+    dates, columns, resolution = load_history_columns(product_id, chart_range, tuple(CHART_VALUE_FIELDS.values()), max_points)
+    return dates, {chart_type: columns[field] for chart_type, field in CHART_VALUE_FIELDS.items()}, resolution
+
+
+def encode_history_columns(dates, columns, resolution, delta=False):
+    """
+    Builds the columnar JSON payload of /api/history/: a `dates` array plus
+    one array per HISTORY_JSON_KEYS entry.
+
+    Plain encoding gives ISO dates and numbers rounded to cents. Delta
+    encoding turns every column into integers, each element being the
+    difference from the previous one (the first is absolute): dates count
+    days since 1970-01-01 and values are multiplied by the column's `scale`
+    first. A client decodes a column with a running sum divided by its scale.
+    """
+    if not delta:
+        payload = {'encoding': 'plain', 'dates': [day.isoformat() for day in dates]}
+        for field, key in HISTORY_JSON_KEYS.items():
+            payload[key] = [round(value, 2) for value in columns[field]]
+        return payload
+
+    scales = {
+        key: 1 if resolution == 'day' and field in INTEGER_FIELDS else 100
+        for field, key in HISTORY_JSON_KEYS.items()
+    }
+    payload = {'encoding': 'delta', 'scale': scales, 'dates': _deltas([day.toordinal() - EPOCH_ORDINAL for day in dates])}
+    for field, key in HISTORY_JSON_KEYS.items():
+        payload[key] = _deltas([round(value * scales[key]) for value in columns[field]])
+    return payload
+
+
+def _deltas(values):
+    return [value - previous for previous, value in zip([0] + values, values)]
@@ -0,0 +1,69 @@
+# dashboard_app/chart_prerender.py
+
+import time
+from .chart_cache import get_cached_chart, get_history_version, set_cached_chart
+from .chart_data import ChartRange, load_panel_series
+from .chart_renderer import render_panels_png
+from .models import Product
+
+# Chart cache type of the combined sales/price/inventory chart
+PANELS_CHART_TYPE = 'panels'
+
+# Ways to pick the products worth pre-rendering, mapped to Product orderings
+TOP_PRODUCT_ORDERINGS = {
+    'forecast': '-demand_forecast',
+    'sales': '-sales_last_7_days',
+}
+
+
+def top_products(limit, by='forecast'):
+    """The (id, name) of the `limit` products ranking highest by `by` (see TOP_PRODUCT_ORDERINGS)."""
+    return list(Product.objects.order_by(TOP_PRODUCT_ORDERINGS[by], 'id').values_list('id', 'name')[:limit])
+
+
+def render_panels(product_id, product_name, chart_range, version, render=render_panels_png):
+    """
+    Loads a product's history once and renders the three-panel chart,
+    caching the PNG (or b'' when there are fewer than two points) under
+    the given history version.
+
+    Args:
+        render (callable): render_panels_png, or render_panels_in_pool from a request.
+
+    Returns:
+        bytes: The PNG image, or b''.
+    """
+    dates, series, resolution = load_panel_series(product_id, chart_range)
+    png_bytes = render(product_name, dates, series, resolution) if len(dates) >= 2 else b''
+    set_cached_chart(product_id, PANELS_CHART_TYPE, version, png_bytes, chart_range.cache_key)
+    return png_bytes
+
+
+def prerender_panels(products, force=False):
+    """
+    Renders into the chart cache the panels chart that /api/charts/<id>/
+    serves without query parameters (all history, 'auto' resolution).
+    Rendering runs in the calling thread, outside the web render pool.
+
+    Args:
+        products (iterable): (product_id, product_name) pairs.
+        force (bool): Also re-render charts already cached for the current history.
+
+    Returns:
+        dict: Counts of charts rendered, already cached and without enough
+              data, plus elapsed seconds.
+    """
+    started = time.perf_counter()
+    stats = {'rendered': 0, 'cached': 0, 'empty': 0}
+    chart_range = ChartRange()
+    for product_id, product_name in products:
+        version = get_history_version(product_id)
+        if not force and get_cached_chart(product_id, PANELS_CHART_TYPE, version, chart_range.cache_key) is not None:
+            stats['cached'] += 1
+            continue
+        if render_panels(product_id, product_name, chart_range, version):
+            stats['rendered'] += 1
+        else:
+            stats['empty'] += 1
+    stats['elapsed'] = time.perf_counter() - started
+    return stats
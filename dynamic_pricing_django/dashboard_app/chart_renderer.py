@@ -0,0 +1,234 @@
+# dashboard_app/chart_renderer.py
+
+import io
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import numpy as np
+from django.conf import settings
+# Object-oriented Matplotlib API only: pyplot's global figure state is not thread-safe
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import matplotlib.dates as mdates
+from .metrics import observe, registry
+
+# Look and labels of each chart type
+CHART_STYLES = {
+    'sales': {'title': 'Daily Sales History', 'ylabel': 'Units Sold', 'color': '#4BC0C0'}, # Teal
+    'price': {'title': 'Daily Price History', 'ylabel': 'Price ($)', 'color': '#9966FF'}, # Purple
+    'inventory': {'title': 'Daily Inventory History', 'ylabel': 'Units', 'color': '#FF6384'}, # Red
+}
+
+FIGURE_SIZE = (10, 5) # Consistent figure size (inches)
+
+# Panels of the combined chart, top to bottom, and its size
+PANEL_CHART_TYPES = ('sales', 'price', 'inventory')
+PANELS_FIGURE_SIZE = (10, 12)
+
+# Title suffix per series resolution (see chart_data.load_chart_series)
+RESOLUTION_TITLES = {
+    'day': '',
+    'week': ' (weekly averages)',
+    'month': ' (monthly averages)',
+}
+
+# Longer series are drawn as a plain line; markers would merge into a smear
+MAX_MARKED_POINTS = 120
+
+
+class ChartRendererBusy(Exception):
+    """Raised when the render queue is full."""
+
+
+class ChartRenderTimeout(Exception):
+    """Raised when a render does not finish within the timeout."""
+
+
+# Figure templates are built once per thread and chart type, then reused.
+# A Figure must never be touched by two threads at once, hence thread-local.
+_templates = threading.local()
+
+
+def _build_template(chart_type):
+    style = CHART_STYLES[chart_type]
+    figure = Figure(figsize=FIGURE_SIZE)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.xaxis_date()
+    axes.set_xlabel('Date')
+    axes.set_ylabel(style['ylabel'])
+    axes.grid(True)
+    axes.tick_params(axis='x', labelrotation=45) # Rotate date labels for readability
+    # Fixed margins instead of tight_layout, which re-measures every text on each render
+    figure.subplots_adjust(left=0.08, right=0.97, top=0.92, bottom=0.22)
+    line, = axes.plot([], [], marker='o', linestyle='-', color=style['color'])
+    return figure, axes, line
+
+
+def _build_panels_template():
+    figure = Figure(figsize=PANELS_FIGURE_SIZE)
+    FigureCanvasAgg(figure)
+    panels = figure.subplots(len(PANEL_CHART_TYPES), 1, sharex=True)
+    lines = []
+    for axes, chart_type in zip(panels, PANEL_CHART_TYPES):
+        style = CHART_STYLES[chart_type]
+        axes.xaxis_date()
+        axes.set_title(style['title'])
+        axes.set_ylabel(style['ylabel'])
+        axes.grid(True)
+        line, = axes.plot([], [], marker='o', linestyle='-', color=style['color'])
+        lines.append(line)
+    panels[-1].set_xlabel('Date')
+    panels[-1].tick_params(axis='x', labelrotation=45)
+    figure.subplots_adjust(left=0.08, right=0.97, top=0.93, bottom=0.09, hspace=0.3)
+    return figure, panels, lines
+
+
+def _get_template(chart_type):
+    cache = getattr(_templates, 'figures', None)
+    if cache is None:
+        cache = _templates.figures = {}
+    if chart_type not in cache:
+        cache[chart_type] = _build_panels_template() if chart_type == 'panels' else _build_template(chart_type)
+    return cache[chart_type]
+
+
+def render_chart_png(chart_type, product_name, dates, values, resolution='day'):
+    """
+    Renders one history chart to PNG bytes in the calling thread, reusing
+    this thread's pre-built figure for the chart type.
+
+    Args:
+        chart_type (str): One of CHART_STYLES.
+        product_name (str): Used in the chart title.
+        dates (sequence of date or numpy.ndarray of datetime64): X values.
+        values (sequence of numbers): Y values.
+        resolution (str): 'day', or 'week'/'month' for bucket averages; shown in the title.
+
+    Returns:
+        bytes: The PNG image.
+    """
+    started = time.perf_counter()
+    figure, axes, line = _get_template(chart_type)
+    x = mdates.date2num(np.asarray(dates, dtype='datetime64[D]'))
+    line.set_data(x, np.asarray(values, dtype=np.float64))
+    line.set_marker('o' if len(x) <= MAX_MARKED_POINTS else '')
+    axes.relim()
+    axes.autoscale_view()
+    axes.set_title(f"{product_name} - {CHART_STYLES[chart_type]['title']}{RESOLUTION_TITLES[resolution]}")
+    for label in axes.get_xticklabels():
+        label.set_horizontalalignment('right')
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png')
+    observe('dashboard_chart_render_seconds', time.perf_counter() - started, chart=chart_type)
+    return buffer.getvalue()
+
+
+def render_panels_png(product_name, dates, series, resolution='day'):
+    """
+    Renders the sales, price and inventory history of a product as one PNG
+    with three stacked panels sharing the date axis.
+
+    Args:
+        product_name (str): Used in the figure title.
+        dates (sequence of date or numpy.ndarray of datetime64): X values.
+        series (dict): Y values per chart type in PANEL_CHART_TYPES.
+        resolution (str): 'day', or 'week'/'month' for bucket averages; shown in the title.
+
+    Returns:
+        bytes: The PNG image.
+    """
+    started = time.perf_counter()
+    figure, panels, lines = _get_template('panels')
+    x = mdates.date2num(np.asarray(dates, dtype='datetime64[D]'))
+    marker = 'o' if len(x) <= MAX_MARKED_POINTS else ''
+    for axes, line, chart_type in zip(panels, lines, PANEL_CHART_TYPES):
+        line.set_data(x, np.asarray(series[chart_type], dtype=np.float64))
+        line.set_marker(marker)
+        axes.relim()
+        axes.autoscale_view()
+    figure.suptitle(f"{product_name} - History{RESOLUTION_TITLES[resolution]}")
+    for label in panels[-1].get_xticklabels():
+        label.set_horizontalalignment('right')
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png')
+    observe('dashboard_chart_render_seconds', time.perf_counter() - started, chart='panels')
+    return buffer.getvalue()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_queue_slots = None
+
+
+def _get_executor():
+    global _executor, _queue_slots
+    with _executor_lock:
+        if _executor is None:
+            workers = settings.CHART_RENDER_WORKERS
+            if settings.CHART_RENDER_EXECUTOR == 'process':
+                _executor = ProcessPoolExecutor(max_workers=workers, initializer=_start_render_process)
+            else:
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chart-render')
+            # Running plus waiting renders; beyond this, callers are turned away
+            _queue_slots = threading.BoundedSemaphore(workers + settings.CHART_RENDER_QUEUE_SIZE)
+    return _executor, _queue_slots
+
+
+def _start_render_process():
+    # A forked worker starts with a copy of the parent's metrics; only its own are sent back
+    registry.reset()
+
+
+def _render_in_process(render, *args):
+    """
+    Runs in a render pool process: returns the render's result and the
+    metrics recorded in this process since the previous render (including
+    those of a render the parent stopped waiting for).
+    """
+    result = render(*args)
+    return result, registry.drain()
+
+
+def _render_in_pool(description, render, *args, timeout=None):
+    executor, queue_slots = _get_executor()
+    in_process = isinstance(executor, ProcessPoolExecutor)
+    if not queue_slots.acquire(blocking=False):
+        raise ChartRendererBusy('Chart render queue is full.')
+    try:
+        future = executor.submit(_render_in_process, render, *args) if in_process else executor.submit(render, *args)
+    except Exception:
+        queue_slots.release()
+        raise
+    # The slot is freed when the render really ends, even if we stop waiting for it
+    future.add_done_callback(lambda _: queue_slots.release())
+    try:
+        result = future.result(timeout=timeout if timeout is not None else settings.CHART_RENDER_TIMEOUT)
+    except FutureTimeoutError:
+        raise ChartRenderTimeout(f'Rendering the {description} timed out.')
+    if in_process:
+        # Render timings recorded in the worker process go to this process's registry
+        result, metrics = result
+        registry.merge(metrics)
+    return result
+
+
+def render_chart_in_pool(chart_type, product_name, dates, values, resolution='day', timeout=None):
+    """
+    Renders a chart on the bounded render pool and waits for the result.
+
+    Raises:
+        ChartRendererBusy: If the pool's queue is full.
+        ChartRenderTimeout: If the render does not finish within `timeout`
+                            seconds (defaults to settings.CHART_RENDER_TIMEOUT).
+    """
+    return _render_in_pool(
+        f'{chart_type} chart', render_chart_png, chart_type, product_name, dates, values, resolution, timeout=timeout,
+    )
+
+
+def render_panels_in_pool(product_name, dates, series, resolution='day', timeout=None):
+    """Renders the three-panel chart on the render pool; raises like `render_chart_in_pool`."""
+    return _render_in_pool('chart panels', render_panels_png, product_name, dates, series, resolution, timeout=timeout)
@@ -0,0 +1,128 @@
+# dashboard_app/exports.py
+
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from django.db.models import Q
+from .history_import import IMPORT_FIELDS
+from .models import Product, ProductDailyRecord
+
+# Rows fetched per query. Every page is its own short query, so a long export
+# never keeps a read cursor (on SQLite, a shared lock) open while the client downloads.
+EXPORT_PAGE_SIZE = 5000
+
+# Bytes of encoded output collected before a chunk is sent to the client
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+# Same columns as the history import, so an export can be loaded back as is
+HISTORY_EXPORT_FIELDS = IMPORT_FIELDS
+
+PRODUCT_EXPORT_FIELDS = (
+    'id', 'name', 'category', 'current_price', 'suggested_price', 'inventory',
+    'demand_forecast', 'sales_last_7_days', 'margin', 'competitor_price', 'last_updated',
+)
+
+
+def iter_history_rows(start=None, end=None, category=None, product_id=None, page_size=EXPORT_PAGE_SIZE):
+    """
+    Yields daily records as HISTORY_EXPORT_FIELDS tuples ordered by
+    (product_id, date), fetched one keyset page at a time.
+
+    Args:
+        start (datetime.date, optional): First date to include.
+        end (datetime.date, optional): Last date to include.
+        category (str, optional): Only products in this category.
+        product_id (str, optional): Only this product.
+        page_size (int): Rows per query.
+    """
+    records = ProductDailyRecord.objects.all()
+    if start is not None:
+        records = records.filter(date__gte=start)
+    if end is not None:
+        records = records.filter(date__lte=end)
+    if category is not None:
+        records = records.filter(product__category=category)
+    if product_id is not None:
+        records = records.filter(product_id=product_id)
+    records = records.order_by('product_id', 'date').values_list(*HISTORY_EXPORT_FIELDS)
+
+    page = records
+    while True:
+        rows = list(page[:page_size])
+        yield from rows
+        if len(rows) < page_size:
+            return
+        last_product, last_date = rows[-1][0], rows[-1][1]
+        # (product_id, date) > last row, written so the range on product_id can use the index
+        page = records.filter(Q(product_id__gte=last_product) & (Q(product_id__gt=last_product) | Q(date__gt=last_date)))
+
+
+def iter_product_rows(category=None, page_size=EXPORT_PAGE_SIZE):
+    """
+    Yields products, including their latest predictions, as
+    PRODUCT_EXPORT_FIELDS tuples ordered by id, one keyset page at a time.
+    """
+    products = Product.objects.all()
+    if category is not None:
+        products = products.filter(category=category)
+    products = products.order_by('id').values_list(*PRODUCT_EXPORT_FIELDS)
+
+    page = products
+    while True:
+        rows = list(page[:page_size])
+        yield from rows
+        if len(rows) < page_size:
+            return
+        page = products.filter(id__gt=rows[-1][0])
+
+
+def csv_chunks(fields, rows, buffer_size=EXPORT_BUFFER_SIZE):
+    """Encodes rows as CSV with a header line, yielding UTF-8 chunks of about `buffer_size` bytes."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= buffer_size:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def ndjson_chunks(fields, rows, buffer_size=EXPORT_BUFFER_SIZE):
+    """Encodes rows as newline-delimited JSON objects keyed by `fields`, yielding UTF-8 chunks."""
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(fields, map(_json_value, row)))) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= buffer_size:
+            yield ''.join(lines).encode()
+            lines = []
+            size = 0
+    if lines:
+        yield ''.join(lines).encode()
+
+
+def gzip_chunks(chunks, level=6):
+    """Gzip-compresses a stream of byte chunks without buffering the whole output."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
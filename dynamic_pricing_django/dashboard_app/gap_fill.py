@@ -0,0 +1,148 @@
+# dashboard_app/gap_fill.py
+
+import time
+from datetime import timedelta
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, FilteredRelation, Q
+from .aggregates import refresh_for_records
+from .bulk_ops import ID_BATCH_SIZE, upsert_daily_record_rows
+from .ml_logic.ml_model_service import cents_to_decimal
+from .models import Product, ProductDailyRecord
+
+# Product columns the synthetic records are derived from
+GAP_FILL_INPUT_FIELDS = ('id', 'sales_last_7_days', 'inventory', 'current_price')
+
+# Ids of filled products kept in the returned stats; the rest are only counted
+MAX_REPORTED_PRODUCTS = 100
+
+
+def _incomplete_products(start, end, product_ids=None):
+    """
+    Products with fewer records in [start, end] than days in it. The window
+    is a join condition (LEFT JOIN ... ON product_id = id AND date BETWEEN),
+    so only records inside the window are read, through the (product, date) index.
+    """
+    days = (end - start).days + 1
+    products = (
+        Product.objects
+        .annotate(window_records=FilteredRelation('daily_records', condition=Q(daily_records__date__range=(start, end))))
+        .annotate(recorded_days=Count('window_records'))
+        .filter(recorded_days__lt=days)
+    )
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+    return products.order_by('id').values_list(*GAP_FILL_INPUT_FIELDS)
+
+
+def find_history_gaps(start, end, product_ids=None, page_size=ID_BATCH_SIZE):
+    """
+    Finds every (product, date) in [start, end] without a daily record, one
+    page of incomplete products at a time (complete products are never read).
+
+    Args:
+        start (datetime.date): First day of the window.
+        end (datetime.date): Last day of the window.
+        product_ids (list, optional): Only these products (default: the whole catalog).
+        page_size (int): Products per page.
+
+    Yields:
+        tuple: (products, rows, columns) per page: the page's product input
+               tuples (GAP_FILL_INPUT_FIELDS), and the row index into `products`
+               and column (days after `start`) of each missing record.
+    """
+    days = (end - start).days + 1
+    if product_ids is not None:
+        pages = (sorted(product_ids)[i:i + page_size] for i in range(0, len(product_ids), page_size))
+        queries = (_incomplete_products(start, end, batch) for batch in pages)
+    else:
+        queries = None
+
+    last_id = None
+    while True:
+        if queries is not None:
+            query = next(queries, None)
+            if query is None:
+                return
+            products = list(query)
+        else:
+            # Keyset pages over the whole catalog
+            query = _incomplete_products(start, end)
+            if last_id is not None:
+                query = query.filter(id__gt=last_id)
+            products = list(query[:page_size])
+            if not products:
+                return
+            last_id = products[-1][0]
+        if not products:
+            continue
+
+        index = {product[0]: i for i, product in enumerate(products)}
+        present = np.zeros((len(products), days), dtype=bool)
+        existing = ProductDailyRecord.objects.filter(product_id__in=list(index), date__range=(start, end)).values_list('product_id', 'date')
+        for product_id, record_date in existing:
+            present[index[product_id], (record_date - start).days] = True
+        rows, columns = np.nonzero(~present)
+        yield products, rows, columns
+
+
+def synthesize_records(products, rows, columns, start, rng):
+    """
+    Generates plausible daily records for missing (product, date) cells in
+    one vectorized pass: sales around the product's average daily sales,
+    inventory within 20 units of the current level and a price within 2%
+    of the current price.
+
+    Returns:
+        list: (product_id, date, sales_units, inventory_level, price) tuples.
+    """
+    product_ids, sales_last_7_days, inventory, prices = zip(*products)
+    count = len(rows)
+    daily_sales = np.asarray(sales_last_7_days, dtype=np.float64)[rows] / 7
+    sales = np.maximum(0, np.rint(daily_sales * rng.uniform(0.7, 1.3, count))).astype(np.int64)
+    inventory_levels = np.maximum(0, np.asarray(inventory, dtype=np.int64)[rows] + rng.integers(-20, 21, count))
+    price_cents = np.asarray([int(price.scaleb(2)) for price in prices], dtype=np.int64)[rows]
+    price_cents = np.rint(price_cents * rng.uniform(0.98, 1.02, count)).astype(np.int64)
+
+    dates = [start + timedelta(days=days) for days in range(int(columns.max()) + 1)] if count else []
+    return [
+        (product_ids[row], dates[column], int(units), int(level), cents_to_decimal(cents))
+        for row, column, units, level, cents in zip(rows.tolist(), columns.tolist(), sales, inventory_levels, price_cents)
+    ]
+
+
+def fill_history_gaps(start, end, product_ids=None, rng=None, page_size=ID_BATCH_SIZE):
+    """
+    Inserts synthetic daily records for every (product, date) in [start, end]
+    that has none, e.g. the days before a product was added or a window lost
+    to an outage. Existing records are never changed: rows are inserted with
+    ON CONFLICT DO NOTHING, so a real record written concurrently wins.
+    Each page of products is written in its own transaction.
+
+    Args:
+        start (datetime.date): First day to fill.
+        end (datetime.date): Last day to fill.
+        product_ids (list, optional): Only these products (default: the whole catalog).
+        rng (numpy.random.Generator, optional): Source of the simulated noise.
+        page_size (int): Products per page.
+
+    Returns:
+        dict: Number of products with gaps ('products'), records written, the
+              ids of the first MAX_REPORTED_PRODUCTS of those products in id
+              order ('sample_product_ids'; complete when its length equals
+              'products') and elapsed seconds.
+    """
+    started = time.perf_counter()
+    rng = rng if rng is not None else np.random.default_rng()
+    stats = {'products': 0, 'records_written': 0, 'sample_product_ids': []}
+    for products, rows, columns in find_history_gaps(start, end, product_ids, page_size):
+        records = synthesize_records(products, rows, columns, start, rng)
+        with transaction.atomic():
+            stats['records_written'] += upsert_daily_record_rows(records, ignore_conflicts=True, update_aggregates=False)
+            # Every product is in one page only, so its aggregate is recomputed once
+            refresh_for_records((record[0], record[1]) for record in records)
+        filled = sorted({products[row][0] for row in set(rows.tolist())})
+        stats['products'] += len(filled)
+        stats['sample_product_ids'].extend(filled[:MAX_REPORTED_PRODUCTS - len(stats['sample_product_ids'])])
+    stats['elapsed'] = time.perf_counter() - started
+    return stats
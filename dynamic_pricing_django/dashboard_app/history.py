@@ -0,0 +1,121 @@
+# dashboard_app/history.py
+
+from datetime import date, timedelta
+from itertools import chain
+import numpy as np
+from .bulk_ops import ID_BATCH_SIZE
+from .models import ProductDailyRecord
+
+# Rows fetched from the database per round trip when streaming history
+DEFAULT_CHUNK_SIZE = 20000
+
+HISTORY_FIELDS = ('date', 'sales_units', 'inventory_level', 'price_at_day_end')
+
+
+class HistoryArrays:
+    """
+    Daily history for many products held as flat NumPy columns sorted by
+    (product_id, date). Each product's records are a contiguous slice, so
+    per-product arrays are views into the columns and never copies.
+    """
+
+    def __init__(self, product_ids, offsets, columns):
+        # product_ids[i]'s rows are columns[...][offsets[i]:offsets[i + 1]]
+        self.product_ids = product_ids
+        self.offsets = offsets
+        self.columns = columns
+        self._index = {product_id: i for i, product_id in enumerate(product_ids)}
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def __contains__(self, product_id):
+        return product_id in self._index
+
+    def __getitem__(self, product_id):
+        i = self._index[product_id]
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        return {name: column[start:stop] for name, column in self.columns.items()}
+
+    def get(self, product_id, default=None):
+        return self[product_id] if product_id in self else default
+
+    def items(self):
+        for product_id in self.product_ids:
+            yield product_id, self[product_id]
+
+    @property
+    def record_count(self):
+        return int(self.offsets[-1])
+
+
+def _empty_columns():
+    return {
+        'date': np.array([], dtype='datetime64[D]'),
+        'sales_units': np.array([], dtype=np.int64),
+        'inventory_level': np.array([], dtype=np.int64),
+        'price_at_day_end': np.array([], dtype=np.float64),
+    }
+
+
+def load_history_arrays(history_days=None, end_date=None, product_ids=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Streams ProductDailyRecord rows ordered by (product_id, date) and packs
+    them into a `HistoryArrays`, without building a dict per record. The
+    rows come from one query, or, for `product_ids`, one query per
+    ID_BATCH_SIZE products in id order.
+
+    Args:
+        history_days (int, optional): Only load the last `history_days` days up to `end_date`.
+        end_date (datetime.date, optional): Last day of the window (defaults to today).
+        product_ids (iterable, optional): Restrict the load to these products.
+        chunk_size (int): Rows fetched from the database per round trip.
+
+    Returns:
+        HistoryArrays: The grouped history.
+    """
+    records = ProductDailyRecord.objects.all()
+    if history_days is not None:
+        end_date = end_date or date.today()
+        records = records.filter(date__range=[end_date - timedelta(days=history_days - 1), end_date])
+    if product_ids is None:
+        queries = [records]
+    else:
+        product_ids = sorted(set(product_ids))
+        queries = (
+            records.filter(product_id__in=product_ids[start:start + ID_BATCH_SIZE])
+            for start in range(0, len(product_ids), ID_BATCH_SIZE)
+        )
+    rows = chain.from_iterable(
+        query.order_by('product_id', 'date').values_list('product_id', *HISTORY_FIELDS).iterator(chunk_size=chunk_size)
+        for query in queries
+    )
+
+    id_chunks, column_chunks = [], {name: [] for name in HISTORY_FIELDS}
+    buffer = []
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) >= chunk_size:
+            _pack_chunk(buffer, id_chunks, column_chunks)
+            buffer = []
+    if buffer:
+        _pack_chunk(buffer, id_chunks, column_chunks)
+
+    if not id_chunks:
+        return HistoryArrays(np.array([], dtype=object), np.zeros(1, dtype=np.int64), _empty_columns())
+
+    record_ids = np.concatenate(id_chunks)
+    columns = {name: np.concatenate(chunks) for name, chunks in column_chunks.items()}
+    # A new product starts wherever the id differs from the previous row's
+    starts = np.flatnonzero(np.concatenate(([True], record_ids[1:] != record_ids[:-1])))
+    offsets = np.append(starts, len(record_ids)).astype(np.int64)
+    return HistoryArrays(record_ids[starts], offsets, columns)
+
+
+def _pack_chunk(buffer, id_chunks, column_chunks):
+    product_ids, dates, sales_units, inventory_levels, prices = zip(*buffer)
+    id_chunks.append(np.array(product_ids, dtype=object))
+    column_chunks['date'].append(np.array(dates, dtype='datetime64[D]'))
+    column_chunks['sales_units'].append(np.array(sales_units, dtype=np.int64))
+    column_chunks['inventory_level'].append(np.array(inventory_levels, dtype=np.int64))
+    column_chunks['price_at_day_end'].append(np.array(prices, dtype=np.float64))
@@ -0,0 +1,270 @@
+# dashboard_app/history_import.py
+
+import codecs
+import csv
+import time
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from .aggregates import refresh_for_date_ranges
+from .bulk_ops import CENT, ID_BATCH_SIZE, MAX_INTEGER, MAX_PRICE, upsert_daily_record_rows
+from .models import Product
+
+# Columns of an import file, in the order rows are handed to `import_history`
+IMPORT_FIELDS = ('product_id', 'date', 'sales_units', 'inventory_level', 'price_at_day_end')
+
+# Rows per bulk upsert and per transaction
+DEFAULT_CHUNK_SIZE = 5000
+
+# Bad rows kept in the returned stats; the rest are only counted (or passed to on_error)
+MAX_REPORTED_ERRORS = 100
+
+
+def _whole_number(value, field):
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f'{field} must be a whole number.')
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} must be a whole number.')
+    if number < 0:
+        raise ValueError(f'{field} cannot be negative.')
+    if number > MAX_INTEGER:
+        raise ValueError(f'{field} cannot exceed {MAX_INTEGER}.')
+    return number
+
+
+def parse_history_row(values):
+    """
+    Validates one import row.
+
+    Args:
+        values (sequence): Raw values in IMPORT_FIELDS order, either strings
+                           (CSV) or typed values (Parquet).
+
+    Returns:
+        tuple: (product_id, date, sales_units, inventory_level, price_at_day_end).
+
+    Raises:
+        ValueError: With a message describing what is wrong with the row.
+    """
+    if len(values) != len(IMPORT_FIELDS):
+        raise ValueError(f'Expected {len(IMPORT_FIELDS)} columns, got {len(values)}.')
+    product_id, record_date, sales_units, inventory_level, price = values
+
+    product_id = str(product_id).strip() if product_id is not None else ''
+    if not product_id:
+        raise ValueError('Missing product_id.')
+
+    if not isinstance(record_date, date):
+        try:
+            record_date = date.fromisoformat(str(record_date).strip())
+        except ValueError:
+            raise ValueError(f'Invalid date {record_date!r}; expected YYYY-MM-DD.')
+
+    sales_units = _whole_number(sales_units, 'sales_units')
+    inventory_level = _whole_number(inventory_level, 'inventory_level')
+
+    try:
+        price = Decimal(str(price).strip())
+    except InvalidOperation:
+        raise ValueError(f'Invalid price_at_day_end {price!r}.')
+    if not price.is_finite() or price < 0 or price >= MAX_PRICE:
+        raise ValueError(f'price_at_day_end must be between 0 and {MAX_PRICE}.')
+    if price != price.quantize(CENT):
+        raise ValueError('price_at_day_end must have at most 2 decimal places.')
+
+    return product_id, record_date, sales_units, inventory_level, price.quantize(CENT)
+
+
+def iter_csv_rows(lines, encoding='utf-8-sig'):
+    """
+    Streams the rows of a CSV file with a header line naming at least the
+    IMPORT_FIELDS columns (in any order; other columns are ignored).
+
+    Args:
+        lines (iterable of bytes or str): The file, line by line, e.g. an open
+                                          binary file, an upload or a request.
+        encoding (str): Encoding of byte lines.
+
+    Yields:
+        tuple: (line number, values in IMPORT_FIELDS order). Values missing
+               from short rows are None, so those rows are reported as bad.
+               A line the CSV parser rejects (e.g. a field over
+               csv.field_size_limit) yields a ValueError instead of values,
+               and reading carries on with the next line.
+
+    Raises:
+        ValueError: If the header is missing required columns.
+    """
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    if isinstance(first, bytes):
+        decoder = codecs.getincrementaldecoder(encoding)()
+        first = decoder.decode(first)
+        lines = (decoder.decode(line) for line in lines)
+    elif first.startswith('\ufeff'):
+        first = first[1:]
+
+    reader = csv.reader(_chain_first(first, lines))
+    header = [name.strip() for name in next(reader)]
+    missing = [field for field in IMPORT_FIELDS if field not in header]
+    if missing:
+        raise ValueError(f'CSV header is missing column(s): {", ".join(missing)}.')
+    positions = [header.index(field) for field in IMPORT_FIELDS]
+    width = max(positions) + 1
+
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield reader.line_num, ValueError(f'Malformed CSV line: {e}.')
+            continue
+        if not row or (len(row) == 1 and not row[0].strip()):
+            continue
+        if len(row) < width:
+            row = row + [None] * (width - len(row))
+        yield reader.line_num, [row[i] for i in positions]
+
+
+def _chain_first(first, lines):
+    yield first
+    yield from lines
+
+
+def iter_parquet_rows(source, batch_size=DEFAULT_CHUNK_SIZE):
+    """
+    Streams the rows of a Parquet file one record batch at a time.
+    Needs the optional pyarrow package.
+
+    Args:
+        source: A path or a seekable binary file object.
+        batch_size (int): Rows decoded per batch.
+
+    Yields:
+        tuple: (row number, values in IMPORT_FIELDS order).
+
+    Raises:
+        ImportError: If pyarrow is not installed.
+        ValueError: If the file is missing required columns.
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('Parquet import needs the pyarrow package (pip install pyarrow).')
+
+    parquet_file = pq.ParquetFile(source)
+    missing = [field for field in IMPORT_FIELDS if field not in parquet_file.schema_arrow.names]
+    if missing:
+        raise ValueError(f'Parquet file is missing column(s): {", ".join(missing)}.')
+
+    row_number = 0
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=list(IMPORT_FIELDS)):
+        columns = [batch.column(field).to_pylist() for field in IMPORT_FIELDS]
+        for values in zip(*columns):
+            row_number += 1
+            yield row_number, values
+
+
+def import_history(rows, chunk_size=DEFAULT_CHUNK_SIZE, on_error=None, on_chunk=None):
+    """
+    Loads daily records into ProductDailyRecord with chunked bulk upserts,
+    one transaction per chunk, holding at most one chunk of rows in memory.
+    The sales aggregates of the products loaded are refreshed once, after
+    the last chunk (chunks of a file sorted by date touch every product).
+    Rows that fail validation or name an unknown product are skipped and
+    reported in row order, whichever check failed; they never abort the load.
+    If a (product, date) appears more than once in a chunk, the last row wins.
+
+    Args:
+        rows (iterable): (row number, values) pairs, e.g. from `iter_csv_rows`
+                         or `iter_parquet_rows`; values may be a ValueError
+                         for a row that could not be read, reported like
+                         any other bad row.
+        chunk_size (int): Rows per upsert/transaction.
+        on_error (callable, optional): Called as on_error(row_number, message)
+                                       for every bad row, in row order, as
+                                       each chunk is written.
+        on_chunk (callable, optional): Called after each committed chunk with the
+                                       running totals (rows_read, records_written).
+
+    Returns:
+        dict: rows_read, records_written, rows_rejected, the first
+              MAX_REPORTED_ERRORS errors as {'row', 'message'} dicts, the ids
+              of the products written, elapsed seconds and rows per second.
+    """
+    started = time.perf_counter()
+    stats = {'rows_read': 0, 'records_written': 0, 'rows_rejected': 0, 'errors': []}
+    known_ids = set()
+    unknown_ids = set()
+    date_ranges = {} # product_id -> (first, last) date written
+
+    def reject(row_number, message):
+        stats['rows_rejected'] += 1
+        if len(stats['errors']) < MAX_REPORTED_ERRORS:
+            stats['errors'].append({'row': row_number, 'message': message})
+        if on_error is not None:
+            on_error(row_number, message)
+
+    def flush(chunk, chunk_errors):
+        # Products are looked up once per import, so repeated ids cost nothing
+        new_ids = list({key[0] for key in chunk} - known_ids - unknown_ids)
+        for start in range(0, len(new_ids), ID_BATCH_SIZE):
+            batch = new_ids[start:start + ID_BATCH_SIZE]
+            found = set(Product.objects.filter(id__in=batch).values_list('id', flat=True))
+            known_ids.update(found)
+            unknown_ids.update(set(batch) - found)
+
+        records = []
+        for (product_id, record_date), (row_number, sales_units, inventory_level, price) in chunk.items():
+            if product_id in unknown_ids:
+                chunk_errors.append((row_number, f'Unknown product_id {product_id!r}.'))
+                continue
+            records.append((product_id, record_date, sales_units, inventory_level, price))
+            first, last = date_ranges.get(product_id, (record_date, record_date))
+            date_ranges[product_id] = (min(first, record_date), max(last, record_date))
+        # Unknown products are only known now, after the chunk's parse errors;
+        # chunks are read in order, so sorting each one orders every error
+        for row_number, message in sorted(chunk_errors):
+            reject(row_number, message)
+        with transaction.atomic():
+            stats['records_written'] += upsert_daily_record_rows(records, update_aggregates=False)
+        if on_chunk is not None:
+            on_chunk(stats['rows_read'], stats['records_written'])
+
+    chunk = {}
+    chunk_errors = []
+    chunk_rows = 0
+    try:
+        for row_number, values in rows:
+            stats['rows_read'] += 1
+            chunk_rows += 1
+            try:
+                if isinstance(values, ValueError):
+                    raise values
+                product_id, record_date, sales_units, inventory_level, price = parse_history_row(values)
+            except ValueError as e:
+                chunk_errors.append((row_number, str(e)))
+            else:
+                chunk[(product_id, record_date)] = (row_number, sales_units, inventory_level, price)
+            # Bad rows count towards the chunk too, so their buffered errors stay bounded
+            if chunk_rows >= chunk_size:
+                flush(chunk, chunk_errors)
+                chunk, chunk_errors, chunk_rows = {}, [], 0
+        if chunk_rows:
+            flush(chunk, chunk_errors)
+    finally:
+        # Chunks already committed stay, so their aggregates are refreshed even if the load failed
+        if date_ranges:
+            with transaction.atomic():
+                refresh_for_date_ranges(date_ranges)
+
+    elapsed = time.perf_counter() - started
+    stats['product_ids'] = sorted(known_ids)
+    stats['elapsed'] = elapsed
+    stats['rows_per_second'] = stats['rows_read'] / elapsed if elapsed > 0 else float(stats['rows_read'])
+    return stats
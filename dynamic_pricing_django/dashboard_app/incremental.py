@@ -0,0 +1,52 @@
+# dashboard_app/incremental.py
+
+from django.db.models import F, Q
+from .models import PredictionRun, Product, ProductDailyRecord
+
+# Product fields a prediction is computed from, as mirrored on PredictionState
+PREDICTION_INPUT_FIELDS = ('sales_last_7_days', 'current_price', 'competitor_price', 'margin')
+
+
+def last_successful_run():
+    """The most recent PredictionRun that completed, or None."""
+    return PredictionRun.objects.filter(succeeded=True).order_by('-started_at').first()
+
+
+def changed_product_ids(since):
+    """
+    Ids of the products whose predictions may be out of date because something
+    changed after `since`:
+      - products updated since then that were never predicted, or whose
+        prediction inputs differ from the ones their prediction was made from
+        (prediction runs themselves touch last_updated without changing inputs);
+      - products with daily records written after their last prediction.
+
+    Both lookups start from indexed timestamps, so the cost follows the
+    number of changes rather than the size of the catalog.
+
+    Args:
+        since (datetime.datetime): High-water mark, normally the start of the
+                                   last successful run.
+
+    Returns:
+        set: Product ids.
+    """
+    inputs_changed = Q(prediction_state__isnull=True)
+    for field in PREDICTION_INPUT_FIELDS:
+        inputs_changed |= ~Q(**{field: F(f'prediction_state__{field}')})
+    updated = (
+        Product.objects
+        .filter(last_updated__gt=since)
+        .filter(inputs_changed)
+        .values_list('id', flat=True)
+    )
+
+    new_history = (
+        ProductDailyRecord.objects
+        .filter(recorded_at__gt=since)
+        .filter(Q(product__prediction_state__isnull=True) | Q(recorded_at__gt=F('product__prediction_state__predicted_at')))
+        .order_by()
+        .values_list('product_id', flat=True)
+        .distinct()
+    )
+    return set(updated) | set(new_history)
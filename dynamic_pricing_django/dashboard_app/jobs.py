@@ -0,0 +1,154 @@
+# dashboard_app/jobs.py
+
+import subprocess
+import sys
+from collections import deque
+from datetime import timedelta
+from io import TextIOBase
+from django.conf import settings
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import PredictionJob
+
+# Management commands that may be run as jobs
+JOB_COMMANDS = ('run_ml_predictions',)
+
+# Characters of command output kept on the job row
+OUTPUT_TAIL_CHARS = 10000
+
+
+class OutputTail(TextIOBase):
+    """
+    Text stream keeping only the last `limit` characters written to it, so
+    capturing the output of a command costs O(limit) memory however much it writes.
+    """
+
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+        self._chunks = deque()
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self._chunks.append(text)
+        self._size += len(text)
+        # Drop whole chunks that lie entirely before the last `limit` characters
+        while self._size - len(self._chunks[0]) >= self.limit:
+            self._size -= len(self._chunks.popleft())
+        if self._size > 2 * self.limit:
+            # A single huge write: keep only its end
+            kept = self.getvalue()
+            self._chunks = deque([kept])
+            self._size = len(kept)
+        return len(text)
+
+    def getvalue(self):
+        return ''.join(self._chunks)[-self.limit:]
+
+
+def expire_stale_jobs():
+    """
+    Fails active jobs whose worker stopped reporting (crashed or was killed),
+    so they no longer block new triggers. See settings.JOB_STALE_AFTER_SECONDS.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_STALE_AFTER_SECONDS)
+    # A job's last sign of life is its heartbeat, or its creation if no worker ever picked it up
+    stale = Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, created_at__lt=cutoff)
+    return PredictionJob.objects.filter(stale, status__in=PredictionJob.ACTIVE_STATUSES).update(
+        status=PredictionJob.FAILED, finished_at=timezone.now(), message='Worker stopped responding.',
+    )
+
+
+def enqueue_job(kind='run_ml_predictions', options=None, user=None):
+    """
+    Queues a job unless one of the same kind is already queued or running,
+    in which case that job is returned instead (deduplication is enforced by
+    a partial unique constraint, so concurrent triggers cannot both win).
+
+    Returns:
+        tuple: (PredictionJob, created)
+    """
+    if kind not in JOB_COMMANDS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    expire_stale_jobs()
+    for _ in range(3):
+        try:
+            with transaction.atomic():
+                return PredictionJob.objects.create(kind=kind, options=options or {}, requested_by=user), True
+        except IntegrityError:
+            active = PredictionJob.objects.filter(kind=kind, status__in=PredictionJob.ACTIVE_STATUSES).first()
+            if active is not None:
+                return active, False
+            # The active job finished in between; try to queue again
+    raise IntegrityError(f'Could not queue a {kind} job.')
+
+
+def spawn_worker():
+    """
+    Starts a detached `run_job_worker --once` process that drains the queue
+    and exits, so queued jobs run even without a long-lived worker.
+    """
+    return subprocess.Popen(
+        [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'run_job_worker', '--once'],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def claim_next_job():
+    """Atomically moves the oldest queued job to running and returns it (or None)."""
+    for job_id in PredictionJob.objects.filter(status=PredictionJob.QUEUED).order_by('created_at').values_list('id', flat=True)[:10]:
+        now = timezone.now()
+        claimed = PredictionJob.objects.filter(id=job_id, status=PredictionJob.QUEUED).update(
+            status=PredictionJob.RUNNING, started_at=now, heartbeat_at=now,
+        )
+        if claimed:
+            return PredictionJob.objects.get(id=job_id)
+    return None
+
+
+def report_progress(job_id, **counters):
+    """
+    Updates a running job's progress counters (products_predicted, rows_written)
+    and its heartbeat. Does nothing without a job id, so commands can call it
+    unconditionally.
+    """
+    if job_id is None:
+        return
+    PredictionJob.objects.filter(id=job_id).update(heartbeat_at=timezone.now(), **counters)
+
+
+def run_job(job):
+    """Runs a claimed job's command in this process and records the outcome."""
+    out = OutputTail(OUTPUT_TAIL_CHARS)
+    try:
+        call_command(job.kind, stdout=out, job_id=job.id, **job.options)
+        status, message = PredictionJob.SUCCEEDED, 'Completed successfully.'
+    except Exception as e:
+        status, message = PredictionJob.FAILED, str(e)
+    PredictionJob.objects.filter(id=job.id).update(
+        status=status, finished_at=timezone.now(), heartbeat_at=timezone.now(),
+        message=message, output=out.getvalue(),
+    )
+    job.refresh_from_db()
+    return job
+
+
+def job_to_json(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'createdAt': job.created_at.isoformat(),
+        'startedAt': job.started_at.isoformat() if job.started_at else None,
+        'finishedAt': job.finished_at.isoformat() if job.finished_at else None,
+        'productsPredicted': job.products_predicted,
+        'rowsWritten': job.rows_written,
+        'message': job.message,
+        'summary': job.summary,
+    }
@@ -0,0 +1,116 @@
+# dashboard_app/management/commands/benchmark.py
+
+import json
+import platform
+import random
+import statistics
+import time
+from io import StringIO
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+from dashboard_app.models import Product
+from dashboard_app.synthetic_data import generate_catalog
+
+DEFAULT_SCALES = '1000,10000,100000'
+
+# Keep rendered benchmark charts out of the shared chart cache used by the running site
+BENCHMARK_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-default'},
+    'charts': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-charts'},
+}
+
+
+def _summarize(timings):
+    return {
+        'runs': len(timings),
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+def _time(fn, repeat):
+    timings = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        fn(i)
+        timings.append((time.perf_counter() - started) * 1000)
+    return _summarize(timings)
+
+
+class Command(BaseCommand):
+    help = ('Times run_ml_predictions, the dashboard, chart and product-update endpoints at several '
+            'catalog sizes, each in a throwaway test database, and writes the results as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default=DEFAULT_SCALES, help='Comma-separated catalog sizes (number of SKUs).')
+        parser.add_argument('--days', type=int, default=30, help='Days of history per product.')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic data.')
+        parser.add_argument('--output', default='benchmark_results.json', help='Where to write the JSON results.')
+
+    def handle(self, *args, **options):
+        scales = [int(scale) for scale in options['scales'].split(',') if scale.strip()]
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'days': options['days'],
+            'repeat': options['repeat'],
+            'results': [],
+        }
+        for scale in scales:
+            self.stdout.write(self.style.HTTP_INFO(f'Benchmarking {scale} SKUs x {options["days"]} days...'))
+            # The test client sends requests as 'testserver'
+            with override_settings(CACHES=BENCHMARK_CACHES, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                timings = self._run_scale(scale, options)
+            report['results'].append({'products': scale, 'timings': timings})
+            for name, summary in timings.items():
+                self.stdout.write(f'  {name:<28} median {summary["median_ms"]:10.1f} ms')
+
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote results to {options["output"]}.'))
+
+    def _run_scale(self, scale, options):
+        repeat = options['repeat']
+        # Every scale gets a fresh test database so real data is never touched
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            started = time.perf_counter()
+            generate_catalog(scale, options['days'], seed=options['seed'])
+            timings = {'generate_catalog': _summarize([(time.perf_counter() - started) * 1000])}
+
+            client = Client()
+            client.force_login(User.objects.create_user('benchmark'))
+            rng = random.Random(options['seed'])
+            product_ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:1000])
+            sample = [rng.choice(product_ids) for _ in range(repeat)]
+
+            timings['run_ml_predictions'] = _time(
+                lambda i: call_command('run_ml_predictions', seed=options['seed'], stdout=StringIO()), repeat)
+            timings['dashboard_view'] = _time(lambda i: client.get('/'), repeat)
+            timings['api_get_chart (render)'] = _time(
+                lambda i: client.get(f'/api/chart/{sample[i]}/sales/'), repeat)
+            timings['api_get_chart (cached)'] = _time(
+                lambda i: client.get(f'/api/chart/{sample[i]}/sales/'), repeat)
+            timings['api_update_product'] = _time(
+                lambda i: client.post(
+                    '/api/update_product/',
+                    json.dumps({'id': sample[i], 'currentPrice': 9.99 + i, 'inventory': 10 + i}),
+                    content_type='application/json',
+                ),
+                repeat,
+            )
+            return timings
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
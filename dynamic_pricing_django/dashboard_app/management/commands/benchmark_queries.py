@@ -0,0 +1,103 @@
+# dashboard_app/management/commands/benchmark_queries.py
+
+import statistics
+import time
+from datetime import date, timedelta
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.migrations import AddIndex
+from django.db.migrations.loader import MigrationLoader
+from dashboard_app.models import Product, ProductDailyRecord
+from dashboard_app.synthetic_data import generate_catalog
+
+# Migration that added the query indexes
+QUERY_INDEX_MIGRATION = '0003_query_indexes'
+
+
+def query_indexes():
+    """The indexes added by QUERY_INDEX_MIGRATION, as (model, index) pairs."""
+    migration = MigrationLoader(None, ignore_no_migrations=True).get_migration('dashboard_app', QUERY_INDEX_MIGRATION)
+    return [
+        (apps.get_model('dashboard_app', operation.model_name), operation.index)
+        for operation in migration.operations if isinstance(operation, AddIndex)
+    ]
+
+
+def hot_queries(product_id, category, end_date):
+    """The read queries the application runs most, as (label, queryset) pairs."""
+    week_start = end_date - timedelta(days=6)
+    return [
+        ('chart history (one product)',
+         ProductDailyRecord.objects.filter(product_id=product_id).order_by('date').values_list('date', 'sales_units')),
+        ('history window (one product)',
+         ProductDailyRecord.objects.filter(product_id=product_id, date__range=[week_start, end_date])
+         .order_by('date').values_list('date', 'sales_units', 'inventory_level', 'price_at_day_end')),
+        ('dashboard 7-day window (all products)',
+         ProductDailyRecord.objects.filter(date__range=[week_start, end_date]).order_by()
+         .values_list('product_id', 'date', 'sales_units')),
+        ('product listing page',
+         Product.objects.order_by('name', 'id')[:50]),
+        ('product listing page by category',
+         Product.objects.filter(category=category).order_by('name', 'id')[:50]),
+    ]
+
+
+class Command(BaseCommand):
+    help = ('Shows query plans and timings of the hot queries before and after the query '
+            'indexes, on a generated dataset in a throwaway test database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000, help='Number of synthetic products.')
+        parser.add_argument('--days', type=int, default=90, help='Days of history per product.')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query; the median is reported.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic data.')
+
+    def handle(self, *args, **options):
+        # Work in a separate test database so real data is never touched
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # The rest of the schema stays current (generate_catalog needs it);
+            # only the query indexes are dropped, and recreated after the first pass
+            indexes = query_indexes()
+            with connection.schema_editor() as schema_editor:
+                for model, index in indexes:
+                    schema_editor.remove_index(model, index)
+            self.stdout.write(self.style.HTTP_INFO(
+                f'Generating {options["products"]} products x {options["days"]} days of history...'))
+            end_date = date.today()
+            generate_catalog(options['products'], options['days'], seed=options['seed'], end_date=end_date)
+            product = Product.objects.order_by('id')[options['products'] // 2]
+            queries = lambda: hot_queries(product.id, product.category, end_date)
+
+            before = self._measure('Before indexes', queries(), options['repeat'])
+            with connection.schema_editor() as schema_editor:
+                for model, index in indexes:
+                    schema_editor.add_index(model, index)
+            after = self._measure('After indexes', queries(), options['repeat'])
+
+            self.stdout.write(self.style.SUCCESS('\nSummary (median ms):'))
+            for (label, before_ms), (_, after_ms) in zip(before, after):
+                speedup = before_ms / after_ms if after_ms else float('inf')
+                self.stdout.write(f'  {label:<40} {before_ms:9.3f} -> {after_ms:9.3f}  ({speedup:.1f}x)')
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _measure(self, title, queries, repeat):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(self.style.SUCCESS(f'\n{title}'))
+        results = []
+        for label, queryset in queries:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all()) # .all() clones, so nothing is served from the result cache
+                timings.append((time.perf_counter() - started) * 1000)
+            median_ms = statistics.median(timings)
+            results.append((label, median_ms))
+            self.stdout.write(f'  {label}: {median_ms:.3f} ms')
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f'      {line}')
+        return results
@@ -0,0 +1,53 @@
+# dashboard_app/management/commands/fill_history_gaps.py
+
+from datetime import date, timedelta
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from dashboard_app.chart_cache import invalidate_charts
+from dashboard_app.gap_fill import fill_history_gaps
+
+
+class Command(BaseCommand):
+    help = (
+        'Inserts simulated daily records for every product and day of a date window that has none, '
+        'e.g. after an outage. Existing records are left untouched.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, default=None, help='First day to fill (YYYY-MM-DD).')
+        parser.add_argument(
+            '--end',
+            type=date.fromisoformat,
+            default=None,
+            help='Last day to fill (YYYY-MM-DD, default: yesterday).',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help='Window length in days ending at --end, when --start is not given.',
+        )
+        parser.add_argument(
+            '--product',
+            action='append',
+            dest='product_ids',
+            default=None,
+            help='Only fill this product (repeatable; default: every product).',
+        )
+        parser.add_argument('--seed', type=int, default=None, help='Seed for the simulated values.')
+
+    def handle(self, *args, **options):
+        end = options['end'] or date.today() - timedelta(days=1)
+        start = options['start'] or end - timedelta(days=options['days'] - 1)
+        if start > end:
+            raise CommandError('--start must not be after --end.')
+
+        stats = fill_history_gaps(start, end, product_ids=options['product_ids'], rng=np.random.default_rng(options['seed']))
+        if stats['products']:
+            # Without the full list of filled products, every product's charts are invalidated
+            complete = len(stats['sample_product_ids']) == stats['products']
+            invalidate_charts(stats['sample_product_ids'] if complete else None)
+        self.stdout.write(self.style.SUCCESS(
+            f'Added {stats["records_written"]} daily records for {stats["products"]} products '
+            f'between {start} and {end} in {stats["elapsed"]:.2f}s.'
+        ))
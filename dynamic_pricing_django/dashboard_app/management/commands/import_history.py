@@ -0,0 +1,81 @@
+# dashboard_app/management/commands/import_history.py
+
+import csv
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from dashboard_app.chart_cache import invalidate_charts
+from dashboard_app.history_import import (
+    DEFAULT_CHUNK_SIZE, IMPORT_FIELDS, import_history, iter_csv_rows, iter_parquet_rows,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams daily history from a CSV or Parquet file into ProductDailyRecord with chunked bulk upserts. '
+        f'Columns: {", ".join(IMPORT_FIELDS)}. Bad rows are reported and skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or Parquet file to import ('-' reads CSV from stdin).")
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'parquet'],
+            default=None,
+            help='File format (default: from the file extension, otherwise CSV).',
+        )
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows per bulk upsert/transaction.')
+        parser.add_argument(
+            '--errors-file',
+            default=None,
+            help='Write every rejected row number and reason to this CSV file.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('parquet' if path.lower().endswith(('.parquet', '.pq')) else 'csv')
+
+        errors_file = None
+        on_error = None
+        if options['errors_file']:
+            errors_file = open(options['errors_file'], 'w', newline='')
+            error_writer = csv.writer(errors_file)
+            error_writer.writerow(['row', 'message'])
+            on_error = lambda row_number, message: error_writer.writerow([row_number, message])
+
+        def on_chunk(rows_read, records_written):
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'  {rows_read} rows read, {records_written} records written...')
+
+        source = None
+        try:
+            if file_format == 'parquet':
+                rows = iter_parquet_rows(path, batch_size=options['chunk_size'])
+            elif path == '-':
+                rows = iter_csv_rows(sys.stdin.buffer)
+            else:
+                source = open(path, 'rb')
+                rows = iter_csv_rows(source)
+            stats = import_history(rows, chunk_size=options['chunk_size'], on_error=on_error, on_chunk=on_chunk)
+        except (OSError, ImportError, ValueError) as e:
+            raise CommandError(f'Error while importing history: {e}')
+        finally:
+            if source is not None:
+                source.close()
+            if errors_file is not None:
+                errors_file.close()
+
+        if stats['product_ids']:
+            invalidate_charts(stats['product_ids'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {stats["rows_read"]} rows and wrote {stats["records_written"]} daily records '
+            f'for {len(stats["product_ids"])} products in {stats["elapsed"]:.2f}s '
+            f'({stats["rows_per_second"]:.0f} rows/s).'
+        ))
+        if stats['rows_rejected']:
+            self.stdout.write(self.style.WARNING(f'Rejected {stats["rows_rejected"]} bad rows:'))
+            for error in stats['errors'][:10]:
+                self.stdout.write(self.style.WARNING(f'  row {error["row"]}: {error["message"]}'))
+            if stats['rows_rejected'] > 10:
+                hint = f'see {options["errors_file"]}' if options['errors_file'] else 'use --errors-file for the full list'
+                self.stdout.write(self.style.WARNING(f'  ... and {stats["rows_rejected"] - 10} more ({hint}).'))
@@ -0,0 +1,33 @@
+# dashboard_app/management/commands/prerender_charts.py
+
+from django.core.management.base import BaseCommand
+from dashboard_app.chart_prerender import TOP_PRODUCT_ORDERINGS, prerender_panels, top_products
+
+
+class Command(BaseCommand):
+    help = (
+        'Pre-renders the combined sales/price/inventory chart (/api/charts/<id>/) of the top-N products '
+        'into the chart cache, so reports and email digests never wait for Matplotlib. '
+        'run_ml_predictions --prerender-charts N does the same after a prediction run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=50, help='Number of products to pre-render.')
+        parser.add_argument(
+            '--by',
+            choices=sorted(TOP_PRODUCT_ORDERINGS),
+            default='forecast',
+            help='Rank products by demand forecast or by sales over the last 7 days.',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-render charts that are already cached for the current history.',
+        )
+
+    def handle(self, *args, **options):
+        stats = prerender_panels(top_products(options['top'], by=options['by']), force=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {stats["rendered"]} charts in {stats["elapsed"]:.2f}s '
+            f'({stats["cached"]} already cached, {stats["empty"]} without enough history).'
+        ))
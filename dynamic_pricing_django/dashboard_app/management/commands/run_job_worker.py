@@ -0,0 +1,37 @@
+# dashboard_app/management/commands/run_job_worker.py
+
+import time
+from django.core.management.base import BaseCommand
+from dashboard_app.jobs import claim_next_job, expire_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (e.g. ML prediction runs) from the job table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit as soon as the queue is empty instead of polling for new jobs.',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between queue checks when idle.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            expire_stale_jobs()
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(self.style.HTTP_INFO(f'Running {job}...'))
+            job = run_job(job)
+            style = self.style.SUCCESS if job.status == job.SUCCEEDED else self.style.ERROR
+            self.stdout.write(style(f'{job}: {job.message}'))
@@ -1,10 +1,23 @@
 # dashboard_app/management/commands/run_ml_predictions.py
 
+from django.db import transaction
 from django.core.management.base import BaseCommand, CommandError
-from dashboard_app.models import Product, ProductDailyRecord
-from dashboard_app.ml_logic.ml_model_service import get_ml_predictions, load_or_train_model # Import new functions
-from decimal import Decimal
-import random
+from django.utils import timezone
+from dashboard_app.models import PredictionRun
+from dashboard_app.ml_logic.ml_model_service import BUNDLE_PATH, MODEL_PATH, cents_to_decimal, load_demand_model, predict_batch
+from dashboard_app.bulk_ops import persist_predictions
+from dashboard_app.history import load_history_arrays
+from dashboard_app.chart_cache import invalidate_charts
+from dashboard_app.chart_prerender import prerender_panels, top_products
+from dashboard_app.jobs import report_progress
+from dashboard_app.incremental import changed_product_ids, last_successful_run
+from dashboard_app.aggregates import advance_aggregates
+from dashboard_app.gap_fill import fill_history_gaps
+from dashboard_app.metrics import StageTimer
+from dashboard_app.progress import DEFAULT_PROGRESS_INTERVAL, ProgressReporter
+from dashboard_app.prediction_shards import fetch_catalog, run_sharded_predictions, shard_seeds, split_catalog
+import os
+import numpy as np
 from datetime import date, timedelta
 
 class Command(BaseCommand):
@@ -16,100 +29,302 @@ class Command(BaseCommand):
             action='store_true',
             help='Force retraining of the ML model before making predictions.',
         )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Seed for the simulated pricing noise, for reproducible runs.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Number of products written per database transaction (default: settings.PREDICTION_WRITE_CHUNK_SIZE).',
+        )
+        parser.add_argument(
+            '--global-model',
+            action='store_true',
+            help='Use the single pooled demand model instead of per-product models.',
+        )
+        parser.add_argument(
+            '--jobs',
+            type=int,
+            default=-1,
+            help='Worker processes for training per-product models (-1 uses every core).',
+        )
+        parser.add_argument(
+            '--history-days',
+            type=int,
+            default=None,
+            help='Only use the last N days of history for training (default: all history).',
+        )
+        parser.add_argument(
+            '--job-id',
+            type=int,
+            default=None,
+            help='PredictionJob to report progress to (set by run_job_worker).',
+        )
+        parser.add_argument(
+            '--since-last-run',
+            action='store_true',
+            help='Only re-predict products whose prediction inputs or history changed since the last successful run. '
+                 'sales_last_7_days is an input, and it moves whenever the sales windows roll forward to a new day '
+                 '(dashboard_app.aggregates), so the first run of a day re-predicts most of the catalog.',
+        )
+        parser.add_argument(
+            '--prerender-charts',
+            type=int,
+            default=0,
+            metavar='N',
+            help='After the run, pre-render the combined charts of the N products with the highest demand forecast.',
+        )
+        parser.add_argument(
+            '--progress-interval',
+            type=float,
+            default=DEFAULT_PROGRESS_INTERVAL,
+            help='Seconds between progress lines and job heartbeats (per-row detail needs --verbosity 3).',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes that fetch, predict and persist hash-partitioned shards of the catalog in parallel.',
+        )
+
+    def _load_model(self, options, stages):
+        """
+        Returns (model, version). History is only streamed from the database
+        when there is no saved model to use, or retraining is forced.
+        """
+        per_product = not options['global_model']
+        artifact = BUNDLE_PATH if per_product else MODEL_PATH
+        if not options['retrain'] and os.path.exists(artifact):
+            with stages.stage('load_model'):
+                demand_model, version = load_demand_model(per_product=per_product)
+            if demand_model is not None:
+                return demand_model, version
+
+        # Stream historical data for model training in one query,
+        # grouped per product as NumPy arrays
+        with stages.stage('fetch_history'):
+            history = load_history_arrays(history_days=options['history_days'])
+        self.stdout.write(self.style.SUCCESS(f'Loaded {history.record_count} historical records for {len(history)} products.'))
+        with stages.stage('train_model'):
+            return load_demand_model(history, force_retrain=options['retrain'], per_product=per_product, n_jobs=options['jobs'])
+
+    def _predict(self, run, options, demand_model, catalog, today, stages, progress):
+        """
+        Predicts and persists the whole catalog in this process; returns the
+        `persist_predictions` totals. Each shard of the catalog draws from
+        its own noise stream, as in a sharded run, so --seed gives the same
+        predictions whatever --workers is.
+        """
+        seeds = shard_seeds(options['seed'])
+        # 3. Call the ML service to get predictions
+        try:
+            # One vectorized pass per shard
+            with stages.stage('predict'):
+                shards = [
+                    (shard, shard_catalog, predict_batch(shard_catalog, demand_model, np.random.default_rng(seeds[shard])))
+                    for shard, shard_catalog in split_catalog(catalog)
+                ]
+            predicted = sum(len(batch['id']) for _, _, batch in shards)
+            self.stdout.write(self.style.SUCCESS(f'Generated predictions for {predicted} products.'))
+            progress.set(products_predicted=predicted)
+        except Exception as e:
+            raise CommandError(f'Error during ML prediction: {e}')
+
+        # 4. Write the predictions and today's daily records back in chunked bulk transactions
+        totals = {'products_updated': 0, 'records_written': 0, 'elapsed': 0.0}
+        try:
+            with stages.stage('persist'):
+                for shard, shard_catalog, batch in shards:
+                    done = dict(totals)
+                    stats = persist_predictions(
+                        shard_catalog, batch, today,
+                        chunk_size=options['chunk_size'],
+                        rng=np.random.default_rng(seeds[shard]),
+                        on_chunk=lambda products, records, done=done: progress.set(
+                            products_updated=done['products_updated'] + products,
+                            rows_written=done['products_updated'] + done['records_written'] + products + records,
+                        ),
+                        model_version=run.model_version,
+                    )
+                    for key in totals:
+                        totals[key] += stats[key]
+        except Exception as e:
+            raise CommandError(f'Error while saving predictions: {e}')
+        run.products_predicted = totals['products_updated']
+        rows_written = totals['products_updated'] + totals['records_written']
+        totals['rows_per_second'] = rows_written / totals['elapsed'] if totals['elapsed'] > 0 else float(rows_written)
+        if progress.detailed:
+            for _, _, batch in shards:
+                for product_id, demand, cents in zip(batch['id'], batch['new_demand_forecast'], batch['new_suggested_price_cents']):
+                    progress.detail(f'{product_id}: demand forecast {demand}, suggested price {cents_to_decimal(cents)}.')
+        return totals
+
+    def _predict_sharded(self, run, options, demand_model, product_ids, today, stages, progress):
+        """
+        Predicts and persists the catalog in --workers processes (see
+        dashboard_app.prediction_shards). Returns the aggregated stats, or
+        None if there was nothing to predict.
+        """
+        with stages.stage('sharded_predict'):
+            stats = run_sharded_predictions(
+                demand_model, today, options['workers'],
+                product_ids=product_ids,
+                seed=options['seed'],
+                chunk_size=options['chunk_size'],
+                model_version=run.model_version,
+                on_shard=lambda predicted, products, records: progress.set(
+                    products_predicted=predicted, products_updated=products, rows_written=products + records,
+                ),
+            )
+        if not stats['shards'] and not stats['failures']:
+            self.stdout.write(self.style.WARNING('No products found in the database to run predictions on.'))
+            return None
+
+        run.products_predicted = stats['products_updated']
+        writer = 'the parent process' if stats['writer'] == 'parent' else 'each worker'
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated predictions for {stats["products_predicted"]} products in {len(stats["shards"])} shards '
+            f'on {options["workers"]} workers (written by {writer}).'
+        ))
+        if progress.detailed:
+            for shard in stats['shards']:
+                timings = ', '.join(f'{stage} {seconds:.2f}s' for stage, seconds in shard['timings'].items())
+                progress.detail(f'Shard {shard["shard"]}: {shard["products"]} products ({timings}).')
+        for failure in stats['failures']:
+            self.stderr.write(self.style.ERROR(f'Shard {failure["shard"]} ({failure["products"]} products) failed: {failure["error"]}'))
+
+        rows_written = stats['products_updated'] + stats['records_written']
+        stats['rows_per_second'] = rows_written / stats['elapsed'] if stats['elapsed'] > 0 else float(rows_written)
+        return stats
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Starting ML prediction and daily data logging...'))
 
-        # 1. Fetch all product data needed by the ML model
-        products_for_ml = []
-        for product in Product.objects.all():
-            products_for_ml.append({
-                'id': product.id,
-                'sales_last_7_days': product.sales_last_7_days,
-                'current_price': product.current_price,
-                'competitor_price': product.competitor_price,
-                'margin': product.margin,
+        # Taken before reading anything, so changes made while this run is going
+        # are picked up by the next incremental run
+        run = PredictionRun.objects.create(
+            mode=PredictionRun.INCREMENTAL if options['since_last_run'] else PredictionRun.FULL,
+            started_at=timezone.now(),
+        )
+        stages = StageTimer()
+        progress = ProgressReporter(
+            self.stdout, self.style,
+            verbosity=options['verbosity'], interval=options['progress_interval'], job_id=options['job_id'],
+        )
+        try:
+            self._run(run, options, stages, progress)
+        finally:
+            run.finished_at = timezone.now()
+            run.stage_timings = stages.stages
+            run.save(update_fields=['finished_at', 'succeeded', 'model_version', 'products_predicted', 'stage_timings'])
+            progress.flush()
+            if stages.stages:
+                self.stdout.write(self.style.HTTP_INFO('Stage timings:'))
+                for line in stages.summary():
+                    self.stdout.write(self.style.HTTP_INFO(f'  {line}'))
+            # Bounded whatever the catalog size: a few counters and one entry per stage
+            report_progress(options['job_id'], summary={
+                'mode': run.mode,
+                'succeeded': run.succeeded,
+                **progress.summary(),
+                'stages': stages.stages,
             })
 
-        if not products_for_ml:
-            self.stdout.write(self.style.WARNING('No products found in the database to run predictions on.'))
-            return
-
-        # 2. Fetch all historical data for model training/prediction
-        # Group historical records by product ID
-        historical_records_map = {}
-        for product in Product.objects.all():
-            # Fetch all historical records for each product for training
-            # You might want to limit this to a certain period (e.g., last year) for large datasets
-            records = product.daily_records.all().order_by('date').values('sales_units', 'inventory_level', 'price_at_day_end')
-            historical_records_map[product.id] = list(records)
+    def _run(self, run, options, stages, progress):
+        # Roll the precomputed sales windows (and so sales_last_7_days) forward to yesterday.
+        # One transaction, so record writes cannot slip in between reading and rewriting a window
+        with stages.stage('advance_aggregates'), transaction.atomic():
+            moved = advance_aggregates()
+        if moved:
+            self.stdout.write(self.style.SUCCESS(f'Rolled the sales aggregates of {moved} products forward.'))
 
-        # 3. Call the ML service to get predictions
+        # 1. Load (or train) the model first: its version decides what an incremental run must redo
         try:
-            # Pass historical_records_map to the prediction function
-            predictions = get_ml_predictions(products_for_ml, historical_records_map)
-            self.stdout.write(self.style.SUCCESS(f'Generated predictions for {len(predictions)} products.'))
+            demand_model, run.model_version = self._load_model(options, stages)
         except Exception as e:
-            raise CommandError(f'Error during ML prediction: {e}')
+            raise CommandError(f'Error while loading the ML model: {e}')
 
-        # 4. Update Product objects in the database with new predictions
-        updated_count = 0
-        logged_count = 0
-        today = date.today()
+        changed = None
+        if options['since_last_run']:
+            previous = last_successful_run()
+            if previous is None:
+                self.stdout.write(self.style.WARNING('No previous successful run; predicting every product.'))
+            elif previous.model_version != run.model_version:
+                self.stdout.write(self.style.WARNING('The model changed since the last run; predicting every product.'))
+            else:
+                with stages.stage('select_changed'):
+                    changed = changed_product_ids(previous.started_at)
+                self.stdout.write(self.style.SUCCESS(
+                    f'{len(changed)} products changed since the last run at {previous.started_at:%Y-%m-%d %H:%M:%S}.'
+                ))
+                if not changed:
+                    run.succeeded = True
+                    return
 
-        for prediction in predictions:
-            try:
-                product = Product.objects.get(id=prediction['id'])
-
-                # Update Product object with new ML predictions
-                product.demand_forecast = prediction['new_demand_forecast']
-                product.suggested_price = prediction['new_suggested_price']
-                product.save()
-                updated_count += 1
-
-                # Log Daily Record (simulate daily sales for today's record)
-                # This sales_units value could also come from a real data source or another ML model
-                simulated_daily_sales = max(0, int(round(product.sales_last_7_days / 7 * random.uniform(0.8, 1.2))))
-
-                daily_record, created = ProductDailyRecord.objects.update_or_create(
-                    product=product,
-                    date=today,
-                    defaults={
-                        'sales_units': simulated_daily_sales,
-                        'inventory_level': product.inventory,
-                        'price_at_day_end': product.current_price
-                    }
-                )
-                if created:
-                    self.stdout.write(self.style.SUCCESS(f'  Created new daily record for {product.name} on {today}.'))
-                else:
-                    self.stdout.write(self.style.SUCCESS(f'  Updated daily record for {product.name} on {today}.'))
-                logged_count += 1
-
-            except Product.DoesNotExist:
-                self.stdout.write(self.style.WARNING(f'Product with ID {prediction["id"]} not found in DB. Skipping update and logging.'))
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Failed to update product or log daily record for {prediction["id"]}: {e}'))
-
-        self.stdout.write(self.style.SUCCESS(f'Successfully updated {updated_count} products with new ML predictions.'))
-        self.stdout.write(self.style.SUCCESS(f'Successfully logged {logged_count} daily records.'))
+        product_ids = None if changed is None else sorted(changed)
+        today = date.today()
 
         # --- Optional: Populate historical data for the last few days for better charts ---
-        # This part ensures some initial historical data for training and charts
+        # This part ensures some initial historical data for training and charts.
+        # Done before predicting, so the gaps it fills are not seen as new history next run
         self.stdout.write(self.style.HTTP_INFO('Populating simulated historical data for the last 7 days (if not present)...'))
-        for product in Product.objects.all():
-            for i in range(1, 8): # For last 7 days (Day -1 to Day -7)
-                past_date = today - timedelta(days=i)
-                if not ProductDailyRecord.objects.filter(product=product, date=past_date).exists():
-                    simulated_past_sales = max(0, int(round(product.sales_last_7_days / 7 * random.uniform(0.7, 1.3))))
-                    simulated_past_inventory = max(0, product.inventory + random.randint(-20, 20))
-                    simulated_past_price = product.current_price * Decimal(str(random.uniform(0.98, 1.02)))
-                    ProductDailyRecord.objects.create(
-                        product=product,
-                        date=past_date,
-                        sales_units=simulated_past_sales,
-                        inventory_level=simulated_past_inventory,
-                        price_at_day_end=round(simulated_past_price, 2)
-                    )
-                    self.stdout.write(self.style.HTTP_INFO(f'  Added historical record for {product.name} on {past_date}.'))
-        self.stdout.write(self.style.SUCCESS('Finished populating historical data.'))
+        with stages.stage('backfill'):
+            gaps = fill_history_gaps(
+                today - timedelta(days=7), today - timedelta(days=1),
+                product_ids=product_ids,
+                rng=np.random.default_rng(options['seed']),
+            )
+        progress.set(history_records_added=gaps['records_written'])
+        if progress.detailed:
+            for product_id in gaps['sample_product_ids']:
+                progress.detail(f'Added simulated history for {product_id}.')
+            if gaps['products'] > len(gaps['sample_product_ids']):
+                progress.detail(f'... and {gaps["products"] - len(gaps["sample_product_ids"])} more products.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Finished populating historical data: added {gaps["records_written"]} records '
+            f'for {gaps["products"]} products in {gaps["elapsed"]:.2f}s.'
+        ))
+
+        # 2. Fetch the product data needed by the ML model as columnar arrays (sharded
+        # runs fetch in their workers). Only now: the backfill can move sales_last_7_days,
+        # and the inputs stored with each prediction must be the ones it was made from
+        if options['workers'] > 1:
+            stats = self._predict_sharded(run, options, demand_model, product_ids, today, stages, progress)
+            if stats is None:
+                return
+        else:
+            with stages.stage('fetch_products'):
+                catalog = fetch_catalog(product_ids)
+            if catalog is None:
+                self.stdout.write(self.style.WARNING('No products found in the database to run predictions on.'))
+                return
+            stats = self._predict(run, options, demand_model, catalog, today, stages, progress)
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully updated {stats["products_updated"]} products with new ML predictions.'))
+        self.stdout.write(self.style.SUCCESS(f'Successfully logged {stats["records_written"]} daily records.'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {stats["products_updated"] + stats["records_written"]} rows in {stats["elapsed"]:.2f}s '
+            f'({stats["rows_per_second"]:.0f} rows/s).'
+        ))
+
+        # Drop the cached charts of every product whose history changed
+        with stages.stage('invalidate_charts'):
+            invalidate_charts(product_ids)
+        if stats.get('failures'):
+            raise CommandError(
+                f'{len(stats["failures"])} shards ({sum(failure["products"] for failure in stats["failures"])} products) failed; '
+                'the other shards were saved.'
+            )
+        run.succeeded = True
+
+        if options['prerender_charts'] > 0:
+            with stages.stage('prerender_charts'):
+                chart_stats = prerender_panels(top_products(options['prerender_charts']))
+            self.stdout.write(self.style.SUCCESS(
+                f'Pre-rendered {chart_stats["rendered"]} charts in {chart_stats["elapsed"]:.2f}s '
+                f'({chart_stats["cached"]} already cached).'
+            ))
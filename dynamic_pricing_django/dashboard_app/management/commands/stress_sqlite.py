@@ -0,0 +1,254 @@
+# dashboard_app/management/commands/stress_sqlite.py
+
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from io import StringIO
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from dashboard_app.models import Product
+from dashboard_app.synthetic_data import generate_catalog
+from .benchmark import BENCHMARK_CACHES
+
+# SQLite as Django configures it out of the box: rollback journal, 5 s busy
+# timeout, deferred transactions. The configured profile is compared against it
+DEFAULT_PROFILE_OPTIONS = {'init_command': 'PRAGMA journal_mode=DELETE'}
+
+PROFILE_CHOICES = ('configured', 'default', 'both')
+
+# Pragmas shown for each profile, as read back from a live connection
+REPORTED_PRAGMAS = ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size')
+
+# Default limits on the configured profile's update latency (milliseconds)
+DEFAULT_MAX_WRITE_P95_MS = 1000
+DEFAULT_MAX_WRITE_MS = 2000
+
+
+def _summarize(samples, elapsed):
+    """Counts and latency percentiles of (latency_ms, outcome) samples."""
+    latencies = sorted(latency for latency, _ in samples)
+    outcomes = [outcome for _, outcome in samples]
+    return {
+        'requests': len(samples),
+        'per_second': len(samples) / elapsed if elapsed > 0 else 0.0,
+        'failed': sum(outcome != 'ok' for outcome in outcomes),
+        'locked': outcomes.count('locked'),
+        'median_ms': statistics.median(latencies) if latencies else 0.0,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        'max_ms': latencies[-1] if latencies else 0.0,
+    }
+
+
+class Command(BaseCommand):
+    help = ('Runs a full run_ml_predictions while threads keep reading and updating products through the '
+            'API, in a throwaway SQLite database, and reports read/write latency and "database is locked" '
+            'failures for the configured SQLite profile and for Django\'s defaults. Fails if the configured '
+            'profile\'s updates fail or are slower than --max-write-p95-ms / --max-write-ms.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20000, help='Number of synthetic products.')
+        parser.add_argument('--days', type=int, default=30, help='Days of history per product.')
+        parser.add_argument('--readers', type=int, default=4, help='Threads reading product pages and histories.')
+        parser.add_argument(
+            '--update-interval',
+            type=float,
+            default=0.05,
+            help='Seconds between two api_update_product calls of the updating thread.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='run_ml_predictions --chunk-size: products per write transaction, i.e. how long other writers wait '
+                 '(default: settings.PREDICTION_WRITE_CHUNK_SIZE).',
+        )
+        parser.add_argument(
+            '--max-write-p95-ms',
+            type=float,
+            default=DEFAULT_MAX_WRITE_P95_MS,
+            help='Fail if the 95th percentile update latency of the configured profile exceeds this.',
+        )
+        parser.add_argument(
+            '--max-write-ms',
+            type=float,
+            default=DEFAULT_MAX_WRITE_MS,
+            help='Fail if the slowest update of the configured profile exceeds this.',
+        )
+        parser.add_argument(
+            '--profile',
+            choices=PROFILE_CHOICES,
+            default='both',
+            help="'configured' (settings.DATABASES), 'default' (Django's SQLite defaults) or both.",
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic data and the prediction run.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('stress_sqlite only applies to SQLite databases.')
+
+        profiles = []
+        if options['profile'] in ('configured', 'both'):
+            profiles.append(('configured', dict(connection.settings_dict['OPTIONS'])))
+        if options['profile'] in ('default', 'both'):
+            profiles.append(('default', DEFAULT_PROFILE_OPTIONS))
+
+        # Test databases are files here (not in memory), so every thread's connection shares them
+        directory = tempfile.mkdtemp(prefix='stress_sqlite_')
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                results = [
+                    (name, self._run_profile(name, db_options, os.path.join(directory, f'{name}.sqlite3'), options))
+                    for name, db_options in profiles
+                ]
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        self.stdout.write(self.style.SUCCESS('\nSummary:'))
+        for name, result in results:
+            reads, updates = result['reads'], result['updates']
+            self.stdout.write(
+                f'  {name:<11} run {result["run_seconds"]:7.2f}s {"ok" if result["run_error"] is None else "FAILED"}  '
+                f'reads {reads["requests"]:6d} ({reads["per_second"]:6.1f}/s, max {reads["max_ms"]:8.1f} ms, '
+                f'{reads["failed"]} failed)  updates {updates["requests"]:5d} (max {updates["max_ms"]:8.1f} ms, '
+                f'{updates["failed"]} failed)'
+            )
+
+        # Django's defaults are only shown for comparison; the configured profile must hold up
+        problems = []
+        for name, result in results:
+            if name != 'configured':
+                continue
+            updates = result['updates']
+            if result['run_error'] is not None:
+                problems.append(f'run_ml_predictions failed: {result["run_error"]}')
+            if updates['failed']:
+                problems.append(f'{updates["failed"]} updates failed ({updates["locked"]} locked)')
+            if updates['p95_ms'] > options['max_write_p95_ms']:
+                problems.append(f'update p95 {updates["p95_ms"]:.1f} ms > {options["max_write_p95_ms"]:g} ms')
+            if updates['max_ms'] > options['max_write_ms']:
+                problems.append(f'update max {updates["max_ms"]:.1f} ms > {options["max_write_ms"]:g} ms')
+        if problems:
+            raise CommandError('Configured SQLite profile: ' + '; '.join(problems) + '.')
+
+    def _run_profile(self, name, db_options, path, options):
+        settings_dict = connection.settings_dict
+        saved = settings_dict['OPTIONS'], settings_dict['TEST'].get('NAME'), settings_dict['NAME']
+        settings_dict['OPTIONS'] = db_options
+        settings_dict['TEST']['NAME'] = path
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(self.style.HTTP_INFO(
+                f'\n[{name}] Generating {options["products"]} products x {options["days"]} days of history...'
+            ))
+            generate_catalog(options['products'], options['days'], seed=options['seed'])
+            with connection.cursor() as cursor:
+                pragmas = {}
+                for pragma in REPORTED_PRAGMAS:
+                    cursor.execute(f'PRAGMA {pragma}')
+                    pragmas[pragma] = cursor.fetchone()[0]
+            self.stdout.write('  ' + ', '.join(f'{pragma}={value}' for pragma, value in pragmas.items()))
+
+            result = self._stress(options)
+            self.stdout.write(f'  run_ml_predictions: {result["run_seconds"]:.2f}s'
+                              + ('' if result['run_error'] is None else f', failed: {result["run_error"]}'))
+            for label in ('reads', 'updates'):
+                summary = result[label]
+                self.stdout.write(
+                    f'  {label:<8} {summary["requests"]:6d} requests ({summary["per_second"]:.1f}/s), '
+                    f'median {summary["median_ms"]:.1f} ms, p95 {summary["p95_ms"]:.1f} ms, '
+                    f'max {summary["max_ms"]:.1f} ms, {summary["failed"]} failed ({summary["locked"]} locked)'
+                )
+            return result
+        finally:
+            connection.creation.destroy_test_db(saved[2], verbosity=0)
+            settings_dict['OPTIONS'] = saved[0]
+            settings_dict['TEST']['NAME'] = saved[1]
+
+    def _stress(self, options):
+        user = User.objects.create_user('stress')
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        rng = random.Random(options['seed'])
+        done = threading.Event()
+        lock = threading.Lock()
+        reads = []
+        updates = []
+
+        def record(samples, started, response=None, error=None):
+            latency = (time.perf_counter() - started) * 1000
+            if error is not None:
+                message = str(error)
+            elif response.status_code >= 400:
+                message = response.content.decode(errors='replace')
+            else:
+                message = None
+            outcome = 'ok' if message is None else 'locked' if 'locked' in message else 'error'
+            with lock:
+                samples.append((latency, outcome))
+
+        def client():
+            # Logged in from the main thread, so no session is written during the run
+            c = Client()
+            c.force_login(user)
+            return c
+
+        def read_loop(c, seed):
+            reader_rng = random.Random(seed)
+            try:
+                while not done.is_set():
+                    if reader_rng.random() < 0.5:
+                        url = f'/api/history/{reader_rng.choice(product_ids)}/'
+                    else:
+                        url = '/api/products/?sort=' + reader_rng.choice(('name', 'price', '-forecast'))
+                    started = time.perf_counter()
+                    try:
+                        record(reads, started, response=c.get(url))
+                    except Exception as e:
+                        record(reads, started, error=e)
+            finally:
+                connection.close()
+
+        def update_loop(c):
+            try:
+                while not done.is_set():
+                    data = {'id': rng.choice(product_ids), 'currentPrice': round(rng.uniform(5, 500), 2), 'inventory': rng.randint(0, 500)}
+                    started = time.perf_counter()
+                    try:
+                        record(updates, started, response=c.post('/api/update_product/', data, content_type='application/json'))
+                    except Exception as e:
+                        record(updates, started, error=e)
+                    done.wait(options['update_interval'])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=read_loop, args=(client(), options['seed'] + i)) for i in range(options['readers'])]
+        threads.append(threading.Thread(target=update_loop, args=(client(),)))
+        for thread in threads:
+            thread.start()
+
+        # The full prediction run writes from this thread while the others read and update
+        run_error = None
+        started = time.perf_counter()
+        try:
+            call_command('run_ml_predictions', seed=options['seed'], chunk_size=options['chunk_size'], stdout=StringIO())
+        except Exception as e:
+            run_error = str(e)
+        run_seconds = time.perf_counter() - started
+        done.set()
+        for thread in threads:
+            thread.join()
+
+        return {
+            'run_seconds': run_seconds,
+            'run_error': run_error,
+            'reads': _summarize(reads, run_seconds),
+            'updates': _summarize(updates, run_seconds),
+        }
@@ -0,0 +1,245 @@
+# dashboard_app/metrics.py
+
+import threading
+import time
+from contextlib import contextmanager
+from django.db import connection
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# Upper bounds of the queries-per-request histogram buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+# Metrics recorded in this process: name -> (type, help text, histogram buckets)
+METRICS = {
+    'dashboard_http_requests_total': (
+        'counter', 'HTTP requests handled, by view, method and status code.', None,
+    ),
+    'dashboard_http_request_duration_seconds': (
+        'histogram', 'Time spent producing a response, by view.', LATENCY_BUCKETS,
+    ),
+    'dashboard_db_queries_per_request': (
+        'histogram', 'Database queries run while handling a request, by view.', QUERY_COUNT_BUCKETS,
+    ),
+    'dashboard_chart_cache_requests_total': (
+        'counter', 'Chart cache lookups, by chart type and result (hit or miss).', None,
+    ),
+    'dashboard_chart_render_seconds': (
+        'histogram', 'Time spent rendering a chart PNG, by chart type.', LATENCY_BUCKETS,
+    ),
+    'dashboard_chart_render_rejections_total': (
+        'counter', 'Chart requests answered with a 503, by reason (busy or timeout).', None,
+    ),
+    'dashboard_pipeline_stage_seconds': (
+        'histogram', 'Duration of prediction pipeline stages run in this process, by stage.', LATENCY_BUCKETS,
+    ),
+}
+
+
+class MetricsRegistry:
+    """
+    Thread-safe, in-process counters and histograms. Each process (web
+    worker, job worker) has its own; /api/metrics/ exposes the serving
+    process's values plus the stage timings stored with the last prediction run.
+    Helper processes serving a web process (the 'process' chart render pool)
+    send theirs back with each result (`drain`), and the parent `merge`s them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted((label, str(v)) for label, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted((label, str(v)) for label, v in labels.items())))
+        buckets = METRICS[name][2]
+        with self._lock:
+            # Per-bucket counts (not cumulative), then sum and count
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(buckets) + [0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def drain(self):
+        """Removes and returns everything recorded so far, for another registry's `merge`."""
+        with self._lock:
+            drained = self._counters, self._histograms
+            self._counters, self._histograms = {}, {}
+        return drained
+
+    def merge(self, drained):
+        """Adds the values returned by another registry's `drain` to this one."""
+        counters, histograms = drained
+        with self._lock:
+            for key, value in counters.items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, values in histograms.items():
+                histogram = self._histograms.get(key)
+                self._histograms[key] = list(values) if histogram is None else [a + b for a, b in zip(histogram, values)]
+
+    def render(self, gauges=()):
+        """
+        The metrics in Prometheus text exposition format.
+
+        Args:
+            gauges (iterable): Extra (name, help text, [(labels dict, value)]) gauges.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+
+        lines = []
+        for name, (metric_type, help_text, buckets) in METRICS.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+            if metric_type == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, values):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", _number(bound)),))} {cumulative}')
+                lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {values[-1]}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(values[-2])}')
+                lines.append(f'{name}_count{_labels(labels)} {values[-1]}')
+
+        for name, help_text, samples in gauges:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(tuple(sorted(labels.items())))} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (label, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for label, value in labels
+    )
+    return '{' + ','.join(f'{label}="{value}"' for label, value in escaped) + '}'
+
+
+def _number(value):
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+registry = MetricsRegistry()
+
+
+def inc(name, value=1, **labels):
+    """Adds `value` to a counter of METRICS."""
+    registry.inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    """Records one observation in a histogram of METRICS."""
+    registry.observe(name, value, **labels)
+
+
+@contextmanager
+def timer(name, **labels):
+    """Observes the duration of the `with` block, in seconds, in a histogram of METRICS."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+class QueryCounter:
+    """Database execute wrapper counting the queries run through it."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries():
+    """Counts the queries the current thread's default connection runs inside the block."""
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+class StageTimer:
+    """
+    Times the named stages of a job and counts their queries. Results are
+    kept in `stages` ({stage: {'seconds', 'queries'}}, in run order) and
+    observed in dashboard_pipeline_stage_seconds.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        with count_queries() as queries:
+            try:
+                yield
+            finally:
+                elapsed = time.perf_counter() - started
+                totals = self.stages.setdefault(name, {'seconds': 0.0, 'queries': 0})
+                totals['seconds'] = round(totals['seconds'] + elapsed, 6)
+                totals['queries'] += queries.count
+                observe('dashboard_pipeline_stage_seconds', elapsed, stage=name)
+
+    def summary(self):
+        """One '<stage>: <seconds>s, <queries> queries' line per stage."""
+        width = max((len(name) for name in self.stages), default=0)
+        return [
+            f'{name.ljust(width)}  {totals["seconds"]:8.3f}s  {totals["queries"]:6d} queries'
+            for name, totals in self.stages.items()
+        ]
+
+
+def prediction_run_gauges():
+    """Gauges describing the last finished prediction run, read from PredictionRun."""
+    from .models import PredictionRun
+
+    run = PredictionRun.objects.filter(finished_at__isnull=False).order_by('-started_at').first()
+    if run is None:
+        return []
+    mode = {'mode': run.mode}
+    stages = run.stage_timings or {}
+    return [
+        ('dashboard_prediction_run_finished_timestamp_seconds', 'End time of the last prediction run.',
+         [(mode, run.finished_at.timestamp())]),
+        ('dashboard_prediction_run_duration_seconds', 'Wall time of the last prediction run.',
+         [(mode, (run.finished_at - run.started_at).total_seconds())]),
+        ('dashboard_prediction_run_succeeded', 'Whether the last prediction run succeeded (1) or failed (0).',
+         [(mode, int(run.succeeded))]),
+        ('dashboard_prediction_run_products', 'Products predicted by the last prediction run.',
+         [(mode, run.products_predicted)]),
+        ('dashboard_prediction_run_stage_seconds', 'Duration of each stage of the last prediction run.',
+         [({'stage': stage}, totals['seconds']) for stage, totals in stages.items()]),
+        ('dashboard_prediction_run_stage_queries', 'Database queries run by each stage of the last prediction run.',
+         [({'stage': stage}, totals['queries']) for stage, totals in stages.items()]),
+    ]
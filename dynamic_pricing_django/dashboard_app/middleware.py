@@ -0,0 +1,99 @@
+# dashboard_app/middleware.py
+
+import cProfile
+import io
+import pstats
+import time
+from django.db import connection
+from django.http import FileResponse, HttpResponse
+from .metrics import count_queries, inc, observe
+
+# Sort orders accepted by ?profile=1&profile_sort=...
+PROFILE_SORT_KEYS = ('cumulative', 'tottime', 'calls')
+
+# Functions listed in a profile report
+PROFILE_LINES = 60
+
+
+def _view_name(request):
+    # URL names keep the label set small; unmatched URLs (404s) share one label
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.url_name or match.view_name
+
+
+class RequestMetricsMiddleware:
+    """
+    Records the count, latency and database query count of every request
+    per view (see dashboard_app.metrics). A streamed body (e.g. an export)
+    is produced after the view returns, so its request is recorded when the
+    body has been sent, with the queries run while streaming it.
+    Staff users can add ?profile=1 to any URL to get a cProfile report of
+    the request instead of its response.
+    Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.GET.get('profile') == '1' and request.user.is_staff:
+            return self._profile(request)
+
+        started = time.perf_counter()
+        with count_queries() as queries:
+            response = self.get_response(request)
+
+        def record():
+            view = _view_name(request)
+            inc('dashboard_http_requests_total', view=view, method=request.method, status=response.status_code)
+            observe('dashboard_http_request_duration_seconds', time.perf_counter() - started, view=view)
+            observe('dashboard_db_queries_per_request', queries.count, view=view)
+
+        # File responses stream from disk (and keep wsgi.file_wrapper); async bodies run elsewhere
+        if response.streaming and not response.is_async and not isinstance(response, FileResponse):
+            response.streaming_content = self._counted_stream(response.streaming_content, queries, record)
+        else:
+            record()
+        return response
+
+    @staticmethod
+    def _counted_stream(content, queries, record):
+        """Yields the chunks of a streamed body, counting the queries run to produce them."""
+        iterator = iter(content)
+        try:
+            while True:
+                with connection.execute_wrapper(queries):
+                    chunk = next(iterator, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            # Also when the client disconnects and the server closes the response early
+            record()
+
+    def _profile(self, request):
+        def run():
+            response = self.get_response(request)
+            if response.streaming:
+                # Streamed bodies are produced after the view returns; include them
+                for _ in response.streaming_content:
+                    pass
+            return response
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with count_queries() as queries:
+            response = profiler.runcall(run)
+        elapsed = time.perf_counter() - started
+
+        sort = request.GET.get('profile_sort', 'cumulative')
+        out = io.StringIO()
+        out.write(
+            f'{request.method} {request.get_full_path()} -> {response.status_code} '
+            f'in {elapsed * 1000:.1f} ms, {queries.count} queries\n\n'
+        )
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats(sort if sort in PROFILE_SORT_KEYS else 'cumulative').print_stats(PROFILE_LINES)
+        return HttpResponse(out.getvalue(), content_type='text/plain; charset=utf-8')
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard_app', '0002_productdailyrecord'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'name', 'id'], name='product_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productdailyrecord',
+            index=models.Index(fields=['product', 'date', 'sales_units', 'inventory_level', 'price_at_day_end'], name='dailyrecord_product_date_cov'),
+        ),
+        migrations.AddIndex(
+            model_name='productdailyrecord',
+            index=models.Index(fields=['date', 'product', 'sales_units'], name='dailyrecord_date_product_idx'),
+        ),
+    ]
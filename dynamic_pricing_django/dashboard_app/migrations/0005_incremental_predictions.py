@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard_app', '0004_predictionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PredictionRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(choices=[('full', 'Full'), ('incremental', 'Incremental')], default='full', max_length=12)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('succeeded', models.BooleanField(default=False)),
+                ('model_version', models.CharField(blank=True, max_length=64)),
+                ('products_predicted', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PredictionState',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='prediction_state', serialize=False, to='dashboard_app.product')),
+                ('sales_last_7_days', models.IntegerField()),
+                ('current_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('competitor_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('margin', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('model_version', models.CharField(blank=True, max_length=64)),
+                ('predicted_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='productdailyrecord',
+            name='recorded_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['last_updated'], name='product_last_updated_idx'),
+        ),
+    ]
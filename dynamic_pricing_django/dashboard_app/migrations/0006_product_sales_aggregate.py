@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard_app', '0005_incremental_predictions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSalesAggregate',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sales_aggregate', serialize=False, to='dashboard_app.product')),
+                ('as_of', models.DateField(db_index=True)),
+                ('sales_7', models.IntegerField(default=0)),
+                ('sales_28', models.IntegerField(default=0)),
+                ('sales_90', models.IntegerField(default=0)),
+                ('inventory_7', models.BigIntegerField(default=0)),
+                ('inventory_28', models.BigIntegerField(default=0)),
+                ('inventory_90', models.BigIntegerField(default=0)),
+                ('days_7', models.IntegerField(default=0)),
+                ('days_28', models.IntegerField(default=0)),
+                ('days_90', models.IntegerField(default=0)),
+                ('recent_sales', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
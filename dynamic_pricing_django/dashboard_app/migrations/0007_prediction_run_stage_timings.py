@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard_app', '0006_product_sales_aggregate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictionrun',
+            name='stage_timings',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
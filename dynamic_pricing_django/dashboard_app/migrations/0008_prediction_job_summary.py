@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard_app', '0007_prediction_run_stage_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictionjob',
+            name='summary',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,14 +1,20 @@
 # dashboard_app/ml_logic/ml_model_service.py
 
-import random
 from decimal import Decimal
 import os
 import joblib # For saving and loading scikit-learn models
+from . import model_registry # Keeps loaded models in memory between calls
 import numpy as np
+from joblib import Parallel, delayed
 from sklearn.linear_model import LinearRegression # Our simple ML model
 
 # Define a path to save/load the trained model
 MODEL_PATH = os.path.join(os.path.dirname(__file__), 'demand_forecast_model.joblib')
+# Per-product models (see DemandModelBundle)
+BUNDLE_PATH = os.path.join(os.path.dirname(__file__), 'demand_forecast_bundle.joblib')
+
+def _has_data(historical_data):
+    return historical_data is not None and len(historical_data) > 0
 
 def train_demand_forecast_model(historical_data):
     """
@@ -16,7 +22,8 @@ def train_demand_forecast_model(historical_data):
     In a real scenario, this would use more features and a more complex model.
 
     Args:
-        historical_data (list of dict): List of historical records.
+        historical_data (list of dict or numpy.ndarray): List of historical records,
+                                        or an array of their sales_units.
                                         Each dict should have 'sales_units' and 'demand_forecast'
                                         (or a target variable).
                                         For this simple model, we'll use sales_units as feature
@@ -24,7 +31,7 @@ def train_demand_forecast_model(historical_data):
     Returns:
         sklearn.linear_model.LinearRegression: The trained model.
     """
-    if not historical_data:
+    if not _has_data(historical_data):
         print("No historical data available for training. Skipping model training.")
         return None
 
@@ -33,9 +40,13 @@ def train_demand_forecast_model(historical_data):
     # In a real scenario, you'd have features like promotions, seasonality, etc.
     # Here, we'll just use sales_units to predict a slightly adjusted version of itself
     # to simulate a learning process.
-    X = np.array([d['sales_units'] for d in historical_data]).reshape(-1, 1)
+    if isinstance(historical_data, np.ndarray):
+        sales_units = historical_data.astype(np.float64)
+    else:
+        sales_units = np.array([d['sales_units'] for d in historical_data], dtype=np.float64)
+    X = sales_units.reshape(-1, 1)
     # Simulate a target: next day demand is roughly current sales + some noise
-    y = np.array([d['sales_units'] * random.uniform(0.95, 1.05) for d in historical_data])
+    y = sales_units * np.random.uniform(0.95, 1.05, len(sales_units))
 
     if X.shape[0] < 2: # Need at least 2 samples for LinearRegression
         print("Not enough historical data points to train the model. Skipping training.")
@@ -49,47 +60,226 @@ def train_demand_forecast_model(historical_data):
 def load_or_train_model(historical_data=None, force_retrain=False):
     """
     Loads a pre-trained model or trains a new one if not found/forced.
+    Loading goes through the model registry, so repeated calls in one process
+    reuse the in-memory model until the artifact on disk changes.
     """
     model = None
     if os.path.exists(MODEL_PATH) and not force_retrain:
         try:
-            model = joblib.load(MODEL_PATH)
-            print(f"Loaded demand forecast model from {MODEL_PATH}")
+            model = model_registry.get_model(MODEL_PATH)
         except Exception as e:
             print(f"Error loading model: {e}. Retraining model.")
             model = None # Force retraining if load fails
 
-    if model is None and historical_data:
+    if model is None and _has_data(historical_data):
         print("Model not found or loading failed. Training new model...")
         model = train_demand_forecast_model(historical_data)
         if model:
-            joblib.dump(model, MODEL_PATH)
+            model_registry.save_model(model, MODEL_PATH)
             print(f"Trained and saved new model to {MODEL_PATH}")
-    elif model is None and not historical_data:
+    elif model is None and not _has_data(historical_data):
         print("No historical data provided and no model found. Cannot train.")
 
     return model
 
-def get_ml_predictions(product_data_list, historical_records_map):
+class DemandModelBundle:
+    """
+    One linear demand model per product, stored as compact coefficient arrays,
+    plus the pooled global model for products without a usable model of their own.
+    """
+
+    def __init__(self, product_ids, coef, intercept, global_model=None):
+        order = np.argsort(product_ids)
+        # Sorted fixed-width ids allow a vectorized searchsorted lookup
+        self.product_ids = np.asarray(product_ids, dtype=str)[order]
+        self.coef = np.asarray(coef, dtype=np.float64)[order]
+        self.intercept = np.asarray(intercept, dtype=np.float64)[order]
+        self.global_model = global_model
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def predict_products(self, product_ids, sales):
+        """
+        Predicts demand for many products at once from their sales feature.
+        Products without their own model use the global model (or, lacking
+        one, return their sales unchanged).
+        """
+        product_ids = np.asarray(product_ids, dtype=str)
+        sales = np.asarray(sales, dtype=np.float64)
+        if self.global_model is not None:
+            predicted = np.asarray(self.global_model.predict(sales.reshape(-1, 1)), dtype=np.float64)
+        else:
+            predicted = sales.copy()
+        if len(self.product_ids):
+            position = np.minimum(np.searchsorted(self.product_ids, product_ids), len(self.product_ids) - 1)
+            has_model = self.product_ids[position] == product_ids
+            position = position[has_model]
+            predicted[has_model] = self.coef[position] * sales[has_model] + self.intercept[position]
+        return predicted
+
+
+# Products need this many history points for a model of their own
+MIN_PRODUCT_SAMPLES = 2
+
+# Shards the history is split into for training, whatever the number of
+# workers: each shard seeds its own training target, so a seeded training
+# gives the same models with any n_jobs
+TRAINING_SHARDS = 64
+
+def _fit_product_shard(sales_units, offsets, seed):
+    """
+    Fits one least-squares line per product for a contiguous shard of products.
+    With a single feature this is exactly what LinearRegression computes, done
+    for every product at once with segment reductions over the shard's arrays.
+
+    Args:
+        sales_units (numpy.ndarray): The shard's sales, grouped by product.
+        offsets (numpy.ndarray): Product boundaries within `sales_units` (length products + 1).
+        seed: Seed for the simulated training target.
+
+    Returns:
+        tuple of numpy.ndarray: coef, intercept and a mask of products that got a model.
+    """
+    x = sales_units.astype(np.float64)
+    # Simulate a target: next day demand is roughly current sales + some noise
+    y = x * np.random.default_rng(seed).uniform(0.95, 1.05, len(x))
+    counts = np.diff(offsets)
+    starts = offsets[:-1]
+    mean_x = np.add.reduceat(x, starts) / counts
+    mean_y = np.add.reduceat(y, starts) / counts
+    dx = x - np.repeat(mean_x, counts)
+    dy = y - np.repeat(mean_y, counts)
+    var_x = np.add.reduceat(dx * dx, starts)
+    cov_xy = np.add.reduceat(dx * dy, starts)
+
+    # Constant sales carry no slope information; those products use the global model
+    fitted = (counts >= MIN_PRODUCT_SAMPLES) & (var_x > 1e-12)
+    coef = np.divide(cov_xy, var_x, out=np.zeros_like(cov_xy), where=fitted)
+    intercept = np.where(fitted, mean_y - coef * mean_x, 0.0)
+    return coef, intercept, fitted
+
+def _shard_bounds(offsets, n_shards):
+    """Splits products into up to `n_shards` contiguous ranges with similar record counts."""
+    targets = np.linspace(0, offsets[-1], n_shards + 1)[1:-1]
+    cuts = np.unique(np.concatenate(([0], np.searchsorted(offsets, targets), [len(offsets) - 1])))
+    return list(zip(cuts[:-1], cuts[1:]))
+
+def train_product_models(history, n_jobs=-1, seed=None):
+    """
+    Trains a demand model per product, in parallel across cores.
+    Each worker receives a contiguous shard of the flat history arrays
+    (no per-record Python objects), and the results are packed into one
+    compact DemandModelBundle together with a pooled global model.
+
+    Args:
+        history (HistoryArrays): Grouped daily history.
+        n_jobs (int): Worker processes, as in joblib (-1 uses every core).
+        seed (int, optional): Seed for the simulated training target.
+
+    Returns:
+        DemandModelBundle: The trained models, or None without history.
+    """
+    if len(history) == 0:
+        print("No historical data available for training. Skipping model training.")
+        return None
+
+    sales_units = history.columns['sales_units']
+    offsets = history.offsets
+    workers = joblib.effective_n_jobs(n_jobs)
+    shards = [(a, b) for a, b in _shard_bounds(offsets, TRAINING_SHARDS) if b > a]
+    seeds = np.random.SeedSequence(seed).spawn(len(shards))
+
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_product_shard)(sales_units[offsets[a]:offsets[b]], offsets[a:b + 1] - offsets[a], shard_seed)
+        for (a, b), shard_seed in zip(shards, seeds)
+    )
+    coef = np.concatenate([r[0] for r in results])
+    intercept = np.concatenate([r[1] for r in results])
+    fitted = np.concatenate([r[2] for r in results])
+
+    bundle = DemandModelBundle(
+        history.product_ids[fitted], coef[fitted], intercept[fitted],
+        global_model=train_demand_forecast_model(sales_units),
+    )
+    print(f"Trained {len(bundle)} per-product demand models on {len(shards)} shards using {workers} workers.")
+    return bundle
+
+def load_or_train_product_models(history=None, force_retrain=False, n_jobs=-1):
+    """
+    Loads the per-product model bundle, or trains and saves a new one if not found/forced.
+    The bundle comes from the model registry, with its coefficient arrays
+    memory-mapped so worker processes share one copy.
+    """
+    bundle = None
+    if os.path.exists(BUNDLE_PATH) and not force_retrain:
+        try:
+            bundle = model_registry.get_model(BUNDLE_PATH)
+        except Exception as e:
+            print(f"Error loading model bundle: {e}. Retraining models.")
+            bundle = None
+
+    if bundle is None and history is not None and len(history):
+        bundle = train_product_models(history, n_jobs=n_jobs)
+        if bundle:
+            model_registry.save_model(bundle, BUNDLE_PATH)
+            print(f"Trained and saved per-product models to {BUNDLE_PATH}")
+    elif bundle is None:
+        print("No historical data provided and no model bundle found. Cannot train.")
+
+    return bundle
+
+# Margin the suggested price must never fall below
+TARGET_MARGIN = Decimal('0.30')
+
+
+def draw_pricing_noise(n, rng):
+    """
+    Draws every random factor the pricing logic may use for `n` products.
+    The scalar and batch paths both consume these arrays, so they produce
+    identical results for the same seed.
+
+    Args:
+        n (int): Number of products.
+        rng (numpy.random.Generator): Source of randomness.
+
+    Returns:
+        dict of numpy.ndarray: One array of factors per simulated effect.
+    """
+    return {
+        'fallback': rng.uniform(0.9, 1.1, n),
+        'model': rng.uniform(0.95, 1.05, n),
+        'demand_up': rng.uniform(1.01, 1.05, n),
+        'demand_down': rng.uniform(0.95, 0.99, n),
+    }
+
+def _flatten_history(historical_records_map):
+    all_historical_data = []
+    for product_id in historical_records_map:
+        all_historical_data.extend(historical_records_map[product_id])
+    return all_historical_data
+
+def get_ml_predictions(product_data_list, historical_records_map, seed=None):
     """
     Generates demand forecasts and suggested prices using a trained ML model.
+    This is the scalar (one product at a time, Decimal) reference path; see
+    `get_ml_predictions_batch` for the vectorized engine used on full catalogs.
 
     Args:
         product_data_list (list of dict): Current product data.
         historical_records_map (dict): A map of product_id to its list of historical daily records.
+        seed (int, optional): Seed for the simulated noise, for reproducible runs.
 
     Returns:
         list of dict: Predictions for each product.
     """
     predictions = []
     # Load or train the model using all available historical data
-    all_historical_data = []
-    for product_id in historical_records_map:
-        all_historical_data.extend(historical_records_map[product_id])
-
-    demand_model = load_or_train_model(all_historical_data)
+    demand_model = load_or_train_model(_flatten_history(historical_records_map))
+    noise = draw_pricing_noise(len(product_data_list), np.random.default_rng(seed))
+    failed_predictions = 0
 
-    for product in product_data_list:
+    for i, product in enumerate(product_data_list):
         product_id = product['id']
         sales_7_days = product['sales_last_7_days']
         current_price = product['current_price']
@@ -97,35 +287,35 @@ def get_ml_predictions(product_data_list, historical_records_map):
         margin = product['margin']
 
         # --- Demand Forecasting Logic (using ML model if available) ---
-        new_demand_forecast = int(round(sales_7_days * random.uniform(0.9, 1.1))) # Fallback to old simulation
+        new_demand_forecast = int(round(sales_7_days * float(noise['fallback'][i]))) # Fallback to old simulation
         if demand_model and sales_7_days is not None:
             try:
                 # Predict demand based on sales_last_7_days as a feature
                 # In a real model, you'd use more sophisticated features
                 predicted_demand = demand_model.predict(np.array([[sales_7_days]]))
-                new_demand_forecast = int(round(max(0, predicted_demand[0])))
+                new_demand_forecast = int(round(max(0, float(predicted_demand[0]))))
                 # Add some noise to the ML prediction for simulation realism
-                new_demand_forecast = int(round(new_demand_forecast * random.uniform(0.95, 1.05)))
+                new_demand_forecast = int(round(new_demand_forecast * float(noise['model'][i])))
             except Exception as e:
-                print(f"Error predicting demand for {product_id} with ML model: {e}. Using fallback simulation.")
-                new_demand_forecast = int(round(sales_7_days * random.uniform(0.9, 1.1)))
+                # Reported once after the loop, not per product
+                failed_predictions += 1
+                last_prediction_error = e
+                new_demand_forecast = int(round(sales_7_days * float(noise['fallback'][i])))
 
 
         # --- Dynamic Pricing Logic (still simulated for now) ---
-        min_acceptable_price = current_price / (Decimal('1') - margin)
-        target_margin = Decimal('0.30')
         base_suggested_price = current_price
 
         if new_demand_forecast > sales_7_days * 1.1:
-            base_suggested_price *= Decimal(str(random.uniform(1.01, 1.05)))
+            base_suggested_price *= Decimal(str(float(noise['demand_up'][i])))
         elif new_demand_forecast < sales_7_days * 0.9:
-            base_suggested_price *= Decimal(str(random.uniform(0.95, 0.99)))
+            base_suggested_price *= Decimal(str(float(noise['demand_down'][i])))
 
         if competitor_price > 0 and abs(current_price - competitor_price) / current_price < Decimal('0.10'):
             base_suggested_price = (base_suggested_price + competitor_price) / Decimal('2')
 
         cost_of_goods = current_price * (Decimal('1') - margin)
-        min_price_for_target_margin = cost_of_goods / (Decimal('1') - target_margin)
+        min_price_for_target_margin = cost_of_goods / (Decimal('1') - TARGET_MARGIN)
 
         new_suggested_price = max(base_suggested_price, min_price_for_target_margin)
         new_suggested_price = round(new_suggested_price, 2)
@@ -136,8 +326,158 @@ def get_ml_predictions(product_data_list, historical_records_map):
             'new_suggested_price': new_suggested_price
         })
 
+    if failed_predictions:
+        print(f"Error predicting demand with ML model for {failed_predictions} products (last error: {last_prediction_error}). Used fallback simulation.")
     return predictions
 
+def build_catalog(product_data_list):
+    """
+    Converts a list of product dicts (as used by `get_ml_predictions`) into the
+    columnar catalog expected by `predict_batch`.
+    """
+    return {
+        'id': np.array([p['id'] for p in product_data_list], dtype=object),
+        'sales_last_7_days': np.array([p['sales_last_7_days'] for p in product_data_list], dtype=np.float64),
+        'current_price': np.array([p['current_price'] for p in product_data_list], dtype=np.float64),
+        'competitor_price': np.array([p['competitor_price'] for p in product_data_list], dtype=np.float64),
+        'margin': np.array([p['margin'] for p in product_data_list], dtype=np.float64),
+    }
+
+def _to_cents(prices):
+    # Prices are stored with two decimals, so scaling and rounding recovers them exactly.
+    return np.rint(prices * 100)
+
+def quantize_cents(prices):
+    """
+    Rounds float prices to whole cents, half-to-even like `round(Decimal, 2)`.
+    Rounding to 6 places first removes binary noise so that exact half-cent
+    ties (e.g. 132.495) are treated as ties, as they are in Decimal.
+    """
+    return np.rint(np.round(prices * 100, 6)).astype(np.int64)
+
+def predict_batch(catalog, demand_model, rng=None):
+    """
+    Vectorized demand forecasting and pricing for a whole catalog.
+    Makes a single `predict` call and computes the pricing rules as array
+    operations in float64, quantizing to cents only at the end.
+
+    Args:
+        catalog (dict of numpy.ndarray): Columns 'id', 'sales_last_7_days',
+                                         'current_price', 'competitor_price' and 'margin'.
+        demand_model: A DemandModelBundle, a fitted model with a `predict` method, or None.
+        rng (numpy.random.Generator, optional): Source of the simulated noise.
+
+    Returns:
+        dict of numpy.ndarray: 'id', 'new_demand_forecast' (int64) and
+                               'new_suggested_price_cents' (int64).
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    ids = catalog['id']
+    sales = np.asarray(catalog['sales_last_7_days'], dtype=np.float64)
+    current_price = np.asarray(catalog['current_price'], dtype=np.float64)
+    competitor_price = np.asarray(catalog['competitor_price'], dtype=np.float64)
+    margin = np.asarray(catalog['margin'], dtype=np.float64)
+    noise = draw_pricing_noise(len(ids), rng)
+
+    # --- Demand Forecasting ---
+    new_demand_forecast = np.rint(sales * noise['fallback'])
+    if demand_model and len(ids):
+        try:
+            if isinstance(demand_model, DemandModelBundle):
+                predicted_demand = demand_model.predict_products(ids, sales)
+            else:
+                predicted_demand = demand_model.predict(sales.reshape(-1, 1))
+            new_demand_forecast = np.rint(np.rint(np.maximum(predicted_demand, 0)) * noise['model'])
+        except Exception as e:
+            print(f"Error predicting demand with ML model: {e}. Using fallback simulation.")
+    new_demand_forecast = new_demand_forecast.astype(np.int64)
+
+    # --- Dynamic Pricing ---
+    base_suggested_price = current_price.copy()
+    demand_up = new_demand_forecast > sales * 1.1
+    demand_down = ~demand_up & (new_demand_forecast < sales * 0.9)
+    base_suggested_price[demand_up] *= noise['demand_up'][demand_up]
+    base_suggested_price[demand_down] *= noise['demand_down'][demand_down]
+
+    # Compare in integer cents so the 10% boundary behaves exactly as in Decimal
+    current_cents = _to_cents(current_price)
+    competitor_cents = _to_cents(competitor_price)
+    close_to_competitor = (competitor_cents > 0) & (np.abs(current_cents - competitor_cents) * 10 < current_cents)
+    base_suggested_price = np.where(close_to_competitor, (base_suggested_price + competitor_price) / 2, base_suggested_price)
+
+    cost_of_goods = current_price * (1 - margin)
+    min_price_for_target_margin = cost_of_goods / (1 - float(TARGET_MARGIN))
+    new_suggested_price = np.maximum(base_suggested_price, min_price_for_target_margin)
+
+    return {
+        'id': ids,
+        'new_demand_forecast': new_demand_forecast,
+        'new_suggested_price_cents': quantize_cents(new_suggested_price),
+    }
+
+def cents_to_decimal(cents):
+    """Converts an integer number of cents into a two-place Decimal price."""
+    return Decimal(int(cents)).scaleb(-2)
+
+def batch_to_predictions(batch):
+    """
+    Expands a `predict_batch` result into the list-of-dicts format returned
+    by `get_ml_predictions`, with Decimal prices.
+    """
+    return [
+        {
+            'id': product_id,
+            'new_demand_forecast': int(demand),
+            'new_suggested_price': cents_to_decimal(cents),
+        }
+        for product_id, demand, cents in zip(batch['id'], batch['new_demand_forecast'], batch['new_suggested_price_cents'])
+    ]
+
+def get_ml_predictions_batch(catalog, history, seed=None, force_retrain=False, per_product=False, n_jobs=-1):
+    """
+    Batch counterpart of `get_ml_predictions`: loads (or trains) the model and
+    runs `predict_batch` over the columnar catalog.
+
+    Args:
+        catalog (dict of numpy.ndarray): See `predict_batch`.
+        history (HistoryArrays): Grouped daily history; training data.
+        seed (int, optional): Seed for the simulated noise.
+        force_retrain (bool): Retrain even if a saved model exists.
+        per_product (bool): Use per-product models instead of the pooled global model.
+        n_jobs (int): Training workers for per-product models (-1 uses every core).
+    """
+    demand_model, _ = load_demand_model(history, force_retrain=force_retrain, per_product=per_product, n_jobs=n_jobs)
+    return predict_batch(catalog, demand_model, np.random.default_rng(seed))
+
+def load_demand_model(history=None, force_retrain=False, per_product=False, n_jobs=-1):
+    """
+    Loads (or trains) the demand model `get_ml_predictions_batch` would use,
+    together with its version.
+
+    Args:
+        history (HistoryArrays, optional): Training data, only needed if there is
+                                           no saved model or retraining is forced.
+        force_retrain (bool): Retrain even if a saved model exists.
+        per_product (bool): Use per-product models instead of the pooled global model.
+        n_jobs (int): Training workers for per-product models (-1 uses every core).
+
+    Returns:
+        tuple: (model or None, version) where version is the content hash of the
+               model artifact, or '' if there is no model.
+    """
+    if per_product:
+        demand_model = load_or_train_product_models(history, force_retrain=force_retrain, n_jobs=n_jobs)
+        path = BUNDLE_PATH
+    else:
+        training_data = history.columns['sales_units'] if history is not None else None
+        demand_model = load_or_train_model(training_data, force_retrain=force_retrain)
+        path = MODEL_PATH
+    if demand_model is None:
+        return None, ''
+    return demand_model, model_registry.get_version(path) or ''
+
 if __name__ == '__main__':
     # Example usage for testing the service directly
     # To test, you'd need to simulate historical data
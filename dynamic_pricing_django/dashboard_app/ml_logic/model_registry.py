@@ -0,0 +1,104 @@
+# dashboard_app/ml_logic/model_registry.py
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import joblib
+
+# Memory-map NumPy arrays inside model artifacts: the pages are shared through
+# the OS page cache, so every worker process maps one copy of large model arrays.
+DEFAULT_MMAP_MODE = 'r'
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_entries = {} # path -> {'stat': (mtime_ns, size), 'sha256': str, 'model': object}
+
+
+def _stat_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_model(path, mmap_mode=DEFAULT_MMAP_MODE):
+    """
+    Returns the model stored at `path`, loading it from disk only when needed.
+    The loaded model is kept in memory for the life of the process and reused
+    while the artifact's mtime and size are unchanged. If they change but the
+    content hash does not (e.g. the file was touched or copied over), the
+    in-memory model is kept as well. Hashing and loading read the whole file,
+    so they run without the registry lock: other threads keep getting their
+    models meanwhile, and the result is swapped in under the lock.
+
+    Raises:
+        FileNotFoundError: If there is no artifact at `path`.
+        Exception: Whatever joblib raises for an unreadable artifact.
+    """
+    path = os.path.abspath(path)
+    signature = _stat_signature(path)
+    with _lock:
+        entry = _entries.get(path)
+    if entry is not None and entry['stat'] == signature:
+        return entry['model']
+
+    content_hash = _file_hash(path)
+    if entry is not None and entry['sha256'] == content_hash:
+        model = entry['model']
+    else:
+        model = joblib.load(path, mmap_mode=mmap_mode)
+        logger.info('Loaded model artifact %s (sha256 %s) into the model registry.', path, content_hash)
+    with _lock:
+        # Unless another thread registered a model for this path in the meantime
+        if _entries.get(path) is entry:
+            _entries[path] = {'stat': signature, 'sha256': content_hash, 'model': model}
+    return model
+
+
+def save_model(model, path):
+    """
+    Writes a model artifact (uncompressed, so it can be memory-mapped) and
+    registers the in-memory object, so this process does not reload it.
+    The file is written next to the artifact and renamed over it: processes
+    that memory-mapped the previous version keep reading it unchanged.
+    """
+    path = os.path.abspath(path)
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        joblib.dump(model, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    entry = {'stat': _stat_signature(path), 'sha256': _file_hash(path), 'model': model}
+    with _lock:
+        _entries[path] = entry
+
+
+def get_version(path):
+    """
+    Content hash of the artifact at `path` as currently held by the registry,
+    or None if it has not been loaded or saved in this process.
+    """
+    with _lock:
+        entry = _entries.get(os.path.abspath(path))
+        return entry['sha256'] if entry is not None else None
+
+
+def clear(path=None):
+    """Drops one cached model (or all of them); the next get_model reloads from disk."""
+    with _lock:
+        if path is None:
+            _entries.clear()
+        else:
+            _entries.pop(os.path.abspath(path), None)
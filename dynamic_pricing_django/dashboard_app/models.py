@@ -1,8 +1,25 @@
 # dashboard_app/models.py
 
+from decimal import Decimal
+from django.conf import settings
 from django.db import models
+from django.db.models import F
 from django.utils import timezone # Import timezone for default datetime
 
+# A product is low on stock when its inventory is below this share of its demand forecast
+LOW_STOCK_RATIO = Decimal('0.5')
+
+
+class ProductQuerySet(models.QuerySet):
+    """Stock-status filters matching Product.is_low_stock / is_out_of_stock."""
+
+    def low_stock(self):
+        return self.filter(inventory__gt=0, inventory__lt=F('demand_forecast') * LOW_STOCK_RATIO)
+
+    def out_of_stock(self):
+        return self.filter(inventory=0)
+
+
 class Product(models.Model):
     # Unique identifier for the product
     id = models.CharField(max_length=50, primary_key=True)
@@ -18,7 +35,8 @@ class Product(models.Model):
     inventory = models.IntegerField()
     # Forecasted demand for the next 7 days
     demand_forecast = models.IntegerField()
-    # Number of units sold in the last 7 days (this will become a derived/summary field later)
+    # Number of units sold in the last 7 complete days. Derived from the daily records
+    # (ProductSalesAggregate.sales_7) once the product has any
     sales_last_7_days = models.IntegerField()
     # Profit margin (e.g., 0.35 for 35%)
     margin = models.DecimalField(max_digits=5, decimal_places=2)
@@ -27,13 +45,32 @@ class Product(models.Model):
     # Timestamp of the last update to this product record
     last_updated = models.DateTimeField(auto_now=True) # Automatically updates on each save
 
+    objects = ProductQuerySet.as_manager()
+
     def __str__(self):
         """String representation of the Product object."""
         return self.name
 
+    @property
+    def is_low_stock(self):
+        """In stock, but below LOW_STOCK_RATIO of the demand forecast."""
+        return 0 < self.inventory < self.demand_forecast * LOW_STOCK_RATIO
+
+    @property
+    def is_out_of_stock(self):
+        return self.inventory == 0
+
     class Meta:
         """Meta options for the Product model."""
         verbose_name_plural = "Products" # Makes the model name plural in Django Admin
+        indexes = [
+            # Listing order (and keyset pagination) of the dashboard and /api/products/
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            # Category filter, already in listing order
+            models.Index(fields=['category', 'name', 'id'], name='product_category_idx'),
+            # Incremental prediction runs look for products changed since the last run
+            models.Index(fields=['last_updated'], name='product_last_updated_idx'),
+        ]
 
 
 class ProductDailyRecord(models.Model):
@@ -46,12 +83,151 @@ class ProductDailyRecord(models.Model):
     sales_units = models.IntegerField(default=0) # Units sold on this specific day
     inventory_level = models.IntegerField(default=0) # Inventory level at end of day
     price_at_day_end = models.DecimalField(max_digits=10, decimal_places=2, default=0.00) # Price at end of day
+    recorded_at = models.DateTimeField(auto_now=True, db_index=True) # When this record was last written
 
     class Meta:
         """Meta options for the ProductDailyRecord model."""
         unique_together = ('product', 'date') # Ensure only one record per product per day
         ordering = ['date'] # Order records by date by default
         verbose_name_plural = "Product Daily Records"
+        indexes = [
+            # Covers per-product history reads (charts, training) by carrying the value
+            # columns in the index itself. Index.include is PostgreSQL-only, so the columns
+            # are appended to the key instead, which SQLite can also use as a covering index.
+            models.Index(
+                fields=['product', 'date', 'sales_units', 'inventory_level', 'price_at_day_end'],
+                name='dailyrecord_product_date_cov',
+            ),
+            # Date-window reads across all products (rolling the sales aggregates forward)
+            models.Index(fields=['date', 'product', 'sales_units'], name='dailyrecord_date_product_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} on {self.date}: Sales={self.sales_units}, Inv={self.inventory_level}"
+
+
+class ProductSalesAggregate(models.Model):
+    """
+    Rolling sales and inventory totals of a product over its last 7, 28 and 90
+    complete days (the windows end at `as_of`, normally yesterday). Kept up to
+    date by dashboard_app.aggregates whenever daily records are written, so
+    readers never scan history.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='sales_aggregate')
+    as_of = models.DateField(db_index=True) # Last day included in the windows
+    sales_7 = models.IntegerField(default=0)
+    sales_28 = models.IntegerField(default=0)
+    sales_90 = models.IntegerField(default=0)
+    # Sums of end-of-day inventory over the days with a record
+    inventory_7 = models.BigIntegerField(default=0)
+    inventory_28 = models.BigIntegerField(default=0)
+    inventory_90 = models.BigIntegerField(default=0)
+    # Days with a record in each window
+    days_7 = models.IntegerField(default=0)
+    days_28 = models.IntegerField(default=0)
+    days_90 = models.IntegerField(default=0)
+    recent_sales = models.JSONField(default=list) # Daily sales of the 7 days ending at as_of, oldest first
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Sales aggregate of {self.product_id} as of {self.as_of}"
+
+    def average_daily_sales(self, days=7):
+        """Average units sold per day over the 7, 28 or 90 day window (days without a record count as 0)."""
+        return getattr(self, f'sales_{days}') / days
+
+    def inventory_turnover(self, days=28):
+        """Units sold over the window divided by the average end-of-day inventory, or None without inventory."""
+        recorded_days = getattr(self, f'days_{days}')
+        inventory = getattr(self, f'inventory_{days}')
+        if not recorded_days or not inventory:
+            return None
+        return getattr(self, f'sales_{days}') / (inventory / recorded_days)
+
+
+class PredictionRun(models.Model):
+    """
+    One execution of run_ml_predictions. The start time of the last successful
+    run is the high-water mark for incremental (--since-last-run) runs.
+    """
+    FULL = 'full'
+    INCREMENTAL = 'incremental'
+
+    mode = models.CharField(max_length=12, choices=[(FULL, 'Full'), (INCREMENTAL, 'Incremental')], default=FULL)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    succeeded = models.BooleanField(default=False)
+    model_version = models.CharField(max_length=64, blank=True) # Content hash of the model artifact used
+    products_predicted = models.IntegerField(default=0)
+    stage_timings = models.JSONField(default=dict, blank=True) # {stage: {'seconds': ..., 'queries': ...}}
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"{self.mode} run at {self.started_at}"
+
+
+class PredictionState(models.Model):
+    """
+    The inputs a product's current prediction was computed from, so that
+    incremental runs can tell whether it needs to be recomputed.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='prediction_state')
+    sales_last_7_days = models.IntegerField()
+    current_price = models.DecimalField(max_digits=10, decimal_places=2)
+    competitor_price = models.DecimalField(max_digits=10, decimal_places=2)
+    margin = models.DecimalField(max_digits=5, decimal_places=2)
+    model_version = models.CharField(max_length=64, blank=True)
+    predicted_at = models.DateTimeField() # Written after the run's daily record for the product
+
+    def __str__(self):
+        return f"Prediction state of {self.product_id}"
+
+
+class PredictionJob(models.Model):
+    """
+    A background run of a management command (e.g. run_ml_predictions),
+    queued by the API and executed by a `run_job_worker` process.
+    The database table is the queue, so no external broker is needed.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+    ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+    kind = models.CharField(max_length=50, default='run_ml_predictions') # Management command to run
+    options = models.JSONField(default=dict, blank=True) # Options passed to the command
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True) # Last progress report of the running worker
+    # Progress counters, updated by the command while it runs
+    products_predicted = models.IntegerField(default=0)
+    rows_written = models.IntegerField(default=0)
+    message = models.TextField(blank=True) # Error or completion message
+    output = models.TextField(blank=True) # Tail of the command's output
+    summary = models.JSONField(default=dict, blank=True) # Final counters and stage timings reported by the command
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            # At most one queued/running job per kind: concurrent triggers share it
+            models.UniqueConstraint(
+                fields=['kind'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='one_active_job_per_kind',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
@@ -0,0 +1,202 @@
+# dashboard_app/prediction_shards.py
+
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import django
+import numpy as np
+from django.db import connection, connections
+from .models import Product
+from .bulk_ops import SINGLE_WRITER_VENDORS, persist_predictions
+from .ml_logic.ml_model_service import predict_batch
+
+# Product ids per query when fetching a subset of the catalog (SQLite caps query parameters)
+ID_BATCH_SIZE = 500
+
+# Shards the catalog is split into, whatever the number of workers. Each
+# shard draws its noise from its own seeded stream, so a seeded run predicts
+# the same with any --workers. Several shards per worker balance the load and,
+# with a single writer, let it start writing while the other shards still predict
+SHARD_COUNT = 32
+
+
+def fetch_catalog(product_ids=None):
+    """
+    Product data needed by the ML model as columnar arrays, in id order.
+
+    Args:
+        product_ids (iterable, optional): Products to fetch (default: every product).
+
+    Returns:
+        dict of numpy.ndarray or None: See `predict_batch`; None if no product was found.
+    """
+    fields = ('id', 'sales_last_7_days', 'current_price', 'competitor_price', 'margin', 'inventory')
+    if product_ids is None:
+        rows = list(Product.objects.order_by('id').values_list(*fields))
+    else:
+        product_ids = sorted(product_ids)
+        rows = []
+        for start in range(0, len(product_ids), ID_BATCH_SIZE):
+            rows.extend(Product.objects.filter(id__in=product_ids[start:start + ID_BATCH_SIZE]).order_by('id').values_list(*fields))
+    if not rows:
+        return None
+
+    ids, sales_7_days, current_prices, competitor_prices, margins, inventories = zip(*rows)
+    return {
+        'id': np.array(ids, dtype=object),
+        'sales_last_7_days': np.array(sales_7_days, dtype=np.float64),
+        'current_price': np.array(current_prices, dtype=np.float64),
+        'competitor_price': np.array(competitor_prices, dtype=np.float64),
+        'margin': np.array(margins, dtype=np.float64),
+        'inventory': np.array(inventories, dtype=np.int64),
+    }
+
+
+def shard_of(product_id, n_shards):
+    """
+    Shard (0 to n_shards - 1) of a product: the CRC-32 of its id, split into
+    n_shards equal ranges. Unlike hash(), CRC-32 is the same in every process.
+    """
+    return zlib.crc32(str(product_id).encode()) * n_shards >> 32
+
+
+def partition_product_ids(product_ids, n_shards=SHARD_COUNT):
+    """Splits product ids into n_shards lists by `shard_of`."""
+    shards = [[] for _ in range(n_shards)]
+    for product_id in product_ids:
+        shards[shard_of(product_id, n_shards)].append(product_id)
+    return shards
+
+
+def shard_seeds(seed, n_shards=SHARD_COUNT):
+    """One independent seed per shard, derived from `seed` (None: fresh entropy)."""
+    return np.random.SeedSequence(seed).spawn(n_shards)
+
+
+def split_catalog(catalog, n_shards=SHARD_COUNT):
+    """
+    Splits a catalog by `shard_of`, keeping its row order, so that each part
+    is what a worker fetching that shard would get.
+
+    Yields:
+        tuple: (shard, catalog of the shard's products), for non-empty shards.
+    """
+    shards = np.array([shard_of(product_id, n_shards) for product_id in catalog['id']], dtype=np.int64)
+    for shard in np.unique(shards):
+        rows = shards == shard
+        yield int(shard), {column: values[rows] for column, values in catalog.items()}
+
+
+def _predict_shard(shard, product_ids, demand_model, seed, record_date, chunk_size, model_version, write):
+    """
+    Runs in a worker process, on its own database connection: fetches and
+    predicts one shard, and writes it too unless `write` is False, in which
+    case the catalog and predictions are returned for the parent to write.
+    """
+    timings = {}
+    try:
+        started = time.perf_counter()
+        catalog = fetch_catalog(product_ids)
+        timings['fetch_products'] = time.perf_counter() - started
+        result = {'shard': shard, 'products': 0, 'products_updated': 0, 'records_written': 0, 'timings': timings}
+        if catalog is None:
+            return result
+
+        started = time.perf_counter()
+        batch = predict_batch(catalog, demand_model, np.random.default_rng(seed))
+        timings['predict'] = time.perf_counter() - started
+        result['products'] = len(batch['id'])
+        if not write:
+            result.update(catalog=catalog, batch=batch)
+            return result
+
+        stats = persist_predictions(
+            catalog, batch, record_date,
+            chunk_size=chunk_size, rng=np.random.default_rng(seed), model_version=model_version,
+        )
+        timings['persist'] = stats['elapsed']
+        result.update(products_updated=stats['products_updated'], records_written=stats['records_written'])
+        return result
+    finally:
+        connection.close()
+
+
+def run_sharded_predictions(demand_model, record_date, workers, product_ids=None, seed=None,
+                            chunk_size=None, model_version='', on_shard=None):
+    """
+    Predicts and persists the catalog in parallel: products are split into
+    shards by hash range (`shard_of`), and each shard is fetched and predicted
+    in a worker process with its own database connection. On a server
+    database the workers also write their shards, concurrently; on SQLite
+    (see bulk_ops.SINGLE_WRITER_VENDORS) the parent writes each shard as it comes back,
+    so there is never more than one writer. A failed shard does not stop the
+    others; it is reported in 'failures'.
+
+    Args:
+        demand_model: Model passed to `predict_batch` in every worker.
+        record_date (datetime.date): Date of the daily records to log.
+        workers (int): Worker processes.
+        product_ids (iterable, optional): Products to predict (default: every product).
+        seed (int, optional): Seed for the simulated noise; each shard draws
+                              from its own stream derived from it (`shard_seeds`).
+        chunk_size (int, optional): Number of products per write transaction
+                                    (default: settings.PREDICTION_WRITE_CHUNK_SIZE).
+        model_version (str): Version of the model, stored with each prediction.
+        on_shard (callable, optional): Called with the running totals
+                                       (products_predicted, products_updated,
+                                       records_written) after each written shard.
+
+    Returns:
+        dict: Totals (products_predicted, products_updated, records_written),
+              'shards' (one dict of counts and stage seconds per shard),
+              'failures' (dicts with 'shard', 'products' and 'error'),
+              'writer' ('parent' or 'workers') and elapsed seconds.
+    """
+    started = time.perf_counter()
+    if product_ids is None:
+        product_ids = Product.objects.values_list('id', flat=True).iterator()
+    shards = partition_product_ids(product_ids)
+    seeds = shard_seeds(seed)
+    parent_writes = connection.vendor in SINGLE_WRITER_VENDORS
+
+    totals = {'products_predicted': 0, 'products_updated': 0, 'records_written': 0}
+    shard_stats = []
+    failures = []
+    # Workers open their own connections; a forked worker must not reuse the parent's
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+        futures = {
+            executor.submit(
+                _predict_shard, shard, ids, demand_model, seeds[shard], record_date,
+                chunk_size, model_version, not parent_writes,
+            ): (shard, len(ids))
+            for shard, ids in enumerate(shards) if ids
+        }
+        for future in as_completed(futures):
+            shard, size = futures[future]
+            try:
+                result = future.result()
+                if parent_writes and result['products']:
+                    stats = persist_predictions(
+                        result.pop('catalog'), result.pop('batch'), record_date,
+                        chunk_size=chunk_size, rng=np.random.default_rng(seeds[shard]), model_version=model_version,
+                    )
+                    result['timings']['persist'] = stats['elapsed']
+                    result.update(products_updated=stats['products_updated'], records_written=stats['records_written'])
+            except Exception as e:
+                failures.append({'shard': shard, 'products': size, 'error': f'{type(e).__name__}: {e}'})
+                continue
+            shard_stats.append(result)
+            totals['products_predicted'] += result['products']
+            totals['products_updated'] += result['products_updated']
+            totals['records_written'] += result['records_written']
+            if on_shard is not None:
+                on_shard(totals['products_predicted'], totals['products_updated'], totals['records_written'])
+
+    return {
+        **totals,
+        'shards': sorted(shard_stats, key=lambda stats: stats['shard']),
+        'failures': sorted(failures, key=lambda failure: failure['shard']),
+        'writer': 'parent' if parent_writes else 'workers',
+        'elapsed': time.perf_counter() - started,
+    }
@@ -0,0 +1,70 @@
+# dashboard_app/progress.py
+
+import time
+from .jobs import report_progress
+
+# Seconds between two progress lines (and job heartbeats) by default
+DEFAULT_PROGRESS_INTERVAL = 5.0
+
+# --verbosity from which per-row detail lines are written
+DETAIL_VERBOSITY = 3
+
+# Counters mirrored onto the PredictionJob row
+JOB_COUNTERS = ('products_predicted', 'rows_written')
+
+
+class ProgressReporter:
+    """
+    Aggregate progress of a long command. Counters are updated as often as
+    convenient, but a progress line (and the job heartbeat) is only written
+    at most once per `interval` seconds, so the output and the number of job
+    updates do not grow with the catalog. Per-row detail is only written from
+    --verbosity 3 upwards.
+    """
+
+    def __init__(self, stdout, style, verbosity=1, interval=DEFAULT_PROGRESS_INTERVAL, job_id=None):
+        self.stdout = stdout
+        self.style = style
+        self.verbosity = verbosity
+        self.interval = interval
+        self.job_id = job_id
+        self.counters = {}
+        self._started = time.perf_counter()
+        self._last_emit = self._started
+        self._dirty = False
+
+    def set(self, **counters):
+        """Sets running totals and reports them if the interval has passed."""
+        self.counters.update(counters)
+        self._dirty = True
+        if time.perf_counter() - self._last_emit >= self.interval:
+            self.flush()
+
+    def add(self, **increments):
+        """Adds to counters and reports them if the interval has passed."""
+        self.set(**{name: self.counters.get(name, 0) + value for name, value in increments.items()})
+
+    @property
+    def detailed(self):
+        return self.verbosity >= DETAIL_VERBOSITY
+
+    def detail(self, message):
+        """Writes a per-row line, only at --verbosity 3 or more."""
+        if self.detailed:
+            self.stdout.write(self.style.HTTP_INFO(f'  {message}'))
+
+    def flush(self):
+        """Writes the current totals now, if they changed since the last report."""
+        self._last_emit = time.perf_counter()
+        if not self._dirty:
+            return
+        self._dirty = False
+        report_progress(self.job_id, **{name: value for name, value in self.counters.items() if name in JOB_COUNTERS})
+        if self.verbosity >= 1:
+            totals = ', '.join(f'{name.replace("_", " ")}: {value}' for name, value in self.counters.items())
+            self.stdout.write(f'[{self._last_emit - self._started:7.1f}s] {totals}')
+
+    def summary(self):
+        """The final counters and elapsed seconds, as a small dict."""
+        return {**self.counters, 'elapsed': round(time.perf_counter() - self._started, 3)}
+
@@ -0,0 +1,96 @@
+# dashboard_app/synthetic_data.py
+
+from datetime import date, timedelta
+from decimal import Decimal
+import numpy as np
+from django.db import transaction
+from .models import Product, ProductDailyRecord
+from .aggregates import refresh_products
+
+CATEGORIES = ['Electronics', 'Groceries', 'Home', 'Clothing', 'Sports', 'Toys', 'Beauty', 'Books']
+NAME_WORDS = ['Classic', 'Organic', 'Wireless', 'Smart', 'Compact', 'Deluxe', 'Eco', 'Pro', 'Mini', 'Ultra']
+
+# Rows per bulk INSERT and per transaction
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def _cents(values):
+    return [Decimal(int(c)).scaleb(-2) for c in values]
+
+
+def generate_catalog(n_products, n_days, seed=0, end_date=None, chunk_size=DEFAULT_CHUNK_SIZE, id_prefix='sku'):
+    """
+    Creates `n_products` synthetic products and `n_days` days of daily history
+    for each, ending at `end_date` (default today). The same seed always
+    produces the same data. Rows are written with bulk inserts, one
+    transaction per chunk.
+
+    Returns:
+        dict: Numbers of products and daily records created.
+    """
+    rng = np.random.default_rng(seed)
+    end_date = end_date or date.today()
+    width = len(str(max(n_products - 1, 0)))
+    product_ids = [f'{id_prefix}{i:0{width}d}' for i in range(n_products)]
+
+    price_cents = rng.integers(199, 99999, n_products)
+    margin_pct = rng.integers(10, 60, n_products)
+    competitor_cents = np.maximum(price_cents + rng.integers(-2000, 2000, n_products), 0)
+    base_daily_sales = rng.gamma(2.0, 5.0, n_products)
+    inventory = rng.integers(0, 500, n_products)
+    sales_last_7_days = np.rint(base_daily_sales * 7).astype(np.int64)
+    words = rng.integers(0, len(NAME_WORDS), (n_products, 2))
+    categories = rng.integers(0, len(CATEGORIES), n_products)
+
+    products_created = 0
+    for start in range(0, n_products, chunk_size):
+        stop = min(start + chunk_size, n_products)
+        prices = _cents(price_cents[start:stop])
+        competitors = _cents(competitor_cents[start:stop])
+        products = [
+            Product(
+                id=product_ids[i],
+                name=f'{NAME_WORDS[words[i, 0]]} {NAME_WORDS[words[i, 1]]} {CATEGORIES[categories[i]]} {i}',
+                category=CATEGORIES[categories[i]],
+                current_price=prices[i - start],
+                suggested_price=prices[i - start],
+                inventory=int(inventory[i]),
+                demand_forecast=int(sales_last_7_days[i]),
+                sales_last_7_days=int(sales_last_7_days[i]),
+                margin=Decimal(int(margin_pct[i])).scaleb(-2),
+                competitor_price=competitors[i - start],
+            )
+            for i in range(start, stop)
+        ]
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+        products_created += len(products)
+
+    records_created = 0
+    dates = [end_date - timedelta(days=n_days - 1 - d) for d in range(n_days)]
+    # Generate one product-chunk of history at a time to keep memory bounded
+    products_per_chunk = max(1, chunk_size // max(n_days, 1))
+    for start in range(0, n_products, products_per_chunk):
+        stop = min(start + products_per_chunk, n_products)
+        n = stop - start
+        sales = rng.poisson(np.repeat(base_daily_sales[start:stop], n_days).reshape(n, n_days))
+        stock = np.maximum(inventory[start:stop, None] + rng.integers(-20, 21, (n, n_days)), 0)
+        prices = np.rint(price_cents[start:stop, None] * rng.uniform(0.98, 1.02, (n, n_days)))
+        records = [
+            ProductDailyRecord(
+                product_id=product_ids[start + p],
+                date=dates[d],
+                sales_units=int(sales[p, d]),
+                inventory_level=int(stock[p, d]),
+                price_at_day_end=Decimal(int(prices[p, d])).scaleb(-2),
+            )
+            for p in range(n)
+            for d in range(n_days)
+        ]
+        with transaction.atomic():
+            ProductDailyRecord.objects.bulk_create(records, batch_size=chunk_size)
+            if records:
+                refresh_products(product_ids[start:stop])
+        records_created += len(records)
+
+    return {'products': products_created, 'records': records_created}
@@ -1,3 +1,1302 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import partial
+from io import StringIO
+from unittest import mock
+import joblib
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.core.management.base import OutputWrapper
+from django.core.management.color import no_style
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from sklearn.linear_model import LinearRegression
+from . import aggregates, chart_cache, chart_data, chart_prerender, chart_renderer, exports, gap_fill, history, jobs, prediction_shards
+from .metrics import MetricsRegistry, registry
+from .progress import ProgressReporter
+from .chart_data import ChartRange
+from .history_import import MAX_REPORTED_ERRORS, import_history, iter_csv_rows
+from .bulk_ops import apply_product_updates, parse_product_update, persist_predictions, upsert_daily_record_rows
+from .ml_logic import ml_model_service, model_registry
+from .models import PredictionJob, PredictionRun, PredictionState, Product, ProductDailyRecord, ProductSalesAggregate
 
-# Create your tests here.
+
+def make_product(product_id, **fields):
+    """Creates a product with plausible defaults for every required field."""
+    values = {
+        'name': f'Product {product_id}',
+        'category': 'Toys',
+        'current_price': Decimal('10.00'),
+        'suggested_price': Decimal('10.00'),
+        'inventory': 100,
+        'demand_forecast': 50,
+        'sales_last_7_days': 70,
+        'margin': Decimal('0.40'),
+        'competitor_price': Decimal('11.00'),
+    }
+    values.update(fields)
+    return Product.objects.create(id=product_id, **values)
+
+
+def _random_products(n, seed):
+    """Product dicts as `get_ml_predictions` takes them, with prices in whole cents."""
+    rng = np.random.default_rng(seed)
+    products = []
+    for i in range(n):
+        current_cents = int(rng.integers(100, 100000))
+        # Every third competitor is within 10% of the price, to exercise the averaging rule
+        if i % 3 == 0:
+            competitor_cents = int(current_cents * rng.uniform(0.92, 1.08))
+        else:
+            competitor_cents = int(rng.integers(0, 100000))
+        products.append({
+            'id': f'p{i:05d}',
+            'sales_last_7_days': int(rng.integers(0, 500)),
+            'current_price': Decimal(current_cents) / 100,
+            'competitor_price': Decimal(competitor_cents) / 100,
+            'margin': Decimal(int(rng.integers(0, 90))) / 100,
+        })
+    return products
+
+
+class BatchPricingParityTests(SimpleTestCase):
+    """The vectorized batch engine must price exactly like the scalar reference path."""
+
+    def _assert_parity(self, demand_model, n=2000, seed=7):
+        products = _random_products(n, seed)
+        with mock.patch.object(ml_model_service, 'load_or_train_model', return_value=demand_model):
+            scalar = ml_model_service.get_ml_predictions(products, {}, seed=seed)
+            batch = ml_model_service.get_ml_predictions_batch(
+                ml_model_service.build_catalog(products), None, seed=seed,
+            )
+        self.assertEqual(scalar, ml_model_service.batch_to_predictions(batch))
+
+    def test_parity_with_model(self):
+        model = LinearRegression().fit(np.array([[0], [100], [300]]), np.array([5, 110, 290]))
+        self._assert_parity(model)
+
+    def test_parity_without_model(self):
+        self._assert_parity(None)
+
+    def test_parity_edge_prices(self):
+        products = [
+            # Exactly 10% from the competitor: not averaged, in both paths
+            {'id': 'a', 'sales_last_7_days': 10, 'current_price': Decimal('100.00'),
+             'competitor_price': Decimal('110.00'), 'margin': Decimal('0.30')},
+            # Half-cent result after averaging
+            {'id': 'b', 'sales_last_7_days': 10, 'current_price': Decimal('132.49'),
+             'competitor_price': Decimal('132.50'), 'margin': Decimal('0.50')},
+            {'id': 'c', 'sales_last_7_days': 0, 'current_price': Decimal('0.01'),
+             'competitor_price': Decimal('0.00'), 'margin': Decimal('0.00')},
+        ]
+        with mock.patch.object(ml_model_service, 'load_or_train_model', return_value=None):
+            scalar = ml_model_service.get_ml_predictions(products, {}, seed=3)
+            batch = ml_model_service.get_ml_predictions_batch(ml_model_service.build_catalog(products), None, seed=3)
+        self.assertEqual(scalar, ml_model_service.batch_to_predictions(batch))
+
+
+def _history(sales_by_product):
+    """HistoryArrays holding only sales_units, from {product_id: [sales, ...]} in id order."""
+    product_ids = sorted(sales_by_product)
+    sales = [sales_by_product[product_id] for product_id in product_ids]
+    offsets = np.concatenate(([0], np.cumsum([len(units) for units in sales]))).astype(np.int64)
+    return history.HistoryArrays(
+        np.array(product_ids, dtype=object), offsets,
+        {'sales_units': np.array([unit for units in sales for unit in units], dtype=np.int64)},
+    )
+
+
+class ProductModelTests(SimpleTestCase):
+    """Per-product demand models (DemandModelBundle) and their closed-form training."""
+
+    def test_closed_form_fit_matches_linear_regression(self):
+        rng = np.random.default_rng(1)
+        counts = [2, 3, 10, 30]
+        x = rng.integers(0, 200, sum(counts))
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        coef, intercept, fitted = ml_model_service._fit_product_shard(x, offsets, seed=4)
+
+        self.assertTrue(fitted.all())
+        # The same target the shard simulates
+        y = x * np.random.default_rng(4).uniform(0.95, 1.05, len(x))
+        for i in range(len(counts)):
+            rows = slice(offsets[i], offsets[i + 1])
+            reference = LinearRegression().fit(x[rows].reshape(-1, 1).astype(np.float64), y[rows])
+            self.assertAlmostEqual(coef[i], reference.coef_[0], places=9)
+            self.assertAlmostEqual(intercept[i], reference.intercept_, places=6)
+
+    def test_products_without_enough_history_use_the_global_model(self):
+        history = _history({'a': [10, 20, 30, 40], 'b': [15], 'c': [7, 7, 7]})
+        bundle = ml_model_service.train_product_models(history, n_jobs=1, seed=2)
+        self.assertEqual(list(bundle.product_ids), ['a'])
+
+        sales = np.array([25.0, 25.0, 25.0, 25.0])
+        predicted = bundle.predict_products(['a', 'b', 'c', 'unknown'], sales)
+        global_prediction = bundle.global_model.predict([[25.0]])[0]
+        self.assertAlmostEqual(predicted[0], bundle.coef[0] * 25 + bundle.intercept[0])
+        self.assertEqual(list(predicted[1:]), [global_prediction] * 3)
+        # Without a global model, products lacking their own keep their sales
+        bundle.global_model = None
+        self.assertEqual(list(bundle.predict_products(['b', 'a'], sales[:2]))[0], 25.0)
+
+    def test_parallel_training_matches_serial(self):
+        rng = np.random.default_rng(3)
+        history = _history({f'p{i:04d}': list(rng.integers(0, 100, int(rng.integers(1, 40)))) for i in range(500)})
+        serial = ml_model_service.train_product_models(history, n_jobs=1, seed=9)
+        parallel = ml_model_service.train_product_models(history, n_jobs=2, seed=9)
+        np.testing.assert_array_equal(parallel.product_ids, serial.product_ids)
+        np.testing.assert_array_equal(parallel.coef, serial.coef)
+        np.testing.assert_array_equal(parallel.intercept, serial.intercept)
+
+
+class ModelRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'bundle.joblib')
+        self.addCleanup(model_registry.clear)
+
+    def _write(self, coef, mtime_ns):
+        """Replaces the bundle artifact, as `save_model` in another process would, with a given mtime."""
+        joblib.dump(ml_model_service.DemandModelBundle(['a', 'b'], coef, [0.0, 0.0]), self.path + '.tmp')
+        os.utime(self.path + '.tmp', ns=(mtime_ns, mtime_ns))
+        os.replace(self.path + '.tmp', self.path)
+
+    def test_unchanged_artifact_is_not_reloaded(self):
+        self._write([1.0, 2.0], 10**18)
+        with mock.patch.object(model_registry.joblib, 'load', wraps=joblib.load) as load:
+            first = model_registry.get_model(self.path)
+            self.assertIs(model_registry.get_model(self.path), first)
+            # Touched, same content: hashed again but not reloaded
+            os.utime(self.path, ns=(2 * 10**18, 2 * 10**18))
+            self.assertIs(model_registry.get_model(self.path), first)
+        load.assert_called_once()
+        self.assertIsInstance(first.coef, np.memmap)
+
+    def test_rewritten_artifact_is_picked_up(self):
+        self._write([1.0, 2.0], 10**18)
+        old = model_registry.get_model(self.path)
+        old_version = model_registry.get_version(self.path)
+        self._write([3.0, 4.0], 2 * 10**18)
+        new = model_registry.get_model(self.path)
+        self.assertEqual(list(new.coef), [3.0, 4.0])
+        self.assertNotEqual(model_registry.get_version(self.path), old_version)
+        # Still mapping the replaced file
+        self.assertEqual(list(old.coef), [1.0, 2.0])
+
+    def test_save_model_replaces_the_artifact(self):
+        self._write([1.0, 2.0], 10**18)
+        old = model_registry.get_model(self.path)
+        bundle = ml_model_service.DemandModelBundle(['a'], [5.0], [1.0])
+        model_registry.save_model(bundle, self.path)
+        self.assertIs(model_registry.get_model(self.path), bundle)
+        self.assertEqual(list(old.coef), [1.0, 2.0])
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ['bundle.joblib'])
+
+    def test_artifact_is_hashed_outside_the_lock(self):
+        self._write([1.0, 2.0], 10**18)
+        file_hash = model_registry._file_hash
+
+        def unlocked_hash(path):
+            self.assertFalse(model_registry._lock.locked())
+            return file_hash(path)
+
+        with mock.patch.object(model_registry, '_file_hash', unlocked_hash):
+            model_registry.get_model(self.path)
+
+
+class LoadHistoryTests(TestCase):
+
+    def test_product_subset_is_loaded_in_batches(self):
+        for product_id in ('a', 'b', 'c', 'd', 'e'):
+            make_product(product_id)
+            upsert_daily_record_rows([
+                (product_id, date(2024, 5, day), day, 10, Decimal('1.00')) for day in (3, 1, 2)
+            ])
+        with mock.patch.object(history, 'ID_BATCH_SIZE', 2), CaptureQueriesContext(connection) as queries:
+            loaded = history.load_history_arrays(product_ids=['e', 'a', 'c', 'd', 'nope'])
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(list(loaded.product_ids), ['a', 'c', 'd', 'e'])
+        self.assertEqual(list(loaded.offsets), [0, 3, 6, 9, 12])
+        self.assertEqual(list(loaded['d']['sales_units']), [1, 2, 3])
+
+
+class ParseProductUpdateTests(SimpleTestCase):
+
+    def test_valid_items(self):
+        self.assertEqual(
+            parse_product_update({'id': 7, 'currentPrice': '12.5', 'inventory': 3.0}),
+            {'id': '7', 'current_price': Decimal('12.50'), 'inventory': 3},
+        )
+        self.assertEqual(
+            parse_product_update({'id': 'a', 'inventory': 0}),
+            {'id': 'a', 'current_price': None, 'inventory': 0},
+        )
+        self.assertEqual(parse_product_update({'id': 'a', 'inventory': 2**31 - 1})['inventory'], 2**31 - 1)
+
+    def test_invalid_items(self):
+        for item, message in (
+            (['a'], 'JSON object'),
+            ({'currentPrice': 1}, "Missing product 'id'"),
+            ({'id': True, 'currentPrice': 1}, "Missing product 'id'"),
+            ({'id': 'a'}, 'Nothing to update'),
+            ({'id': 'a', 'currentPrice': True}, 'must be a number'),
+            ({'id': 'a', 'currentPrice': 'ten'}, 'must be a number'),
+            ({'id': 'a', 'currentPrice': 'NaN'}, 'between 0 and'),
+            ({'id': 'a', 'currentPrice': -1}, 'between 0 and'),
+            ({'id': 'a', 'currentPrice': 1e9}, 'between 0 and'),
+            ({'id': 'a', 'currentPrice': '1.005'}, 'at most 2 decimal places'),
+            ({'id': 'a', 'inventory': 1.5}, 'whole number'),
+            ({'id': 'a', 'inventory': 'many'}, 'whole number'),
+            ({'id': 'a', 'inventory': False}, 'whole number'),
+            ({'id': 'a', 'inventory': -2}, 'cannot be negative'),
+            ({'id': 'a', 'inventory': 1e20}, 'cannot exceed 2147483647'),
+            ({'id': 'a', 'inventory': '9' * 30}, 'cannot exceed 2147483647'),
+            ({'id': 'a', 'inventory': 2**31}, 'cannot exceed 2147483647'),
+        ):
+            with self.subTest(item=item), self.assertRaisesMessage(ValueError, message):
+                parse_product_update(item)
+
+
+class BulkUpdateTests(TestCase):
+
+    def setUp(self):
+        make_product('a', current_price=Decimal('10.00'), inventory=5)
+        make_product('b', current_price=Decimal('20.00'), inventory=6)
+
+    def assertUnchanged(self):
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('current_price', 'inventory')),
+            [(Decimal('10.00'), 5), (Decimal('20.00'), 6)],
+        )
+        self.assertFalse(ProductDailyRecord.objects.exists())
+
+    def test_applies_every_valid_item(self):
+        results = apply_product_updates(
+            [{'id': 'a', 'currentPrice': 11}, {'id': 'b', 'inventory': 0}], date(2024, 5, 1),
+            rng=np.random.default_rng(0),
+        )
+        self.assertEqual([result['status'] for result in results], ['success', 'success'])
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('current_price', 'inventory')),
+            [(Decimal('11.00'), 5), (Decimal('20.00'), 0)],
+        )
+        self.assertEqual(ProductDailyRecord.objects.filter(date=date(2024, 5, 1)).count(), 2)
+
+    def test_one_invalid_item_blocks_the_batch(self):
+        items = [{'id': 'a', 'currentPrice': 11}, {'id': 'b', 'inventory': -1}, {'id': 'nope', 'inventory': 1},
+                 {'id': 'a', 'inventory': 2}]
+        results = apply_product_updates(items, date(2024, 5, 1))
+        self.assertEqual([(result['index'], result['status']) for result in results],
+                         [(0, 'skipped'), (1, 'error'), (2, 'error'), (3, 'error')])
+        self.assertEqual(results[2]['message'], 'Product not found.')
+        self.assertEqual(results[3]['message'], 'Duplicate product id in this request.')
+        self.assertUnchanged()
+
+    def test_partial_applies_the_valid_items(self):
+        results = apply_product_updates(
+            [{'id': 'nope', 'inventory': 1}, {'id': 'b', 'currentPrice': 'x'}, {'id': 'a', 'inventory': 9}],
+            date(2024, 5, 1), partial=True,
+        )
+        self.assertEqual([result['status'] for result in results], ['error', 'error', 'success'])
+        self.assertEqual(Product.objects.get(id='a').inventory, 9)
+        self.assertEqual(Product.objects.get(id='b').current_price, Decimal('20.00'))
+
+    def test_a_failed_write_rolls_back_the_whole_batch(self):
+        items = [{'id': 'a', 'currentPrice': 11}, {'id': 'b', 'inventory': 0}]
+        with mock.patch('dashboard_app.bulk_ops.upsert_daily_records', side_effect=DatabaseError('disk full')):
+            with self.assertRaises(DatabaseError):
+                apply_product_updates(items, date(2024, 5, 1))
+        self.assertUnchanged()
+
+    def test_api(self):
+        self.client.force_login(User.objects.create_user('tester'))
+        url = '/api/products/bulk_update/'
+        response = self.client.post(url, [{'id': 'a', 'currentPrice': 11}, {'id': 'b', 'inventory': 'x'}],
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((response.json()['updated'], response.json()['failed']), (0, 1))
+        self.assertUnchanged()
+
+        response = self.client.post(f'{url}?partial=1', [{'id': 'a', 'currentPrice': 11}, {'id': 'b', 'inventory': 'x'}],
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['updated'], data['failed']), (1, 1))
+        self.assertEqual(data['results'][0]['product']['currentPrice'], 11.0)
+
+        response = self.client.post(url, '{"id": "a", "inventory": 1}\n\n{"id": "b", "inventory": 2}\n',
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.json()['updated'], 2)
+        response = self.client.post(url, '{"id": "a", "inventory": 1}\n{oops\n', content_type='application/x-ndjson')
+        self.assertEqual((response.status_code, response.json()['message']), (400, 'Invalid JSON on line 2.'))
+        response = self.client.post(url, {'id': 'a'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+HISTORY_HEADER = b'product_id,date,sales_units,inventory_level,price_at_day_end,note\n'
+
+
+class HistoryImportTests(TestCase):
+
+    def setUp(self):
+        make_product('a')
+        make_product('b')
+
+    def _import(self, lines, **kwargs):
+        return import_history(iter_csv_rows([HISTORY_HEADER, *lines]), **kwargs)
+
+    def test_imports_rows_and_reports_bad_ones(self):
+        lines = [
+            b'a,2024-05-01,3,10,9.99,first\n',
+            b'ghost,2024-05-01,1,1,1.00,\n',
+            b'b,2024-13-01,1,1,1.00,\n',
+            b'b,2024-05-01,-1,1,1.00,\n',
+            b'b,2024-05-01,1,1.5,1.00,\n',
+            b'b,2024-05-01,1,1,1.001,\n',
+            b'b,2024-05-01,1,1,abc,\n',
+            b',2024-05-01,1,1,1.00,\n',
+            b'b,2024-05-01\n',
+            b'\n',
+            b'b,2024-05-02,4,8,2.50,\n',
+            b'a,2024-05-01,5,10,9.99,duplicate: the last row wins\n',
+        ]
+        errors = []
+        stats = self._import(lines, on_error=lambda row, message: errors.append(row))
+
+        self.assertEqual((stats['rows_read'], stats['records_written'], stats['rows_rejected']), (11, 2, 8))
+        self.assertEqual([error['row'] for error in stats['errors']], [3, 4, 5, 6, 7, 8, 9, 10])
+        self.assertEqual(errors, [3, 4, 5, 6, 7, 8, 9, 10])
+        messages = [error['message'] for error in stats['errors']]
+        self.assertEqual(messages[0], "Unknown product_id 'ghost'.")
+        self.assertIn('expected YYYY-MM-DD', messages[1])
+        self.assertEqual(messages[4], 'price_at_day_end must have at most 2 decimal places.')
+        self.assertEqual(messages[-1], 'sales_units must be a whole number.')
+        self.assertEqual(stats['product_ids'], ['a', 'b'])
+        self.assertEqual(ProductDailyRecord.objects.get(product_id='a', date=date(2024, 5, 1)).sales_units, 5)
+
+    def test_errors_are_sorted_across_chunks(self):
+        # Unknown products are found when a chunk is written, after its parse errors
+        lines = [b'ghost,2024-05-01,1,1,1.00,\n', b'a,bad,1,1,1.00,\n', b'a,2024-05-01,1,1,1.00,\n'] * 3
+        stats = self._import(lines, chunk_size=2)
+        self.assertEqual([error['row'] for error in stats['errors']], [2, 3, 5, 6, 8, 9])
+        self.assertEqual(stats['records_written'], 3)
+
+    def test_reported_errors_are_capped_to_the_first_rows(self):
+        lines = [b'ghost,2024-05-01,1,1,1.00,\n', *[b'a,bad,1,1,1.00,\n'] * (MAX_REPORTED_ERRORS + 10)]
+        stats = self._import(lines)
+        self.assertEqual(stats['rows_rejected'], MAX_REPORTED_ERRORS + 11)
+        self.assertEqual([error['row'] for error in stats['errors']], list(range(2, MAX_REPORTED_ERRORS + 2)))
+
+    def test_malformed_csv_lines_are_reported_as_bad_rows(self):
+        huge = b'x' * (csv.field_size_limit() + 1)
+        lines = [
+            b'a,2024-05-01,1,1,1.00,\n',
+            b'a,2024-05-02,1,1,1.00,' + huge + b'\n',
+            b'a,2024-05-03,1,99999999999,1.00,\n',
+            b'b,2024-05-01,2,2,2.00,\n',
+        ]
+        stats = self._import(lines)
+        self.assertEqual((stats['records_written'], stats['rows_rejected']), (2, 2))
+        self.assertEqual([error['row'] for error in stats['errors']], [3, 4])
+        self.assertIn('Malformed CSV line: field larger than field limit', stats['errors'][0]['message'])
+        self.assertEqual(stats['errors'][1]['message'], 'inventory_level cannot exceed 2147483647.')
+
+        self.client.force_login(User.objects.create_user('tester'))
+        response = self.client.post('/api/import/history/', HISTORY_HEADER + b''.join(lines), content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([error['row'] for error in response.json()['errors']], [3, 4])
+
+    def test_header_without_required_columns(self):
+        with self.assertRaisesMessage(ValueError, 'missing column(s): inventory_level, price_at_day_end'):
+            list(iter_csv_rows([b'product_id,date,sales_units\n', b'a,2024-05-01,1\n']))
+        self.assertEqual(list(iter_csv_rows([])), [])
+
+    def test_api(self):
+        self.client.force_login(User.objects.create_user('tester'))
+        body = HISTORY_HEADER + b'ghost,2024-05-01,1,1,1.00,\nb,nope,1,1,1.00,\na,2024-05-01,1,1,1.00,\n'
+        data = self.client.post('/api/import/history/', body, content_type='text/csv').json()
+        self.assertEqual((data['recordsWritten'], data['rowsRejected'], data['productsUpdated']), (1, 2, 1))
+        self.assertEqual([error['row'] for error in data['errors']], [2, 3])
+        response = self.client.post('/api/import/history/', b'product_id\n', content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+
+
+AGGREGATE_FIELDS = ['as_of', 'recent_sales'] + [
+    f'{column}_{days}' for days in aggregates.WINDOWS for column in ('sales', 'inventory', 'days')
+]
+
+
+class SalesAggregateTests(TestCase):
+
+    def setUp(self):
+        self.as_of = aggregates.current_as_of()
+        self.rng = np.random.default_rng(1)
+        for product_id in ('a', 'b', 'c'):
+            make_product(product_id)
+        # Sparse history: a day in three has no record
+        upsert_daily_record_rows([
+            (product_id, self.as_of - timedelta(days=days), int(self.rng.integers(0, 50)), 100, Decimal('10.00'))
+            for product_id in ('a', 'b') for days in range(120) if days % 3
+        ])
+
+    def _stored(self):
+        return {
+            aggregate['product_id']: aggregate
+            for aggregate in ProductSalesAggregate.objects.values('product_id', *AGGREGATE_FIELDS)
+        }
+
+    def assertMatchesRecompute(self):
+        stored = self._stored()
+        aggregates.refresh_products(list(stored), self.as_of)
+        self.assertEqual(stored, self._stored())
+
+    def test_deltas_match_a_full_recompute(self):
+        self.assertMatchesRecompute()
+        for _ in range(5):
+            # New and overwritten records, inside and outside the windows, today's included
+            rows = [
+                (str(product_id), self.as_of - timedelta(days=int(days)), int(sales), int(inventory), Decimal('9.00'))
+                for product_id, days, sales, inventory in zip(
+                    self.rng.choice(['a', 'b', 'c'], 40), self.rng.integers(-1, 130, 40),
+                    self.rng.integers(0, 80, 40), self.rng.integers(0, 300, 40),
+                )
+            ]
+            upsert_daily_record_rows(rows, ignore_conflicts=bool(self.rng.integers(0, 2)))
+            self.assertMatchesRecompute()
+        self.assertEqual(
+            Product.objects.get(id='c').sales_last_7_days,
+            ProductSalesAggregate.objects.get(product_id='c').sales_7,
+        )
+
+    def test_only_changed_records_in_a_window_are_written(self):
+        before = self._stored()
+        old_record = self.as_of - timedelta(days=100)
+        rows = [('a', old_record, 999, 1, Decimal('1.00')), ('a', self.as_of + timedelta(days=1), 999, 1, Decimal('1.00'))]
+        with mock.patch.object(aggregates, '_upsert') as upsert:
+            upsert_daily_record_rows(rows)
+        upsert.assert_not_called()
+        self.assertEqual(before, self._stored())
+
+    def test_stale_aggregates_count_records_in_their_own_windows(self):
+        ProductSalesAggregate.objects.update(as_of=self.as_of - timedelta(days=3))
+        aggregates.refresh_products(['a', 'b'], self.as_of - timedelta(days=3))
+        upsert_daily_record_rows([
+            ('a', self.as_of - timedelta(days=1), 7, 7, Decimal('1.00')),
+            ('a', self.as_of - timedelta(days=5), 7, 7, Decimal('1.00')),
+        ])
+        aggregates.advance_aggregates()
+        self.assertMatchesRecompute()
+
+    def test_history_import_refreshes_aggregates_once(self):
+        lines = [
+            f'{product_id},{self.as_of - timedelta(days=days)},{days},5,1.00,\n'.encode()
+            for days in range(10) for product_id in ('a', 'c')
+        ]
+        with mock.patch.object(aggregates, 'refresh_products', wraps=aggregates.refresh_products) as refresh:
+            stats = import_history(iter_csv_rows([HISTORY_HEADER, *lines]), chunk_size=3)
+        self.assertEqual(stats['records_written'], 20)
+        refresh.assert_called_once()
+        self.assertEqual(sorted(refresh.call_args.args[0]), ['a', 'c'])
+        self.assertEqual(ProductSalesAggregate.objects.get(product_id='c').sales_7, sum(range(7)))
+        self.assertMatchesRecompute()
+
+    def test_dashboard_does_not_write(self):
+        ProductSalesAggregate.objects.update(as_of=self.as_of - timedelta(days=2))
+        self.client.force_login(User.objects.create_user('tester'))
+        with mock.patch.object(aggregates, 'advance_aggregates') as advance:
+            self.assertEqual(self.client.get('/').status_code, 200)
+        advance.assert_not_called()
+        self.assertFalse(ProductSalesAggregate.objects.filter(as_of=self.as_of).exists())
+
+    def test_single_record_edit(self):
+        self.client.force_login(User.objects.create_user('tester'))
+        day = self.as_of - timedelta(days=2)
+        response = self.client.post(
+            '/api/add_historical_record/', {'product_id': 'a', 'date': day.isoformat(), 'sales_units': 500},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(ProductSalesAggregate.objects.get(product_id='a').recent_sales[4], 500)
+        self.assertMatchesRecompute()
+
+
+class GapFillTests(TestCase):
+    start = date(2024, 5, 1)
+    end = date(2024, 5, 7)
+
+    def setUp(self):
+        for product_id in ('empty', 'edges', 'full', 'other'):
+            make_product(product_id)
+        upsert_daily_record_rows([
+            (product_id, self.start + timedelta(days=days), 3, 4, Decimal('1.00'))
+            for product_id, days in [('edges', 1), ('edges', 2), ('edges', 3), ('edges', 4), ('edges', 5)]
+            + [('full', days) for days in range(7)] + [('other', days) for days in range(1, 7)]
+        ])
+
+    def _gaps(self, **kwargs):
+        gaps = set()
+        for products, rows, columns in gap_fill.find_history_gaps(self.start, self.end, **kwargs):
+            gaps.update((products[row][0], (self.start + timedelta(days=int(column))).day) for row, column in zip(rows, columns))
+        return gaps
+
+    def test_finds_gaps_at_both_edges_and_in_products_without_history(self):
+        self.assertEqual(
+            self._gaps(page_size=1),
+            {('edges', 1), ('edges', 7), ('other', 1)} | {('empty', day) for day in range(1, 8)},
+        )
+        self.assertEqual(self._gaps(product_ids=['full', 'other']), {('other', 1)})
+
+    def test_single_day_window(self):
+        gaps = set()
+        for products, rows, columns in gap_fill.find_history_gaps(self.end, self.end):
+            gaps.update(products[row][0] for row in rows)
+        self.assertEqual(gaps, {'edges', 'empty'})
+
+    def test_fill_leaves_existing_records_alone(self):
+        stats = gap_fill.fill_history_gaps(self.start, self.end, rng=np.random.default_rng(0), page_size=2)
+        self.assertEqual((stats['products'], stats['records_written']), (3, 10))
+        self.assertEqual(stats['sample_product_ids'], ['edges', 'empty', 'other'])
+        self.assertEqual(self._gaps(), set())
+        self.assertEqual(ProductDailyRecord.objects.filter(product_id='full').count(), 7)
+        self.assertEqual(set(ProductDailyRecord.objects.filter(product_id='edges', sales_units=3).values_list('date', flat=True)),
+                         {self.start + timedelta(days=days) for days in range(1, 6)})
+        # A second run finds nothing left to fill
+        self.assertEqual(gap_fill.fill_history_gaps(self.start, self.end)['products'], 0)
+
+    def test_reported_products_are_capped(self):
+        with mock.patch.object(gap_fill, 'MAX_REPORTED_PRODUCTS', 2):
+            stats = gap_fill.fill_history_gaps(self.start, self.end, page_size=1)
+        self.assertEqual((stats['products'], stats['sample_product_ids']), (3, ['edges', 'empty']))
+
+    def test_command_invalidates_charts(self):
+        with mock.patch('dashboard_app.management.commands.fill_history_gaps.invalidate_charts') as invalidate:
+            call_command('fill_history_gaps', start=self.start, end=self.end, product_ids=['other'], stdout=StringIO())
+        invalidate.assert_called_once_with(['other'])
+        with mock.patch.object(gap_fill, 'MAX_REPORTED_PRODUCTS', 1), \
+                mock.patch('dashboard_app.management.commands.fill_history_gaps.invalidate_charts') as invalidate:
+            call_command('fill_history_gaps', start=self.start, end=self.end, stdout=StringIO())
+        invalidate.assert_called_once_with(None)
+
+
+class PersistPredictionsTests(TestCase):
+
+    def test_writes_predictions_records_and_states(self):
+        make_product('a', name='Alpha', inventory=7)
+        make_product('b')
+        catalog = ml_model_service.build_catalog([
+            {'id': 'a', 'sales_last_7_days': 70, 'current_price': Decimal('10.00'),
+             'competitor_price': Decimal('11.00'), 'margin': Decimal('0.40')},
+            {'id': 'b', 'sales_last_7_days': 70, 'current_price': Decimal('10.00'),
+             'competitor_price': Decimal('11.00'), 'margin': Decimal('0.40')},
+        ])
+        catalog['inventory'] = np.array([7, 100])
+        batch = {
+            'id': catalog['id'],
+            'new_demand_forecast': np.array([12, 34]),
+            'new_suggested_price_cents': np.array([1234, 999]),
+        }
+        stats = persist_predictions(catalog, batch, date(2024, 5, 1), chunk_size=1, model_version='v1')
+
+        self.assertEqual((stats['products_updated'], stats['records_written']), (2, 2))
+        product = Product.objects.get(id='a')
+        self.assertEqual((product.demand_forecast, product.suggested_price), (12, Decimal('12.34')))
+        # Fields the prediction does not own are left as they were
+        self.assertEqual((product.name, product.inventory, product.current_price), ('Alpha', 7, Decimal('10.00')))
+        record = ProductDailyRecord.objects.get(product_id='a', date=date(2024, 5, 1))
+        self.assertEqual((record.inventory_level, record.price_at_day_end), (7, Decimal('10.00')))
+        self.assertEqual(PredictionState.objects.get(product_id='b').model_version, 'v1')
+
+    @override_settings(PREDICTION_WRITE_PAUSE=0.01)
+    def test_pauses_between_chunks_on_sqlite(self):
+        for product_id in ('a', 'b', 'c'):
+            make_product(product_id)
+        catalog = ml_model_service.build_catalog([
+            {'id': product_id, 'sales_last_7_days': 70, 'current_price': Decimal('10.00'),
+             'competitor_price': Decimal('11.00'), 'margin': Decimal('0.40')}
+            for product_id in ('a', 'b', 'c')
+        ])
+        catalog['inventory'] = np.array([100, 100, 100])
+        batch = {
+            'id': catalog['id'],
+            'new_demand_forecast': np.array([1, 2, 3]),
+            'new_suggested_price_cents': np.array([1000, 1000, 1000]),
+        }
+        with mock.patch('dashboard_app.bulk_ops.time.sleep') as sleep:
+            stats = persist_predictions(catalog, batch, date(2024, 5, 1), chunk_size=2)
+        self.assertEqual(stats['products_updated'], 3)
+        # Only between chunks, not after the last one
+        sleep.assert_called_once_with(0.01)
+
+    def test_skips_products_deleted_since_the_fetch(self):
+        make_product('a')
+        catalog = ml_model_service.build_catalog([
+            {'id': product_id, 'sales_last_7_days': 70, 'current_price': Decimal('10.00'),
+             'competitor_price': Decimal('11.00'), 'margin': Decimal('0.40')}
+            for product_id in ('a', 'gone')
+        ])
+        catalog['inventory'] = np.array([100, 100])
+        batch = {'id': catalog['id'], 'new_demand_forecast': np.array([1, 2]), 'new_suggested_price_cents': np.array([100, 200])}
+        stats = persist_predictions(catalog, batch, date(2024, 5, 1))
+
+        self.assertEqual(stats['products_updated'], 1)
+        self.assertFalse(Product.objects.filter(id='gone').exists())
+
+
+class IncrementalRunTests(TestCase):
+    """`run_ml_predictions --since-last-run` redoes only the products that changed."""
+
+    def setUp(self):
+        for product_id in ('a', 'b', 'c'):
+            make_product(product_id)
+        self.model = LinearRegression().fit(np.array([[0], [100], [300]]), np.array([5, 110, 290]))
+        self._run(incremental=False)
+
+    def _run(self, model_version='v1', incremental=True):
+        """Runs the command with a fixed model; returns the ids of the products it predicted."""
+        args = ['--since-last-run'] if incremental else []
+        with mock.patch(
+            'dashboard_app.management.commands.run_ml_predictions.Command._load_model',
+            return_value=(self.model, model_version),
+        ):
+            call_command('run_ml_predictions', *args, '--seed', '1', stdout=StringIO())
+        run = PredictionRun.objects.latest('started_at')
+        self.assertTrue(run.succeeded)
+        return set(PredictionState.objects.filter(predicted_at__gt=run.started_at).values_list('product_id', flat=True))
+
+    def test_run_does_not_reflag_its_own_writes(self):
+        self.assertEqual(self._run(), set())
+        self.assertEqual(self._run(), set())
+
+    def test_price_edit_reflags_the_product(self):
+        product = Product.objects.get(id='b')
+        product.current_price = Decimal('12.50')
+        product.save()
+        self.assertEqual(self._run(), {'b'})
+
+    def test_inventory_edit_reflags_the_product(self):
+        # Inventory is not a model input, but the update logs a new daily record
+        results = apply_product_updates([{'id': 'a', 'inventory': 3}], date.today())
+        self.assertEqual(results[0]['status'], 'success')
+        self.assertEqual(self._run(), {'a'})
+
+    def test_new_daily_record_reflags_the_product(self):
+        upsert_daily_record_rows([('c', date.today() - timedelta(days=20), 4, 90, Decimal('10.00'))])
+        self.assertEqual(self._run(), {'c'})
+
+    def test_model_version_change_predicts_every_product(self):
+        self.assertEqual(self._run(model_version='v2'), {'a', 'b', 'c'})
+        self.assertEqual(self._run(model_version='v2'), set())
+
+
+class ShardedPredictionTests(TestCase):
+    """`run_ml_predictions --workers N` predicts and writes like a serial run."""
+
+    def setUp(self):
+        for product in _random_products(80, seed=5):
+            make_product(product.pop('id'), **product)
+        self.model = LinearRegression().fit(np.array([[0], [100], [300]]), np.array([5, 110, 290]))
+
+    def _predict(self, *args):
+        """Runs the command and returns its suggested prices and daily records, then rolls it back."""
+        with transaction.atomic():
+            with mock.patch(
+                'dashboard_app.management.commands.run_ml_predictions.Command._load_model',
+                return_value=(self.model, 'v1'),
+            ):
+                call_command('run_ml_predictions', '--seed', '11', *args, stdout=StringIO(), stderr=StringIO())
+            prices = dict(Product.objects.values_list('id', 'suggested_price'))
+            records = set(ProductDailyRecord.objects.values_list('product_id', 'date', 'sales_units', 'inventory_level', 'price_at_day_end'))
+            transaction.set_rollback(True)
+        return prices, records
+
+    def test_shard_of_is_stable_and_covers_the_catalog(self):
+        self.assertEqual([prediction_shards.shard_of('sku-000001', 32), prediction_shards.shard_of(42, 8)], [18, 1])
+        ids = [f'sku-{i:06d}' for i in range(2000)]
+        shards = prediction_shards.partition_product_ids(ids)
+        self.assertEqual(len(shards), prediction_shards.SHARD_COUNT)
+        self.assertTrue(all(shards))
+        self.assertEqual(sorted(product_id for shard in shards for product_id in shard), ids)
+        for shard, product_ids in enumerate(shards):
+            self.assertTrue(all(prediction_shards.shard_of(product_id, len(shards)) == shard for product_id in product_ids))
+
+    def test_workers_match_the_serial_run(self):
+        serial = self._predict()
+        self.assertEqual(len(serial[0]), 80)
+        self.assertEqual(self._predict('--workers', '2'), serial)
+
+    def test_failed_shard_fails_the_command(self):
+        failing = prediction_shards.shard_of('p00000', prediction_shards.SHARD_COUNT)
+        predict_batch = prediction_shards.predict_batch
+
+        def predict_or_fail(catalog, *args):
+            if prediction_shards.shard_of(catalog['id'][0], prediction_shards.SHARD_COUNT) == failing:
+                raise RuntimeError('boom')
+            return predict_batch(catalog, *args)
+
+        with mock.patch.object(prediction_shards, 'predict_batch', predict_or_fail):
+            with self.assertRaisesMessage(CommandError, '1 shards'):
+                self._predict('--workers', '2')
+
+
+def _cursor(value, product_id='x'):
+    return base64.urlsafe_b64encode(json.dumps([value, product_id]).encode()).decode()
+
+
+class ProductListApiTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('tester'))
+
+    def _pages(self, **params):
+        """Follows nextCursor to the end; returns the id lists of every page."""
+        pages = []
+        cursor = None
+        while True:
+            query = dict(params, **({'cursor': cursor} if cursor else {}))
+            response = self.client.get('/api/products/', query)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            pages.append([product['id'] for product in data['results']])
+            cursor = data['nextCursor']
+            if cursor is None:
+                return pages
+
+    def test_page_boundaries(self):
+        for i in range(5):
+            make_product(f'p{i}', name=f'Name {i}')
+        self.assertEqual(self._pages(page_size=2), [['p0', 'p1'], ['p2', 'p3'], ['p4']])
+        # A full last page has no next cursor, rather than pointing at an empty page
+        Product.objects.filter(id='p4').delete()
+        self.assertEqual(self._pages(page_size=2), [['p0', 'p1'], ['p2', 'p3']])
+
+    def test_ties_on_the_sort_key_are_ordered_by_id(self):
+        for product_id in ('c', 'a', 'e', 'b', 'd'):
+            make_product(product_id, current_price=Decimal('5.00'))
+        make_product('z', current_price=Decimal('1.00'))
+        pages = self._pages(sort='price', page_size=2)
+        self.assertEqual(sum(pages, []), ['z', 'a', 'b', 'c', 'd', 'e'])
+        pages = self._pages(sort='-price', page_size=2)
+        self.assertEqual(sum(pages, []), ['e', 'd', 'c', 'b', 'a', 'z'])
+
+    def test_filters_and_sales_series(self):
+        make_product('low', inventory=10, demand_forecast=100)
+        make_product('out', inventory=0)
+        make_product('fine')
+        self.assertEqual(self._pages(stock='low'), [['low']])
+        self.assertEqual(self._pages(stock='out'), [['out']])
+        product = self.client.get('/api/products/').json()['results'][0]
+        self.assertEqual(product['historicalSalesData'], [0] * 7)
+
+    def test_bad_cursors_are_rejected(self):
+        make_product('a')
+        bad = {
+            'name': [
+                'not base64!', base64.urlsafe_b64encode(b'{not json').decode(),
+                _cursor(['a'], 'a'), _cursor({'a': 1}, 'a'), _cursor(3, 'a'), _cursor('a', 7),
+                base64.urlsafe_b64encode(json.dumps(['a', 'b', 'c']).encode()).decode(),
+                base64.urlsafe_b64encode(json.dumps({'value': 'a'}).encode()).decode(),
+            ],
+            'forecast': [_cursor(True), _cursor('3'), _cursor(3.5), _cursor(None)],
+            'price': [_cursor('NaN'), _cursor('Infinity'), _cursor('abc'), _cursor(5)],
+        }
+        for sort, cursors in bad.items():
+            for cursor in cursors:
+                with self.subTest(sort=sort, cursor=cursor):
+                    response = self.client.get('/api/products/', {'sort': sort, 'cursor': cursor})
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.json()['status'], 'error')
+
+    def test_valid_cursors_of_each_type(self):
+        make_product('a', demand_forecast=3, current_price=Decimal('2.50'))
+        make_product('b', demand_forecast=4, current_price=Decimal('3.50'))
+        for sort, cursor, expected in (
+            ('name', _cursor('Product a', 'a'), ['b']),
+            ('forecast', _cursor(3, 'a'), ['b']),
+            ('price', _cursor('2.50', 'a'), ['b']),
+        ):
+            with self.subTest(sort=sort):
+                response = self.client.get('/api/products/', {'sort': sort, 'cursor': cursor})
+                self.assertEqual([product['id'] for product in response.json()['results']], expected)
+
+    def test_dashboard_renders_catalog_totals_without_rows(self):
+        make_product('a', sales_last_7_days=10, current_price=Decimal('2.00'), margin=Decimal('0.20'))
+        make_product('b', sales_last_7_days=5, current_price=Decimal('4.00'), margin=Decimal('0.40'))
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['product_count'], 2)
+        self.assertAlmostEqual(response.context['total_revenue'], 40.0)
+        self.assertAlmostEqual(response.context['avg_margin'], 0.3)
+        self.assertNotContains(response, 'data-product-id="a"')
+
+
+# Per-process chart cache, so tests neither see nor leave rendered charts on disk
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'charts': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-charts'},
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ChartCacheTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('tester'))
+        for product_id in ('a', 'b'):
+            make_product(product_id)
+            upsert_daily_record_rows([
+                (product_id, date(2024, 5, day), day, 100 - day, Decimal('10.00')) for day in range(1, 4)
+            ])
+        self.addCleanup(chart_cache._cache().clear)
+
+    def _etag(self, product_id):
+        return chart_cache.chart_etag(product_id, 'sales', ChartRange.from_query({}).cache_key)
+
+    def test_revalidation_returns_304_without_rendering(self):
+        with mock.patch('dashboard_app.views.render_chart_in_pool', return_value=b'png') as render:
+            first = self.client.get('/api/chart/a/sales/')
+            self.assertEqual((first.status_code, first.content), (200, b'png'))
+            self.assertEqual(first['ETag'], f'"{self._etag("a")}"')
+            # Served from the cache
+            self.assertEqual(self.client.get('/api/chart/a/sales/').content, b'png')
+            revalidated = self.client.get('/api/chart/a/sales/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        render.assert_called_once()
+
+    def test_product_invalidation_changes_only_its_etag(self):
+        before = {product_id: self._etag(product_id) for product_id in ('a', 'b')}
+        chart_cache.invalidate_charts(['a'])
+        self.assertNotEqual(self._etag('a'), before['a'])
+        self.assertEqual(self._etag('b'), before['b'])
+
+    def test_bulk_invalidation_changes_every_etag(self):
+        many = [f'x{i}' for i in range(chart_cache.MAX_PER_PRODUCT_INVALIDATIONS + 1)]
+        for product_ids in (many, None):
+            before = {product_id: self._etag(product_id) for product_id in ('a', 'b')}
+            chart_cache.invalidate_charts(product_ids)
+            self.assertNotEqual(self._etag('a'), before['a'])
+            self.assertNotEqual(self._etag('b'), before['b'])
+
+    def test_invalidated_chart_is_rendered_again(self):
+        with mock.patch('dashboard_app.views.render_chart_in_pool', side_effect=[b'old', b'new']):
+            etag = self.client.get('/api/chart/a/sales/')['ETag']
+            chart_cache.invalidate_charts(['a'])
+            response = self.client.get('/api/chart/a/sales/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.content), (200, b'new'))
+
+
+def _decode_deltas(deltas, scale=1):
+    """Client-side decoding of a delta-encoded /api/history/ column."""
+    return list(np.cumsum(deltas) / scale)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ChartDataTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('tester'))
+        make_product('a')
+        self.first_day = date(2023, 1, 1)
+        rng = np.random.default_rng(2)
+        upsert_daily_record_rows([
+            ('a', self.first_day + timedelta(days=day), int(rng.integers(0, 50)), int(rng.integers(0, 500)),
+             Decimal(int(rng.integers(100, 5000))) / 100)
+            for day in range(500)
+        ])
+        self.addCleanup(chart_cache._cache().clear)
+
+    def test_range_from_query(self):
+        chart_range = ChartRange.from_query({'start': '2023-01-01', 'end': '2023-02-01', 'resolution': 'week'})
+        self.assertEqual((chart_range.start, chart_range.end, chart_range.resolution), (date(2023, 1, 1), date(2023, 2, 1), 'week'))
+        self.assertEqual(ChartRange.from_query({}).cache_key, '::auto')
+        for params, message in (
+            ({'start': '2023-13-01'}, 'Invalid date'),
+            ({'start': '2023-02-01', 'end': '2023-01-01'}, 'start must not be after end'),
+            ({'resolution': 'year'}, 'Invalid resolution'),
+        ):
+            with self.subTest(params=params):
+                with self.assertRaisesMessage(ValueError, message):
+                    ChartRange.from_query(params)
+                self.assertEqual(self.client.get('/api/history/a/', params).status_code, 400)
+                self.assertEqual(self.client.get('/api/chart/a/sales/', params).status_code, 400)
+                self.assertEqual(self.client.get('/api/charts/a/', params).status_code, 400)
+
+    def test_long_range_switches_resolution(self):
+        month = ChartRange.from_query({'start': '2023-01-01', 'end': '2023-01-31'})
+        dates, columns, resolution = chart_data.load_history_columns('a', month)
+        self.assertEqual((resolution, len(dates)), ('day', 31))
+
+        dates, columns, resolution = chart_data.load_history_columns('a')
+        self.assertEqual(resolution, 'week')
+        self.assertLessEqual(len(dates), chart_data.MAX_CHART_POINTS)
+        # Weeks start on Monday; 2023-01-01 was a Sunday
+        self.assertEqual(dates[:2], [date(2022, 12, 26), date(2023, 1, 2)])
+        first_week = ProductDailyRecord.objects.filter(product_id='a', date__lte=date(2023, 1, 8), date__gte=date(2023, 1, 2))
+        self.assertAlmostEqual(columns['sales_units'][1], np.mean([record.sales_units for record in first_week]))
+
+        dates, _, resolution = chart_data.load_history_columns('a', max_points=30)
+        self.assertEqual((resolution, len(dates)), ('month', 17))
+        dates, _, resolution = chart_data.load_history_columns('a', ChartRange(resolution='day'))
+        self.assertEqual((resolution, len(dates)), ('day', 500))
+
+    def test_delta_encoding_round_trips(self):
+        for params in ({'start': '2023-03-01', 'end': '2023-05-31'}, {'resolution': 'week'}):
+            with self.subTest(params=params):
+                chart_range = ChartRange.from_query(params)
+                dates, columns, resolution = chart_data.load_history_columns('a', chart_range)
+                plain = self.client.get('/api/history/a/', params).json()
+                encoded = self.client.get('/api/history/a/', {**params, 'delta': '1'}).json()
+                self.assertEqual((plain['resolution'], encoded['resolution']), (resolution, resolution))
+
+                self.assertEqual(
+                    [int(days) for days in _decode_deltas(encoded['dates'])],
+                    [day.toordinal() - chart_data.EPOCH_ORDINAL for day in dates],
+                )
+                self.assertEqual(plain['dates'], [day.isoformat() for day in dates])
+                for field, key in chart_data.HISTORY_JSON_KEYS.items():
+                    decoded = _decode_deltas(encoded[key], encoded['scale'][key])
+                    np.testing.assert_allclose(decoded, columns[field], atol=0.5 / encoded['scale'][key])
+                    np.testing.assert_allclose(plain[key], columns[field], atol=0.005)
+                if resolution == 'day':
+                    # Whole numbers and cents are exact
+                    self.assertEqual(encoded['scale'], {'sales': 1, 'price': 100, 'inventory': 1})
+                    self.assertEqual(_decode_deltas(encoded['sales']), columns['sales_units'])
+                    self.assertEqual(_decode_deltas(encoded['price'], 100), columns['price_at_day_end'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ChartPrerenderTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('tester'))
+        for product_id, forecast, days in (('a', 5, 3), ('b', 30, 3), ('c', 20, 3), ('d', 10, 1)):
+            make_product(product_id, demand_forecast=forecast)
+            upsert_daily_record_rows([(product_id, date(2024, 5, day), day, 10, Decimal('1.00')) for day in range(1, days + 1)])
+        self.addCleanup(chart_cache._cache().clear)
+
+    def _cached(self, product_id):
+        version = chart_cache.get_history_version(product_id)
+        return chart_cache.get_cached_chart(product_id, chart_prerender.PANELS_CHART_TYPE, version, ChartRange().cache_key)
+
+    def test_top_products(self):
+        self.assertEqual([product_id for product_id, _ in chart_prerender.top_products(3)], ['b', 'c', 'd'])
+        self.assertEqual(chart_prerender.top_products(1, by='sales'), [('a', 'Product a')])
+
+    def test_prerender_fills_the_cache_for_the_top_products(self):
+        stats = chart_prerender.prerender_panels(chart_prerender.top_products(3))
+        self.assertEqual((stats['rendered'], stats['cached'], stats['empty']), (2, 0, 1))
+        cached = {product_id: self._cached(product_id) for product_id in 'abcd'}
+        self.assertIsNone(cached['a'])
+        self.assertTrue(cached['b'].startswith(b'\x89PNG') and cached['c'].startswith(b'\x89PNG'))
+        self.assertEqual(cached['d'], b'')
+
+        stats = chart_prerender.prerender_panels(chart_prerender.top_products(3))
+        self.assertEqual((stats['rendered'], stats['cached']), (0, 3))
+
+        # Served from the cache, without rendering in the request
+        with mock.patch('dashboard_app.views.render_panels_in_pool') as render:
+            response = self.client.get('/api/charts/b/')
+        self.assertEqual((response.status_code, response.content), (200, cached['b']))
+        render.assert_not_called()
+
+
+class ExportTests(TestCase):
+    """Exports stream every row, across keyset pages, in each format."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('tester'))
+        for product_id in ('a', 'b', 'c'):
+            make_product(product_id, category='Toys' if product_id != 'b' else 'Books')
+            upsert_daily_record_rows([
+                (product_id, date(2024, 5, day), day * 3, 50 - day, Decimal(f'{day}.25')) for day in range(1, 6)
+            ])
+        # Small pages: history page boundaries fall inside a product's history and between products
+        for name, page_size in (('iter_history_rows', 4), ('iter_product_rows', 2)):
+            patcher = mock.patch(f'dashboard_app.views.{name}', partial(getattr(exports, name), page_size=page_size))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _get(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def _history(self, **filters):
+        return list(ProductDailyRecord.objects.filter(**filters).order_by('product_id', 'date').values_list(*exports.HISTORY_EXPORT_FIELDS))
+
+    def test_history_csv_matches_the_database(self):
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(csv.reader(StringIO(self._get('/api/export/history/').decode())))
+        self.assertEqual(sum('dashboard_app_productdailyrecord' in query['sql'] for query in queries), 4)
+        self.assertEqual(rows[0], list(exports.HISTORY_EXPORT_FIELDS))
+        self.assertEqual(rows[1:], [[str(value) for value in row] for row in self._history()])
+        self.assertEqual(len(rows), 16)
+
+        rows = list(csv.reader(StringIO(self._get('/api/export/history/', category='Toys', start='2024-05-02').decode())))
+        self.assertEqual(rows[1:], [[str(value) for value in row] for row in self._history(product__category='Toys', date__gte=date(2024, 5, 2))])
+
+    def test_history_ndjson_matches_the_database(self):
+        lines = [json.loads(line) for line in self._get('/api/export/history/', format='ndjson').decode().splitlines()]
+        self.assertEqual(lines, [
+            {'product_id': product_id, 'date': record_date.isoformat(), 'sales_units': sales,
+             'inventory_level': inventory, 'price_at_day_end': float(price)}
+            for product_id, record_date, sales, inventory, price in self._history()
+        ])
+
+    def test_products_csv_matches_the_database(self):
+        rows = list(csv.reader(StringIO(self._get('/api/export/products/').decode())))
+        expected = Product.objects.order_by('id').values_list(*exports.PRODUCT_EXPORT_FIELDS)
+        self.assertEqual(rows[1:], [[str(value) for value in row] for row in expected])
+
+    def test_gzip_variant_has_the_same_bytes(self):
+        for path in ('/api/export/history/', '/api/export/products/'):
+            for export_format in ('csv', 'ndjson'):
+                with self.subTest(path=path, format=export_format):
+                    plain = self._get(path, format=export_format)
+                    self.assertEqual(gzip.decompress(self._get(path, format=export_format, gzip='1')), plain)
+
+    def test_chunk_size_does_not_change_the_output(self):
+        rows = self._history()
+        whole = b''.join(exports.csv_chunks(exports.HISTORY_EXPORT_FIELDS, rows))
+        self.assertEqual(b''.join(exports.csv_chunks(exports.HISTORY_EXPORT_FIELDS, rows, buffer_size=10)), whole)
+        whole = b''.join(exports.ndjson_chunks(exports.HISTORY_EXPORT_FIELDS, rows))
+        self.assertEqual(b''.join(exports.ndjson_chunks(exports.HISTORY_EXPORT_FIELDS, rows, buffer_size=10)), whole)
+
+
+class ProgressReporterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        patcher = mock.patch('dashboard_app.progress.time.perf_counter', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.out = StringIO()
+
+    def _reporter(self, **kwargs):
+        return ProgressReporter(OutputWrapper(self.out), no_style(), interval=5, **kwargs)
+
+    def _lines(self):
+        return self.out.getvalue().splitlines()
+
+    def test_writes_at_most_once_per_interval(self):
+        progress = self._reporter()
+        for self.now, rows in ((1, 10), (2, 20), (4.9, 30)):
+            progress.set(rows_written=rows)
+        self.assertEqual(self._lines(), [])
+        self.now = 5
+        progress.add(rows_written=5)
+        self.assertEqual(self._lines(), ['[    5.0s] rows written: 35'])
+        for self.now in (6, 9.9):
+            progress.add(rows_written=1)
+        self.assertEqual(len(self._lines()), 1)
+
+        # The final flush writes what changed since, once
+        progress.flush()
+        progress.flush()
+        self.assertEqual(self._lines()[1:], ['[    9.9s] rows written: 37'])
+        self.assertEqual(progress.summary(), {'rows_written': 37, 'elapsed': 9.9})
+
+    def test_job_heartbeat_and_detail_lines(self):
+        with mock.patch('dashboard_app.progress.report_progress') as report:
+            progress = self._reporter(verbosity=0, job_id=7)
+            progress.set(products_predicted=3, rows_written=6, history_records_added=2)
+            progress.detail('hidden')
+            self.now = 5
+            progress.set(products_predicted=4)
+        report.assert_called_once_with(7, products_predicted=4, rows_written=6)
+        self.assertEqual(self._lines(), [])
+
+        progress = self._reporter(verbosity=3)
+        progress.detail('p1: demand forecast 3')
+        self.assertEqual(self._lines(), ['  p1: demand forecast 3'])
+
+
+@override_settings(JOB_SPAWN_WORKER=False)
+class PredictionJobTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.client.force_login(self.user)
+
+    def test_trigger_returns_202_with_the_queued_job(self):
+        response = self.client.post('/api/run_ml_predictions/', {'sinceLastRun': True}, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        job = response.json()['job']
+        self.assertEqual(job['status'], PredictionJob.QUEUED)
+        self.assertEqual(PredictionJob.objects.get(id=job['id']).options, {'since_last_run': True})
+
+        status = self.client.get(f'/api/jobs/{job["id"]}/').json()['job']
+        self.assertEqual((status['id'], status['status']), (job['id'], PredictionJob.QUEUED))
+
+    def test_trigger_spawns_a_worker_only_for_a_new_job(self):
+        with override_settings(JOB_SPAWN_WORKER=True), mock.patch('dashboard_app.views.spawn_worker') as spawn:
+            first = self.client.post('/api/run_ml_predictions/', content_type='application/json').json()['job']
+            second = self.client.post('/api/run_ml_predictions/', content_type='application/json').json()['job']
+        self.assertEqual(first['id'], second['id'])
+        spawn.assert_called_once_with()
+
+    def test_the_constraint_allows_one_active_job_per_kind(self):
+        PredictionJob.objects.create(status=PredictionJob.RUNNING)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PredictionJob.objects.create()
+        # Finished jobs do not count
+        PredictionJob.objects.update(status=PredictionJob.SUCCEEDED)
+        PredictionJob.objects.create(status=PredictionJob.FAILED)
+        PredictionJob.objects.create()
+
+    def test_enqueue_returns_the_active_job(self):
+        job, created = jobs.enqueue_job(user=self.user)
+        self.assertTrue(created)
+        self.assertEqual(jobs.enqueue_job(), (job, False))
+        PredictionJob.objects.filter(id=job.id).update(status=PredictionJob.RUNNING)
+        self.assertEqual(jobs.enqueue_job(), (job, False))
+        with self.assertRaises(ValueError):
+            jobs.enqueue_job('flush')
+
+    def test_stale_jobs_no_longer_block_new_ones(self):
+        job, _ = jobs.enqueue_job()
+        PredictionJob.objects.filter(id=job.id).update(status=PredictionJob.RUNNING, heartbeat_at=timezone.now() - timedelta(days=1))
+        new_job, created = jobs.enqueue_job()
+        self.assertTrue(created)
+        job.refresh_from_db()
+        self.assertEqual(job.status, PredictionJob.FAILED)
+        self.assertNotEqual(new_job.id, job.id)
+
+    def test_worker_runs_a_job_to_success(self):
+        job, _ = jobs.enqueue_job(options={'since_last_run': True})
+        seen = []
+
+        def command(kind, stdout, job_id, **options):
+            seen.append(PredictionJob.objects.get(id=job_id).status)
+            jobs.report_progress(job_id, products_predicted=3, rows_written=6)
+            stdout.write('done\n')
+            self.assertEqual(options, {'since_last_run': True})
+
+        with mock.patch.object(jobs, 'call_command', side_effect=command):
+            claimed = jobs.claim_next_job()
+            self.assertEqual((claimed.id, claimed.status), (job.id, PredictionJob.RUNNING))
+            self.assertIsNone(jobs.claim_next_job())
+            job = jobs.run_job(claimed)
+
+        self.assertEqual(seen, [PredictionJob.RUNNING])
+        self.assertEqual(job.status, PredictionJob.SUCCEEDED)
+        self.assertEqual((job.products_predicted, job.rows_written, job.output), (3, 6, 'done\n'))
+        self.assertIsNotNone(job.finished_at)
+        # The finished job frees the slot for the next trigger
+        self.assertTrue(jobs.enqueue_job()[1])
+
+    def test_worker_records_a_failed_job(self):
+        jobs.enqueue_job()
+        with mock.patch.object(jobs, 'call_command', side_effect=RuntimeError('model missing')):
+            job = jobs.run_job(jobs.claim_next_job())
+        self.assertEqual((job.status, job.message), (PredictionJob.FAILED, 'model missing'))
+
+    def test_output_tail_keeps_the_last_characters(self):
+        tail = jobs.OutputTail(5)
+        for text in ('abc', 'defg', 'h'):
+            tail.write(text)
+        self.assertEqual(tail.getvalue(), 'defgh')
+        tail.write('x' * 100 + 'yz')
+        self.assertEqual(tail.getvalue(), 'xxxyz')
+
+
+def run_manage(*args):
+    """
+    Runs a manage.py command in a child process. Benchmark commands create
+    and destroy their own test database, which must not replace this one.
+    """
+    return subprocess.run(
+        [sys.executable, str(settings.BASE_DIR / 'manage.py'), *args],
+        capture_output=True, text=True, timeout=300,
+        env={**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE},
+    )
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+
+    def test_benchmark_queries_runs(self):
+        result = run_manage('benchmark_queries', '--products', '30', '--days', '7', '--repeat', '1')
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('USING COVERING INDEX dailyrecord_product_date_cov', result.stdout)
+        self.assertEqual(result.stdout.count('product listing page by category'), 3)
+
+    def _run_stress(self, *args):
+        # The prediction run trains and saves the per-product bundle when there is none
+        if not os.path.exists(ml_model_service.BUNDLE_PATH):
+            self.addCleanup(lambda: os.path.exists(ml_model_service.BUNDLE_PATH) and os.remove(ml_model_service.BUNDLE_PATH))
+        return run_manage('stress_sqlite', '--products', '200', '--days', '7', '--readers', '1', '--profile', 'configured', *args)
+
+    def test_stress_sqlite_passes_within_the_write_limits(self):
+        result = self._run_stress()
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('0 failed (0 locked)', result.stdout)
+
+    def test_stress_sqlite_fails_above_the_write_limits(self):
+        result = self._run_stress('--max-write-p95-ms', '0.001', '--max-write-ms', '0.001')
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('Configured SQLite profile: update p95', result.stderr)
+
+
+def _histogram(name, **labels):
+    """(sum, count) of a histogram in the process registry, or None if nothing was observed."""
+    key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+    values = registry.drain()[1].get(key)
+    return None if values is None else (values[-2], values[-1])
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+
+    def test_merge_adds_drained_values(self):
+        worker = MetricsRegistry()
+        worker.inc('dashboard_chart_render_rejections_total', reason='busy')
+        worker.observe('dashboard_chart_render_seconds', 0.02, chart='sales')
+        registry.observe('dashboard_chart_render_seconds', 0.5, chart='sales')
+        registry.merge(worker.drain())
+        self.assertEqual(worker.drain(), ({}, {}))
+        self.assertIn('dashboard_chart_render_rejections_total{reason="busy"} 1', registry.render())
+        self.assertEqual(_histogram('dashboard_chart_render_seconds', chart='sales'), (0.52, 2))
+
+    def test_process_pool_renders_are_recorded_in_the_parent(self):
+        with override_settings(CHART_RENDER_EXECUTOR='process', CHART_RENDER_WORKERS=1):
+            chart_renderer._executor = None
+            try:
+                png = chart_renderer.render_chart_in_pool('sales', 'Widget', [date(2024, 5, 1), date(2024, 5, 2)], [1, 2])
+                self.assertIsInstance(chart_renderer._executor, chart_renderer.ProcessPoolExecutor)
+            finally:
+                chart_renderer._executor.shutdown()
+                chart_renderer._executor = None
+        self.assertTrue(png.startswith(b'\x89PNG'))
+        self.assertEqual(_histogram('dashboard_chart_render_seconds', chart='sales')[1], 1)
+
+    def test_queries_of_streamed_bodies_are_counted(self):
+        self.client.force_login(User.objects.create_user('tester'))
+        make_product('a')
+        upsert_daily_record_rows([('a', date(2024, 5, 1), 1, 2, Decimal('3.00'))])
+        registry.reset()
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/export/history/')
+            at_return = len(captured)
+            # Nothing is recorded before the body has been sent
+            self.assertIsNone(_histogram('dashboard_db_queries_per_request', view='api_export_history'))
+            body = b''.join(response.streaming_content)
+        self.assertIn(b'a,2024-05-01,1,2,3.00', body)
+        self.assertGreater(len(captured), at_return)
+        self.assertEqual(_histogram('dashboard_db_queries_per_request', view='api_export_history'), (len(captured), 1))
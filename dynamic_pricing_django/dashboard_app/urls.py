@@ -6,8 +6,17 @@ from . import views
 urlpatterns = [
     path('', views.dashboard_view, name='dashboard'),
     path('product/<str:product_id>/', views.product_detail_view, name='product_detail'),
+    path('api/products/', views.api_list_products, name='api_list_products'),
+    path('api/products/bulk_update/', views.api_bulk_update_products, name='api_bulk_update_products'),
     path('api/update_product/', views.api_update_product, name='api_update_product'),
     path('api/run_ml_predictions/', views.api_run_ml_predictions, name='api_run_ml_predictions'),
+    path('api/jobs/<int:job_id>/', views.api_job_status, name='api_job_status'),
+    path('api/export/history/', views.api_export_history, name='api_export_history'),
+    path('api/export/products/', views.api_export_products, name='api_export_products'),
+    path('api/import/history/', views.api_import_history, name='api_import_history'),
     path('api/add_historical_record/', views.api_add_historical_record, name='api_add_historical_record'),
     path('api/chart/<str:product_id>/<str:chart_type>/', views.api_get_chart, name='api_get_chart'), # New URL
+    path('api/charts/<str:product_id>/', views.api_get_chart_panels, name='api_get_chart_panels'),
+    path('api/history/<str:product_id>/', views.api_get_history, name='api_get_history'),
+    path('api/metrics/', views.api_metrics, name='api_metrics'),
 ]
@@ -1,24 +1,42 @@
 # dashboard_app/views.py
 
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse, HttpResponse # Import HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse # Import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from django.utils.cache import patch_cache_control
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.db.models import Avg, Count, DecimalField, ExpressionWrapper, F, Q, Sum
 import json
-from .models import Product, ProductDailyRecord
+import base64
+import binascii
+import hmac
+from .models import PredictionJob, Product, ProductDailyRecord
+from .jobs import enqueue_job, job_to_json, spawn_worker
+from .aggregates import apply_record_changes, current_as_of, read_window_records
+from .bulk_ops import MAX_BULK_UPDATE_ITEMS, apply_product_updates
+from .history_import import import_history, iter_csv_rows, iter_parquet_rows
+from .exports import (
+    HISTORY_EXPORT_FIELDS, PRODUCT_EXPORT_FIELDS, csv_chunks, gzip_chunks,
+    iter_history_rows, iter_product_rows, ndjson_chunks,
+)
+from .chart_cache import (
+    chart_etag, chart_last_modified, get_cached_chart, get_history_version,
+    invalidate_charts, set_cached_chart,
+)
 from decimal import Decimal
-from datetime import date, timedelta, datetime
+from datetime import date, datetime
 import random
 import os
 
-from django.core.management import call_command
-from io import StringIO
+from django.conf import settings
 
-# For Matplotlib plotting
-import matplotlib
-matplotlib.use('Agg') # Use 'Agg' backend for non-interactive plotting (important for server-side)
-import matplotlib.pyplot as plt
-import io # To save plot to a buffer
+# Charts are rendered with Matplotlib's object-oriented API on a worker pool
+from .chart_renderer import ChartRendererBusy, ChartRenderTimeout, render_chart_in_pool, render_panels_in_pool
+from .chart_data import CHART_VALUE_FIELDS, ChartRange, encode_history_columns, load_chart_series, load_history_columns
+from .chart_prerender import PANELS_CHART_TYPE, render_panels
+from .metrics import inc, prediction_run_gauges, registry
 
 
 # Define the path where charts were previously saved (no longer directly saving here for dynamic charts)
@@ -29,47 +47,26 @@ import io # To save plot to a buffer
 @login_required
 def dashboard_view(request):
     """
-    Renders the main dashboard page, fetching all product data and historical records.
+    Renders the main dashboard page. The product table is filled page by page
+    from /api/products/, so only catalog-wide totals are computed here.
+    Read-only: the sales aggregates are rolled forward by run_ml_predictions
+    and the daily refresh_sales_aggregates job, never by a page view.
     Requires user to be logged in.
     """
-    products = Product.objects.all().order_by('name')
-
-    products_for_template = []
-    for product in products:
-        low_stock_threshold = product.demand_forecast * Decimal('0.5')
-        is_low_stock = product.inventory < low_stock_threshold and product.inventory > 0
-        is_out_of_stock = product.inventory == 0
-
-        today = date.today()
-        seven_days_ago = today - timedelta(days=6)
-        historical_records = product.daily_records.filter(date__range=[seven_days_ago, today]).order_by('date')
-
-        historical_sales_map = {record.date.isoformat(): record.sales_units for record in historical_records}
-
-        sales_data_for_chart = []
-        for i in range(7):
-            current_date = seven_days_ago + timedelta(days=i)
-            sales_data_for_chart.append(historical_sales_map.get(current_date.isoformat(), 0))
-
-
-        products_for_template.append({
-            'id': product.id,
-            'name': product.name,
-            'category': product.category,
-            'current_price': float(product.current_price),
-            'suggested_price': float(product.suggested_price),
-            'inventory': product.inventory,
-            'demand_forecast': product.demand_forecast,
-            'sales_last_7_days': product.sales_last_7_days,
-            'margin': float(product.margin),
-            'competitor_price': float(product.competitor_price),
-            'last_updated': product.last_updated.isoformat(),
-            'is_low_stock': is_low_stock,
-            'is_out_of_stock': is_out_of_stock,
-            'historical_sales_data': sales_data_for_chart,
-        })
-
-    return render(request, 'dashboard.html', {'products': products_for_template, 'user': request.user})
+    totals = Product.objects.aggregate(
+        products=Count('id'),
+        revenue=Sum(ExpressionWrapper(F('sales_last_7_days') * F('current_price'), output_field=DecimalField())),
+        avg_margin=Avg('margin'),
+    )
+
+    return render(request, 'dashboard.html', {
+        'product_count': totals['products'],
+        'total_revenue': float(totals['revenue'] or 0),
+        'avg_margin': float(totals['avg_margin'] or 0),
+        'page_size': PRODUCT_PAGE_SIZE,
+        'sales_series_end': current_as_of().isoformat(),
+        'user': request.user,
+    })
 
 @login_required
 def product_detail_view(request, product_id):
@@ -102,59 +99,306 @@ def product_detail_view(request, product_id):
     return render(request, 'product_detail.html', {'product': product_data, 'user': request.user})
 
 
+def _chart_response(png_bytes):
+    if not png_bytes:
+        # Not enough data to plot
+        response = HttpResponse(status=204) # 204 No Content
+    else:
+        response = HttpResponse(png_bytes, content_type='image/png')
+    # Let browsers keep the image but revalidate it (cheap 304) on every use
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _chart_busy_response(error):
+    inc('dashboard_chart_render_rejections_total', reason='busy' if isinstance(error, ChartRendererBusy) else 'timeout')
+    response = HttpResponse(status=503, content=str(error))
+    response['Retry-After'] = '2'
+    return response
+
+
+def _chart_range_key(request):
+    """Cache key part of the requested chart range, or None if the parameters are invalid."""
+    try:
+        return ChartRange.from_query(request.GET).cache_key
+    except ValueError:
+        return None
+
+
+def _chart_etag(request, product_id, chart_type):
+    range_key = _chart_range_key(request)
+    return chart_etag(product_id, chart_type, range_key) if range_key is not None else None
+
+
 @login_required
+@condition(
+    etag_func=_chart_etag,
+    last_modified_func=lambda request, product_id, chart_type: chart_last_modified(product_id),
+)
 def api_get_chart(request, product_id, chart_type):
     """
     API endpoint to generate and return a specific Matplotlib chart image.
+    Rendering runs on the bounded, pyplot-free pool in chart_renderer; a full
+    queue or a timeout is reported as 503 with Retry-After.
+    Rendered images are cached per product, chart type, range and history version;
+    conditional requests matching the current version get a 304 without rendering.
+
+    Query parameters:
+        start, end: Date range to plot (YYYY-MM-DD, both inclusive; default: all history).
+        resolution: 'day', 'week', 'month' or 'auto' (default), which plots daily
+                    values unless they exceed chart_data.MAX_CHART_POINTS and
+                    weekly or monthly averages otherwise.
     Requires user to be logged in.
     """
-    product = get_object_or_404(Product, id=product_id)
-    historical_records = product.daily_records.all().order_by('date')
+    if chart_type not in CHART_VALUE_FIELDS:
+        return HttpResponse(status=404, content="Chart type not found.")
+    try:
+        chart_range = ChartRange.from_query(request.GET)
+    except ValueError as e:
+        return HttpResponse(status=400, content=str(e))
 
-    dates = [record.date for record in historical_records]
-    sales_units = [record.sales_units for record in historical_records]
-    inventory_levels = [record.inventory_level for record in historical_records]
-    prices_at_day_end = [float(record.price_at_day_end) for record in historical_records]
+    version = get_history_version(product_id)
+    cached_png = get_cached_chart(product_id, chart_type, version, chart_range.cache_key)
+    inc('dashboard_chart_cache_requests_total', chart=chart_type, result='miss' if cached_png is None else 'hit')
+    if cached_png is not None:
+        return _chart_response(cached_png)
+
+    product = get_object_or_404(Product, id=product_id)
+    dates, values, resolution = load_chart_series(product.id, CHART_VALUE_FIELDS[chart_type], chart_range)
 
     # Ensure there's enough data to plot
     if len(dates) < 2: # Need at least two points to draw a line
         # Return a placeholder or empty image if not enough data
         # For simplicity, we'll return a blank image or 404
         # In a real app, you might serve a "no data" image.
-        return HttpResponse(status=204) # 204 No Content
-
-    plt.figure(figsize=(10, 5)) # Consistent figure size
-    plt.xticks(rotation=45, ha='right') # Rotate date labels for readability
-    plt.tight_layout() # Adjust layout to prevent labels overlapping
-
-    if chart_type == 'sales':
-        plt.plot(dates, sales_units, marker='o', linestyle='-', color='#4BC0C0') # Teal
-        plt.title(f'{product.name} - Daily Sales History')
-        plt.xlabel('Date')
-        plt.ylabel('Units Sold')
-        plt.grid(True)
-    elif chart_type == 'price':
-        plt.plot(dates, prices_at_day_end, marker='o', linestyle='-', color='#9966FF') # Purple
-        plt.title(f'{product.name} - Daily Price History')
-        plt.xlabel('Date')
-        plt.ylabel('Price ($)')
-        plt.grid(True)
-    elif chart_type == 'inventory':
-        plt.plot(dates, inventory_levels, marker='o', linestyle='-', color='#FF6384') # Red
-        plt.title(f'{product.name} - Daily Inventory History')
-        plt.xlabel('Date')
-        plt.ylabel('Units')
-        plt.grid(True)
-    else:
-        return HttpResponse(status=404, content="Chart type not found.")
+        set_cached_chart(product_id, chart_type, version, b'', chart_range.cache_key)
+        return _chart_response(b'')
+
+    try:
+        png_bytes = render_chart_in_pool(chart_type, product.name, dates, values, resolution)
+    except (ChartRendererBusy, ChartRenderTimeout) as e:
+        return _chart_busy_response(e)
+
+    set_cached_chart(product_id, chart_type, version, png_bytes, chart_range.cache_key)
+    return _chart_response(png_bytes)
+
+
+@login_required
+@condition(
+    etag_func=lambda request, product_id: _chart_etag(request, product_id, PANELS_CHART_TYPE),
+    last_modified_func=lambda request, product_id: chart_last_modified(product_id),
+)
+def api_get_chart_panels(request, product_id):
+    """
+    API endpoint returning the sales, price and inventory charts of a product
+    as one PNG with three stacked panels, for reports and email digests.
+    The history is loaded once for all three panels and the figure is
+    rendered on the chart pool, cached and revalidated like api_get_chart,
+    whose query parameters it accepts. Charts of the top products are
+    pre-rendered by the prerender_charts command.
+    Requires user to be logged in.
+    """
+    try:
+        chart_range = ChartRange.from_query(request.GET)
+    except ValueError as e:
+        return HttpResponse(status=400, content=str(e))
+
+    version = get_history_version(product_id)
+    cached_png = get_cached_chart(product_id, PANELS_CHART_TYPE, version, chart_range.cache_key)
+    inc('dashboard_chart_cache_requests_total', chart=PANELS_CHART_TYPE, result='miss' if cached_png is None else 'hit')
+    if cached_png is not None:
+        return _chart_response(cached_png)
+
+    product_name = Product.objects.filter(id=product_id).values_list('name', flat=True).first()
+    if product_name is None:
+        return HttpResponse(status=404, content="Product not found.")
+    try:
+        png_bytes = render_panels(product_id, product_name, chart_range, version, render=render_panels_in_pool)
+    except (ChartRendererBusy, ChartRenderTimeout) as e:
+        return _chart_busy_response(e)
+    return _chart_response(png_bytes)
+
+
+def _history_etag(request, product_id):
+    range_key = _chart_range_key(request)
+    if range_key is None:
+        return None
+    return chart_etag(product_id, 'history', f"{range_key}:{request.GET.get('delta') == '1'}")
+
+
+@login_required
+@condition(
+    etag_func=_history_etag,
+    last_modified_func=lambda request, product_id: chart_last_modified(product_id),
+)
+def api_get_history(request, product_id):
+    """
+    API endpoint returning a product's history as compact columnar JSON
+    (parallel date, sales, price and inventory arrays) for charts rendered in
+    the browser. A history that fits the point budget is read in one query.
+    Responses carry the chart ETag, so an unchanged history costs a 304.
+
+    Query parameters:
+        start, end, resolution: As for api_get_chart.
+        delta: '1' for delta-encoded integer columns (see chart_data.encode_history_columns).
+    Requires user to be logged in.
+    """
+    try:
+        chart_range = ChartRange.from_query(request.GET)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
-    # Save plot to a BytesIO object (in-memory buffer)
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png')
-    buffer.seek(0) # Rewind the buffer to the beginning
-    plt.close() # Close the plot to free memory
+    dates, columns, resolution = load_history_columns(product_id, chart_range)
+    if not dates and not Product.objects.filter(id=product_id).exists():
+        return JsonResponse({'status': 'error', 'message': 'Product not found.'}, status=404)
 
-    return HttpResponse(buffer.getvalue(), content_type='image/png')
+    payload = {'status': 'success', 'productId': product_id, 'resolution': resolution}
+    payload.update(encode_history_columns(dates, columns, resolution, delta=request.GET.get('delta') == '1'))
+    response = JsonResponse(payload, json_dumps_params={'separators': (',', ':')})
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _product_to_json(product):
+    """Compact camelCase representation of a product, as used by the dashboard's JavaScript."""
+    return {
+        'id': product.id,
+        'name': product.name,
+        'category': product.category,
+        'currentPrice': float(product.current_price),
+        'suggestedPrice': float(product.suggested_price),
+        'inventory': product.inventory,
+        'demandForecast': product.demand_forecast,
+        'salesLast7Days': product.sales_last_7_days,
+        'margin': float(product.margin),
+        'competitorPrice': float(product.competitor_price),
+        'lastUpdated': product.last_updated.isoformat(),
+    }
+
+
+# Sort keys accepted by api_list_products, mapped to model fields
+PRODUCT_SORT_FIELDS = {
+    'name': 'name',
+    'price': 'current_price',
+    'margin': 'margin',
+    'forecast': 'demand_forecast',
+}
+PRODUCT_PAGE_SIZE = 50
+MAX_PRODUCT_PAGE_SIZE = 500
+
+# JSON type of the sort value carried in a cursor, per sort field (decimals travel as strings)
+CURSOR_VALUE_TYPES = {
+    'name': str,
+    'current_price': str,
+    'margin': str,
+    'demand_forecast': int,
+}
+
+
+def _encode_cursor(sort_value, product_id):
+    if isinstance(sort_value, Decimal):
+        sort_value = str(sort_value)
+    payload = json.dumps([sort_value, product_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def _decode_cursor(cursor, sort_field):
+    """
+    Returns the (sort value, product id) of a cursor made by `_encode_cursor`.
+    Raises ValueError unless it is exactly that pair, with a sort value of the
+    sort field's type.
+    """
+    decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(decoded, list) or len(decoded) != 2:
+        raise ValueError('cursor is not a (value, id) pair')
+    sort_value, product_id = decoded
+    # type() rather than isinstance(), so that true/false do not pass as integers
+    if type(sort_value) is not CURSOR_VALUE_TYPES[sort_field] or not isinstance(product_id, str):
+        raise ValueError('cursor does not match the sort order')
+    if sort_field in ('current_price', 'margin'):
+        sort_value = Decimal(sort_value)
+        if not sort_value.is_finite():
+            raise ValueError('cursor value is not a number')
+    return sort_value, product_id
+
+
+@login_required
+def api_list_products(request):
+    """
+    API endpoint returning one page of products as compact JSON.
+    Uses keyset (cursor) pagination on (sort field, id), so every page costs
+    the same regardless of how deep into the catalog it is.
+
+    Query parameters:
+        category: Only products in this category.
+        stock: 'low' or 'out' to only return low-stock or out-of-stock products.
+        sort: 'name' (default), 'price', 'margin' or 'forecast'; prefix with '-' for descending.
+        page_size: Products per page (default 50, max 500).
+        cursor: The 'nextCursor' of the previous page.
+    Requires user to be logged in.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
+
+    sort = request.GET.get('sort', 'name')
+    descending = sort.startswith('-')
+    sort_field = PRODUCT_SORT_FIELDS.get(sort.lstrip('-'))
+    if sort_field is None:
+        return JsonResponse({'status': 'error', 'message': f'Invalid sort: {sort}.'}, status=400)
+
+    try:
+        page_size = min(int(request.GET.get('page_size', PRODUCT_PAGE_SIZE)), MAX_PRODUCT_PAGE_SIZE)
+        if page_size < 1:
+            raise ValueError('page_size must be positive')
+    except ValueError as ve:
+        return JsonResponse({'status': 'error', 'message': f'Invalid page_size: {str(ve)}'}, status=400)
+
+    products = Product.objects.select_related('sales_aggregate')
+    if 'category' in request.GET:
+        products = products.filter(category=request.GET['category'])
+    stock = request.GET.get('stock')
+    if stock == 'low':
+        products = products.low_stock()
+    elif stock == 'out':
+        products = products.out_of_stock()
+    elif stock is not None:
+        return JsonResponse({'status': 'error', 'message': "Invalid stock filter, expected 'low' or 'out'."}, status=400)
+
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            last_value, last_id = _decode_cursor(cursor, sort_field)
+        except (ValueError, TypeError, ArithmeticError, binascii.Error):
+            return JsonResponse({'status': 'error', 'message': 'Invalid cursor.'}, status=400)
+        after = 'lt' if descending else 'gt'
+        products = products.filter(
+            Q(**{f'{sort_field}__{after}': last_value}) | Q(**{sort_field: last_value, f'id__{after}': last_id})
+        )
+
+    prefix = '-' if descending else ''
+    page = list(products.order_by(f'{prefix}{sort_field}', f'{prefix}id')[:page_size + 1])
+    has_more = len(page) > page_size
+    page = page[:page_size]
+
+    results = []
+    for product in page:
+        product_data = _product_to_json(product)
+        product_data['isLowStock'] = product.is_low_stock
+        product_data['isOutOfStock'] = product.is_out_of_stock
+        # Precomputed rolling trend metrics (absent until the product has daily records)
+        aggregate = getattr(product, 'sales_aggregate', None)
+        product_data['historicalSalesData'] = aggregate.recent_sales if aggregate is not None else [0] * 7
+        if aggregate is not None:
+            product_data['salesLast28Days'] = aggregate.sales_28
+            product_data['salesLast90Days'] = aggregate.sales_90
+            product_data['inventoryTurnover28Days'] = aggregate.inventory_turnover(28)
+        results.append(product_data)
+
+    next_cursor = None
+    if has_more:
+        last = page[-1]
+        next_cursor = _encode_cursor(getattr(last, sort_field), last.id)
+    return JsonResponse({'status': 'success', 'results': results, 'nextCursor': next_cursor})
 
 
 @csrf_exempt
@@ -175,33 +419,24 @@ def api_update_product(request):
             if 'inventory' in data:
                 product.inventory = int(data['inventory'])
 
-            product.save()
-
             today = date.today()
             simulated_daily_sales = max(0, int(round(product.sales_last_7_days / 7 * random.uniform(0.8, 1.2))))
-            ProductDailyRecord.objects.update_or_create(
-                product=product,
-                date=today,
-                defaults={
-                    'sales_units': simulated_daily_sales,
-                    'inventory_level': product.inventory, # Update inventory level in daily record
-                    'price_at_day_end': product.current_price # Update price in daily record
-                }
-            )
-
-            updated_product_data = {
-                'id': product.id,
-                'name': product.name,
-                'category': product.category,
-                'currentPrice': float(product.current_price),
-                'suggestedPrice': float(product.suggested_price),
-                'inventory': product.inventory,
-                'demandForecast': product.demand_forecast,
-                'salesLast7Days': product.sales_last_7_days,
-                'margin': float(product.margin),
-                'competitorPrice': float(product.competitor_price),
-                'lastUpdated': product.last_updated.isoformat(),
-            }
+            with transaction.atomic():
+                product.save()
+                previous = read_window_records([(product.id, today)])
+                ProductDailyRecord.objects.update_or_create(
+                    product=product,
+                    date=today,
+                    defaults={
+                        'sales_units': simulated_daily_sales,
+                        'inventory_level': product.inventory, # Update inventory level in daily record
+                        'price_at_day_end': product.current_price # Update price in daily record
+                    }
+                )
+                apply_record_changes([(product.id, today, simulated_daily_sales, product.inventory)], previous)
+            invalidate_charts([product.id])
+
+            updated_product_data = _product_to_json(product)
             return JsonResponse({'status': 'success', 'message': f'Product {product_id} updated successfully.', 'product': updated_product_data})
         except Product.DoesNotExist:
             return JsonResponse({'status': 'error', 'message': 'Product not found.'}, status=404)
@@ -214,26 +449,114 @@ def api_update_product(request):
     return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
 
 
+# Content types read as newline-delimited JSON (one update per line)
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+def _read_update_items(request):
+    """
+    Reads the items of a bulk update body: a JSON array, or NDJSON parsed line
+    by line as it streams in. Raises ValueError for a malformed body.
+    """
+    if request.content_type in NDJSON_CONTENT_TYPES:
+        items = []
+        for line_number, line in enumerate(request, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError:
+                raise ValueError(f'Invalid JSON on line {line_number}.')
+            if len(items) > MAX_BULK_UPDATE_ITEMS:
+                break
+    else:
+        try:
+            items = json.load(request)
+        except json.JSONDecodeError:
+            raise ValueError('Invalid JSON in request body.')
+        if not isinstance(items, list):
+            raise ValueError('Expected a JSON array of updates.')
+    if len(items) > MAX_BULK_UPDATE_ITEMS:
+        raise ValueError(f'Too many updates in one request (at most {MAX_BULK_UPDATE_ITEMS}).')
+    return items
+
+@csrf_exempt
+@login_required
+def api_bulk_update_products(request):
+    """
+    API endpoint to update the price and/or inventory of many products at once.
+    The body is a JSON array of {"id", "currentPrice", "inventory"} items, or the
+    same items as NDJSON (Content-Type: application/x-ndjson).
+    Every item is validated first and all changes are applied in one transaction.
+    If any item is invalid nothing is written (400), unless ?partial=1 is given,
+    in which case the valid items are applied.
+    Returns one result per item, in request order.
+    Requires user to be logged in.
+    """
+    if request.method == 'POST':
+        try:
+            items = _read_update_items(request)
+            partial = request.GET.get('partial') in ('1', 'true')
+            results = apply_product_updates(items, date.today(), partial=partial)
+
+            updated_ids = [result['id'] for result in results if result['status'] == 'success']
+            if updated_ids:
+                invalidate_charts(updated_ids)
+            for result in results:
+                if 'product' in result:
+                    result['product'] = _product_to_json(result['product'])
+
+            failed = sum(1 for result in results if result['status'] == 'error')
+            ok = not failed or partial
+            return JsonResponse({
+                'status': 'success' if ok else 'error',
+                'message': f'{len(updated_ids)} products updated, {failed} invalid.',
+                'updated': len(updated_ids),
+                'failed': failed,
+                'results': results,
+            }, status=200 if ok else 400)
+        except ValueError as ve:
+            return JsonResponse({'status': 'error', 'message': str(ve)}, status=400)
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': f'An unexpected error occurred: {str(e)}'}, status=500)
+    return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
+
 @login_required
 @csrf_exempt
 def api_run_ml_predictions(request):
     """
     API endpoint to trigger the ML prediction management command.
+    Queues a background job and returns its id immediately (202); progress is
+    polled from /api/jobs/<id>/. A run that is already queued or running is
+    returned instead of starting a second one.
+    An optional JSON body of {"sinceLastRun": true} only re-predicts the
+    products that changed since the last successful run.
     Requires user to be logged in.
     """
     if request.method == 'POST':
         try:
-            out = StringIO()
-            call_command('run_ml_predictions', stdout=out)
-            command_output = out.getvalue()
-
-            return JsonResponse({'status': 'success', 'message': 'ML predictions triggered successfully.', 'output': command_output})
-        except CommandError as ce:
-            return JsonResponse({'status': 'error', 'message': f'Error running ML command: {ce}', 'output': str(ce)}, status=500)
+            data = json.loads(request.body) if request.body else {}
+            options = {'since_last_run': True} if data.get('sinceLastRun') else {}
+            job, created = enqueue_job('run_ml_predictions', options=options, user=request.user)
+            if created and settings.JOB_SPAWN_WORKER:
+                spawn_worker()
+            message = 'ML predictions queued.' if created else 'ML predictions are already queued or running.'
+            return JsonResponse({'status': 'success', 'message': message, 'job': job_to_json(job)}, status=202)
+        except json.JSONDecodeError:
+            return JsonResponse({'status': 'error', 'message': 'Invalid JSON in request body.'}, status=400)
         except Exception as e:
-            return JsonResponse({'status': 'error', 'message': f'An unexpected error occurred: {e}', 'output': str(e)}, status=500)
+            return JsonResponse({'status': 'error', 'message': f'An unexpected error occurred: {e}'}, status=500)
     return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
 
+@login_required
+def api_job_status(request, job_id):
+    """
+    API endpoint returning a background job's status and progress counters.
+    Requires user to be logged in.
+    """
+    job = get_object_or_404(PredictionJob, id=job_id)
+    return JsonResponse({'status': 'success', 'job': job_to_json(job)})
+
 @login_required
 @csrf_exempt
 def api_add_historical_record(request):
@@ -266,15 +589,19 @@ def api_add_historical_record(request):
             current_inventory_for_record = product.inventory
             current_price_for_record = product.current_price
 
-            daily_record, created = ProductDailyRecord.objects.update_or_create(
-                product=product,
-                date=record_date,
-                defaults={
-                    'sales_units': sales_units,
-                    'inventory_level': current_inventory_for_record, # Log current inventory with historical sales
-                    'price_at_day_end': current_price_for_record # Log current price with historical sales
-                }
-            )
+            with transaction.atomic():
+                previous = read_window_records([(product.id, record_date)])
+                daily_record, created = ProductDailyRecord.objects.update_or_create(
+                    product=product,
+                    date=record_date,
+                    defaults={
+                        'sales_units': sales_units,
+                        'inventory_level': current_inventory_for_record, # Log current inventory with historical sales
+                        'price_at_day_end': current_price_for_record # Log current price with historical sales
+                    }
+                )
+                apply_record_changes([(product.id, record_date, sales_units, current_inventory_for_record)], previous)
+            invalidate_charts([product.id])
             action = "created" if created else "updated"
             return JsonResponse({'status': 'success', 'message': f'Historical record for {product.name} on {record_date} {action} successfully.'})
 
@@ -287,3 +614,151 @@ def api_add_historical_record(request):
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': f'An unexpected error occurred: {str(e)}'}, status=500)
     return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
+
+
+@csrf_exempt
+@login_required
+def api_import_history(request):
+    """
+    API endpoint to bulk-load daily history from a CSV or Parquet file with
+    columns product_id, date, sales_units, inventory_level, price_at_day_end.
+    Accepts a multipart upload in the 'file' field, or a raw CSV body
+    (Content-Type: text/csv) that is read as it streams in. Parquet needs a
+    multipart upload with a .parquet name or ?format=parquet.
+    Rows are written with chunked bulk upserts; bad rows are skipped and
+    reported (the first 100 of them) without aborting the load.
+    Requires user to be logged in.
+    """
+    if request.method == 'POST':
+        try:
+            upload = request.FILES.get('file')
+            file_format = request.GET.get('format')
+            if upload is not None:
+                if file_format is None:
+                    file_format = 'parquet' if upload.name.lower().endswith(('.parquet', '.pq')) else 'csv'
+                rows = iter_parquet_rows(upload) if file_format == 'parquet' else iter_csv_rows(upload)
+            elif request.content_type == 'text/csv' and file_format in (None, 'csv'):
+                rows = iter_csv_rows(request)
+            else:
+                return JsonResponse({'status': 'error', 'message': "Upload a file in the 'file' field or send a text/csv body."}, status=400)
+
+            stats = import_history(rows)
+            if stats['product_ids']:
+                invalidate_charts(stats['product_ids'])
+            return JsonResponse({
+                'status': 'success',
+                'message': f'Imported {stats["records_written"]} daily records, rejected {stats["rows_rejected"]} rows.',
+                'rowsRead': stats['rows_read'],
+                'recordsWritten': stats['records_written'],
+                'rowsRejected': stats['rows_rejected'],
+                'productsUpdated': len(stats['product_ids']),
+                'errors': stats['errors'],
+                'elapsedSeconds': round(stats['elapsed'], 3),
+            })
+        except (ImportError, ValueError) as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': f'An unexpected error occurred: {str(e)}'}, status=500)
+    return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
+
+
+# Export formats: content type, file extension and encoder
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv', csv_chunks),
+    'ndjson': ('application/x-ndjson', 'ndjson', ndjson_chunks),
+}
+
+def _export_response(request, name, fields, rows):
+    """
+    Streams `rows` in the requested format (?format=csv|ndjson), gzip-compressed
+    with ?gzip=1. Nothing is generated until the response is sent.
+    """
+    content_type, extension, encoder = EXPORT_FORMATS[request.GET.get('format', 'csv')]
+    chunks = encoder(fields, rows)
+    filename = f'{name}.{extension}'
+    if request.GET.get('gzip') in ('1', 'true'):
+        chunks = gzip_chunks(chunks)
+        content_type = 'application/gzip'
+        filename += '.gz'
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    patch_cache_control(response, private=True, no_store=True)
+    return response
+
+def _export_error(request):
+    """Validates the parameters shared by the export endpoints; returns an error response or None."""
+    if request.method != 'GET':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
+    if request.GET.get('format', 'csv') not in EXPORT_FORMATS:
+        return JsonResponse({'status': 'error', 'message': "Invalid format, expected 'csv' or 'ndjson'."}, status=400)
+    return None
+
+@login_required
+def api_export_history(request):
+    """
+    API endpoint streaming daily history as a CSV or NDJSON download, ordered
+    by product and date, with the columns accepted by /api/import/history/.
+
+    Query parameters:
+        start, end: Date range (YYYY-MM-DD, both inclusive).
+        category: Only products in this category.
+        product_id: Only this product.
+        format: 'csv' (default) or 'ndjson'.
+        gzip: '1' to gzip the download.
+    Requires user to be logged in.
+    """
+    error = _export_error(request)
+    if error is not None:
+        return error
+    try:
+        start = date.fromisoformat(request.GET['start']) if 'start' in request.GET else None
+        end = date.fromisoformat(request.GET['end']) if 'end' in request.GET else None
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid date, expected YYYY-MM-DD.'}, status=400)
+
+    rows = iter_history_rows(
+        start=start, end=end,
+        category=request.GET.get('category'),
+        product_id=request.GET.get('product_id'),
+    )
+    return _export_response(request, 'history', HISTORY_EXPORT_FIELDS, rows)
+
+@login_required
+def api_export_products(request):
+    """
+    API endpoint streaming every product with its latest demand forecast and
+    suggested price as a CSV or NDJSON download, ordered by id.
+
+    Query parameters:
+        category: Only products in this category.
+        format: 'csv' (default) or 'ndjson'.
+        gzip: '1' to gzip the download.
+    Requires user to be logged in.
+    """
+    error = _export_error(request)
+    if error is not None:
+        return error
+    rows = iter_product_rows(category=request.GET.get('category'))
+    return _export_response(request, 'products', PRODUCT_EXPORT_FIELDS, rows)
+
+
+def _metrics_allowed(request):
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+
+def api_metrics(request):
+    """
+    API endpoint exposing this process's request, query and chart metrics,
+    plus the stage timings of the last prediction run, in Prometheus text
+    format. Open to staff users and to requests carrying
+    "Authorization: Bearer <settings.METRICS_TOKEN>".
+    """
+    if not _metrics_allowed(request):
+        return HttpResponse(status=403, content='Forbidden.')
+    return HttpResponse(
+        registry.render(prediction_run_gauges()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -48,6 +49,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Per-view request metrics and ?profile=1 for staff (needs request.user)
+    'dashboard_app.middleware.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'myproject.urls'
@@ -72,15 +75,86 @@ WSGI_APPLICATION = 'myproject.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# SQLite is tuned so the dashboard keeps serving while run_ml_predictions writes:
+# the pragmas run on every new connection (init_command). In WAL mode readers
+# never wait for the writer; writers wait up to busy_timeout for each other
+# instead of failing with "database is locked". IMMEDIATE transactions take the
+# write lock when they begin, where SQLite can still wait for it, rather than
+# at their first write. `manage.py stress_sqlite` measures the effect.
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL', # Durable in WAL mode except for the last commits before a power loss
+    'busy_timeout': 20000, # milliseconds
+    'mmap_size': 256 * 1024 * 1024, # bytes
+    'cache_size': -64 * 1024, # negative: KiB (64 MiB per connection)
+}
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # Reuse connections across requests (seconds); a broken one is replaced before use
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
 
+# Prediction writes (see dashboard_app/bulk_ops.py persist_predictions)
+# Each chunk is one transaction, which on SQLite blocks every other writer
+# (API updates) until it commits. On SQLite the writer also pauses between
+# chunks, long enough for a waiting writer's next lock retry to get in.
+
+PREDICTION_WRITE_CHUNK_SIZE = 250 # products
+PREDICTION_WRITE_PAUSE = 0.1 # seconds
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# The 'charts' cache holds rendered chart images. It is file based so the
+# prediction command and every server process share (and invalidate) it.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'charts': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'dynamic_pricing_chart_cache'),
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+
+# Chart rendering pool (see dashboard_app/chart_renderer.py)
+# 'thread' or 'process'; renders beyond WORKERS + QUEUE_SIZE are rejected with a 503.
+
+CHART_RENDER_EXECUTOR = 'thread'
+CHART_RENDER_WORKERS = 4
+CHART_RENDER_QUEUE_SIZE = 16
+CHART_RENDER_TIMEOUT = 10 # seconds
+
+
+# Metrics (see dashboard_app/metrics.py)
+# /api/metrics/ is open to staff users, and to scrapers sending "Authorization: Bearer <METRICS_TOKEN>".
+
+METRICS_TOKEN = None
+
+
+# Background jobs (see dashboard_app/jobs.py)
+# With JOB_SPAWN_WORKER, each new job starts a `run_job_worker --once` process;
+# disable it when a long-lived `manage.py run_job_worker` is deployed instead.
+
+JOB_SPAWN_WORKER = True
+JOB_STALE_AFTER_SECONDS = 60 * 60 # Active jobs without a heartbeat for this long are failed
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 